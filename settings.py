@@ -48,14 +48,30 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.BasicAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'shofy_api.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shofy_api.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Default and max "limit" of cursor paginated list endpoints
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
 MIDDLEWARE = [
+    'shofy_api.metrics.MetricsMiddleware',
+    'shofy_api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shofy_api.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,9 +104,94 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of opening one per request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Write transactions take the write lock at BEGIN and wait busy_timeout for it. A
+            # deferred transaction that read first fails right away with "database is locked"
+            # when another writer committed since its read (e.g. concurrent checkouts).
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            # On disk instead of in-memory shared cache, so concurrency tests get real SQLite locking
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Applied to every new SQLite connection (see shofy_api.sqlite)
+SQLITE_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    'journal_mode': 'WAL',
+    # Safe with WAL, fsync only at checkpoints instead of every commit
+    'synchronous': 'NORMAL',
+    # Wait up to 5s for a lock instead of failing with "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative value is in KiB, 64 MiB page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'entities': {
+        'BACKEND': 'shofy_api.cache.LRUCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Compressed bodies of versioned responses, see shofy_api.compression
+    'compressed': {
+        'BACKEND': 'shofy_api.cache.LRUCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
+}
+
+# Access to the Prometheus "/metrics" endpoint, it exposes per route traffic and latency: allowed
+# from these client addresses (REMOTE_ADDR) or with "Authorization: Bearer <API_METRICS_TOKEN>"
+API_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+API_METRICS_TOKEN = None
+
+# Cache alias used by the read-through cache of single product, user and store lookups
+API_ENTITY_CACHE = 'entities'
+
+# Token bucket rate limits per client and route (see shofy_api.throttling):
+# "METHOD /route", "/route" or "*" for any other route: (requests per second, burst)
+API_THROTTLE_RATES = {
+    '*': (100, 200),
+}
+# "memory": buckets per process, "cache": shared by all processes through API_THROTTLE_CACHE
+API_THROTTLE_BACKEND = 'memory'
+API_THROTTLE_CACHE = 'default'
+# Proxies in front of the app appending to X-Forwarded-For, 0 to limit by REMOTE_ADDR
+API_THROTTLE_NUM_PROXIES = 0
+
+# Response compression (see shofy_api.compression): encodings in server preference order, "br"
+# and "zstd" are used when the brotli / zstandard packages are installed
+API_COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+# Smaller bodies are sent uncompressed
+API_COMPRESSION_MIN_SIZE = 1024
+# Only these content types are compressed, responses carrying the CSRF token never are (BREACH)
+API_COMPRESSION_CONTENT_TYPES = ['application/json']
+# Cache alias for compressed bodies of responses with an ETag, None to compress every time
+API_COMPRESSION_CACHE = 'compressed'
+
+# Seconds a POST response is replayed to retries with the same Idempotency-Key (see
+# shofy_api.idempotency), run "manage.py purge_idempotency_keys" periodically to delete older ones
+API_IDEMPOTENCY_TTL = 24 * 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(using, **kwargs):
+    from django.db import connections
+    from shofy_api import search
+
+    # SQLite drops the search index triggers whenever a migration remakes the product table
+    search.install(connections[using])
 
 
 class ShofyApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shofy_api'
+
+    def ready(self):
+        from shofy_api.metrics import install_query_recorder
+        from shofy_api.sqlite import configure_connection
+
+        post_migrate.connect(install_search_index, sender=self)
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_recorder)
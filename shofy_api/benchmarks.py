@@ -0,0 +1,26 @@
+"""
+Timing helpers shared by the bench_* management commands
+"""
+
+import time
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+def best_of(repeat, function):
+    """
+    :return: shortest run time of function in seconds and its result
+    """
+
+    best, result = None, None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
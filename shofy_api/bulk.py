@@ -0,0 +1,191 @@
+"""
+Batch product writes
+
+All items are validated in one pass (one query for stores, one for updated products) before
+anything is written, then every write goes through bulk_create / bulk_update / a single DELETE.
+Updated and deleted products are read in the same transaction as the writes (locked with
+SELECT ... FOR UPDATE, SQLite serializes the transactions instead), so the store stats changes
+computed from them can't be based on rows a concurrent request changed in the meantime.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from shofy_api.extensions import merge_serializer_errors
+from shofy_api.models import Product, Store
+from shofy_api.serializers import ProductWriteSerializer
+from shofy_api.stats import StoreStatsChanges
+
+
+class BulkResult:
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        self.errors = []
+
+    def add_error(self, operation, index, errors):
+        self.errors.append({
+            "operation": operation,
+            "index": index,
+            "errors": errors
+        })
+
+
+def is_id(value):
+    """
+    Primary keys in the body must be JSON integers, anything else can't be looked up
+    """
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_items(items, operation, result, partial=False):
+    """
+    Validate product fields of every item with one serializer, like CatalogImporter.validate
+    :return: list of (index, item, validated data) of valid items
+    """
+
+    serializer = ProductWriteSerializer(partial=partial)
+    valid = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            result.add_error(operation, index, ["Item must be an object"])
+            continue
+
+        try:
+            valid.append((index, item, serializer.run_validation(item)))
+        except ValidationError as e:
+            result.add_error(operation, index, merge_serializer_errors(e.detail))
+
+    return valid
+
+
+def prepare_create(items, result):
+    valid = []
+
+    for index, item, data in validate_items(items, "create", result):
+        if not is_id(item.get("store_id")):
+            result.add_error("create", index, ["store_id: A valid integer is required"])
+            continue
+
+        valid.append((index, item, data))
+
+    store_ids = {item["store_id"] for _, item, _ in valid}
+    existing_store_ids = set(Store.objects.filter(pk__in=store_ids).values_list("pk", flat=True))
+
+    products = []
+
+    for index, item, data in valid:
+        if item["store_id"] not in existing_store_ids:
+            result.add_error("create", index, [f"store_id: Store with id {item.get('store_id')} not found"])
+            continue
+
+        products.append(Product(store_id=item["store_id"], **data))
+
+    return products
+
+
+def prepare_update(items, result, changes):
+    valid = validate_items(items, "update", result, partial=True)
+    products = Product.objects.select_for_update().in_bulk(
+        [item.get("id") for _, item, _ in valid if is_id(item.get("id"))]
+    )
+
+    now = timezone.now()
+    fields = set()
+    updated = []
+
+    for index, item, data in valid:
+        if not is_id(item.get("id")):
+            result.add_error("update", index, ["id: A valid integer is required"])
+            continue
+
+        product = products.get(item["id"])
+
+        if product is None:
+            result.add_error("update", index, [f"id: Product with id {item.get('id')} not found"])
+            continue
+
+        changes.remove(product.store_id, product.quantity, product.price)
+
+        for field, value in data.items():
+            setattr(product, field, value)
+
+        # bulk_update does not apply auto_now
+        product.updated_at = now
+        changes.add(product.store_id, product.quantity, product.price)
+        fields.update(data)
+        updated.append(product)
+
+    return updated, sorted(fields) + ["updated_at"]
+
+
+def prepare_delete(ids, result, changes, updated_ids=()):
+    """
+    :param updated_ids: ids updated by the same request, deleting them too is an error, the stats
+        change of the update would be counted on top of the delete
+    """
+
+    updated_ids = set(updated_ids)
+    valid_ids = [pk for pk in ids if is_id(pk) and pk not in updated_ids]
+    existing = (
+        Product.objects
+        .select_for_update()
+        .filter(pk__in=valid_ids)
+        .values_list("pk", "store_id", "quantity", "price")
+    )
+    existing_ids = set()
+
+    for pk, store_id, quantity, price in existing:
+        existing_ids.add(pk)
+        changes.remove(store_id, quantity, price)
+
+    for index, pk in enumerate(ids):
+        if not is_id(pk):
+            result.add_error("delete", index, ["id: A valid integer is required"])
+        elif pk in updated_ids:
+            result.add_error("delete", index, [f"id: Product with id {pk} is also updated"])
+        elif pk not in existing_ids:
+            result.add_error("delete", index, [f"id: Product with id {pk} not found"])
+
+    return sorted(existing_ids)
+
+
+def bulk_write_products(create=(), update=(), delete=()):
+    """
+    Create, update (partial) and delete products in one transaction.
+    Nothing is written if any item is invalid, check result.errors.
+    """
+
+    result = BulkResult()
+    changes = StoreStatsChanges()
+
+    with transaction.atomic():
+        products_to_create = prepare_create(create, result)
+        products_to_update, update_fields = prepare_update(update, result, changes)
+        ids_to_delete = prepare_delete(delete, result, changes, [product.pk for product in products_to_update])
+
+        if result.errors:
+            return result
+
+        if products_to_create:
+            result.created = Product.objects.bulk_create(products_to_create)
+
+            for product in result.created:
+                changes.add(product.store_id, product.quantity, product.price)
+
+        if products_to_update:
+            Product.objects.bulk_update(products_to_update, update_fields)
+            result.updated = [product.pk for product in products_to_update]
+
+        if ids_to_delete:
+            Product.objects.filter(pk__in=ids_to_delete).delete()
+            result.deleted = ids_to_delete
+
+        changes.save()
+
+    return result
@@ -0,0 +1,262 @@
+"""
+Read-through cache of serialized entities (product, user, store)
+
+Entities are cached as (serialized response data, updated_at), so a hit skips both the database
+and the serializer, and conditional requests can be answered from the cached version. Values are
+kept in the cache configured by API_ENTITY_CACHE (a Django cache alias), by default that is the
+in-process LRUCache below, any Django cache backend works too.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+
+
+class LRUCache(BaseCache):
+    """
+    In-process cache backend with LRU eviction and TTL
+
+    Unlike LocMemCache, values are stored as is (not pickled) and every insert past MAX_ENTRIES
+    evicts only the least recently used entry. Values returned from get() are shared, callers
+    must not mutate them.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def _get_live(self, key):
+        entry = self._cache.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+
+        if expires_at is not None and expires_at <= time.time():
+            del self._cache[key]
+            return None
+
+        return entry
+
+    def _set(self, key, value, timeout):
+        self._cache[key] = (self.get_backend_timeout(timeout), value)
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._get_live(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._get_live(key)
+            if entry is None:
+                return default
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._get_live(key)
+            if entry is None:
+                return False
+            self._cache[key] = (self.get_backend_timeout(timeout), entry[1])
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            return self._cache.pop(key, None) is not None
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            return self._get_live(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    # Nothing here blocks, skip the thread hop of the default sync_to_async implementations
+
+    async def aget(self, key, default=None, version=None):
+        return self.get(key, default, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set(key, value, timeout, version)
+
+
+class EntityCache:
+    """
+    Read-through cache of one entity type, keyed by primary key
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, "API_ENTITY_CACHE", "default")]
+
+    def key(self, pk):
+        return f"{self.name}:{pk}"
+
+    def get_or_load(self, pk, loader):
+        """
+        Get cached (data, updated_at) of entity, on miss call loader and cache its result.
+        Exceptions raised by loader (e.g. DoesNotExist) are not cached and propagate to the caller.
+        """
+
+        data = self.backend.get(self.key(pk))
+
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        with self._lock:
+            self.misses += 1
+
+        data = loader()
+        self.backend.set(self.key(pk), data)
+
+        return data
+
+    async def aget_or_load(self, pk, loader):
+        """
+        Async version of get_or_load, loader is a coroutine function
+        """
+
+        data = await self.backend.aget(self.key(pk))
+
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        with self._lock:
+            self.misses += 1
+
+        data = await loader()
+        await self.backend.aset(self.key(pk), data)
+
+        return data
+
+    def peek_or_load(self, pk, loader):
+        """
+        Get cached (data, updated_at) of entity, on miss return what loader returns without caching
+        it. For partial reads (e.g. "?fields=") that must not replace the whole cached entity.
+        """
+
+        entry = self.backend.get(self.key(pk))
+
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            self.misses += 1
+
+        return loader()
+
+    async def apeek_or_load(self, pk, loader):
+        """
+        Async version of peek_or_load, loader is a coroutine function
+        """
+
+        entry = await self.backend.aget(self.key(pk))
+
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            self.misses += 1
+
+        return await loader()
+
+    def get_version(self, pk, loader):
+        """
+        Get updated_at of entity from cache, on miss call loader which should only read the
+        version column, the entity is not cached in that case.
+        """
+
+        entry = self.backend.get(self.key(pk))
+
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+
+        return loader()
+
+    async def aget_version(self, pk, loader):
+        """
+        Async version of get_version, loader is a coroutine function
+        """
+
+        entry = await self.backend.aget(self.key(pk))
+
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+
+        return await loader()
+
+    def invalidate(self, *pks):
+        """
+        Drop cached entities now and again when the current transaction commits: until then
+        concurrent readers still see the old rows and can cache them again
+        """
+
+        keys = [self.key(pk) for pk in pks]
+
+        self.backend.delete_many(keys)
+        transaction.on_commit(lambda: self.backend.delete_many(keys))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+product_cache = EntityCache("product")
+user_cache = EntityCache("user")
+store_cache = EntityCache("store")
+
+
+def cache_stats():
+    return {cache.name: cache.stats() for cache in (product_cache, user_cache, store_cache)}
@@ -0,0 +1,424 @@
+"""
+Catalog files: users, stores and products as CSV or JSONL, one row per line, imported with
+CatalogImporter and exported (also cart items, optionally as Parquet) with export_rows
+
+Columns (CSV header or JSONL object keys):
+    users: id, name, username, email
+    stores: user_id, name, location
+    products: store_id, name, description, price, quantity
+
+"id" of users is the id of the file, it is not stored: the rows get new primary keys. Stores
+refer to users and products to stores by those file ids, a reference the imported files don't
+have is looked up as a primary key of the database, so products can be added to existing stores.
+Users with a username or email that is already taken are skipped.
+
+Files are read row by row and imported in batches, every batch is validated, its references
+resolved with a query per batch and inserted with bulk_create in its own transaction. Memory
+holds one batch and the file id: primary key maps of users and stores, it does not grow with the
+product count. An invalid row is skipped and reported, the other rows of its batch are imported.
+
+Exports read a table in primary key order with a chunked iterator and write every chunk before
+reading the next one, exported files have the import columns plus ids and timestamps, so they
+can be imported again.
+"""
+
+import csv
+import io
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.db import reset_queries, transaction
+from rest_framework.exceptions import ValidationError
+
+from shofy_api import fastjson
+from shofy_api.extensions import merge_serializer_errors
+from shofy_api.models import CartItem, Product, Store, User
+from shofy_api.serializers import ProductWriteSerializer, StoreWriteSerializer, UserWriteSerializer
+from shofy_api.stats import StoreStatsChanges
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+# Invalid rows kept for the report, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(path):
+    for extension, file_format in FORMATS.items():
+        if str(path).lower().endswith(extension):
+            return file_format
+
+    raise ValueError(f"Unknown format of \"{path}\", use one of: {', '.join(FORMATS)}")
+
+
+def read_rows(file, file_format):
+    """
+    Read rows of a binary file one by one
+    :return: iterator of (line number, row), row is None if the line is not valid JSON
+    """
+
+    if file_format == "csv":
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+
+        for row in reader:
+            yield reader.line_num, row
+
+        return
+
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, fastjson.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def batches(rows, size):
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def to_key(value):
+    """
+    File id as a dict key, CSV ids are strings and JSONL ids are usually numbers
+    """
+
+    return None if value is None else str(value).strip()
+
+
+def to_pk(key):
+    return int(key) if key and key.isdigit() else None
+
+
+class CatalogImporter:
+
+    def __init__(self, batch_size=2000, progress=None):
+        """
+        :param progress: called with (kind, rows read, rows imported, seconds) after every batch
+        """
+
+        self.batch_size = batch_size
+        self.progress = progress
+        # File id: primary key
+        self.user_ids = {}
+        self.store_ids = {}
+        self.imported = Counter()
+        self.skipped = Counter()
+        # (kind, line number, errors) of the first MAX_REPORTED_ERRORS invalid rows
+        self.errors = []
+
+    def add_error(self, kind, line, errors):
+        self.skipped[kind] += 1
+
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((kind, line, errors))
+
+    def validate(self, kind, serializer_class, batch):
+        """
+        Validate rows of batch with one serializer, building the serializer fields takes longer
+        than validating a row
+        :return: list of (line number, row, validated data) of valid rows
+        """
+
+        serializer = serializer_class()
+        valid = []
+
+        for line, row in batch:
+            if row is None:
+                self.add_error(kind, line, ["Invalid JSON"])
+                continue
+
+            if not isinstance(row, dict):
+                self.add_error(kind, line, ["Row must be an object"])
+                continue
+
+            try:
+                valid.append((line, row, serializer.run_validation(row)))
+            except ValidationError as e:
+                self.add_error(kind, line, merge_serializer_errors(e.detail))
+
+        return valid
+
+    def run(self, kind, rows, import_batch):
+        start = time.perf_counter()
+        read = 0
+
+        for batch in batches(rows, self.batch_size):
+            read += len(batch)
+
+            with transaction.atomic():
+                self.imported[kind] += import_batch(batch)
+
+            # With DEBUG every query is logged, up to thousands of batch INSERT statements
+            reset_queries()
+
+            if self.progress is not None:
+                self.progress(kind, read, self.imported[kind], time.perf_counter() - start)
+
+    def import_users(self, rows):
+        self.run("users", rows, self.import_user_batch)
+
+    def import_stores(self, rows):
+        self.run("stores", rows, self.import_store_batch)
+
+    def import_products(self, rows):
+        self.run("products", rows, self.import_product_batch)
+
+    def import_user_batch(self, batch):
+        valid = self.validate("users", UserWriteSerializer, batch)
+        # Usernames and emails are unique, taken by existing users or earlier rows of the batch
+        taken = {
+            field: set(User.objects.filter(**{f"{field}__in": [data[field] for _, _, data in valid]})
+                       .values_list(field, flat=True))
+            for field in ("username", "email")
+        }
+        keys = []
+        users = []
+
+        for line, row, data in valid:
+            duplicates = [
+                f"{field}: User with {field} {data[field]} already exists"
+                for field in ("username", "email")
+                if data[field] in taken[field]
+            ]
+
+            if duplicates:
+                self.add_error("users", line, duplicates)
+                continue
+
+            key = to_key(row.get("id"))
+
+            if key is not None:
+                if key in self.user_ids:
+                    self.add_error("users", line, [f"id: Duplicate id {key}"])
+                    continue
+
+                # Reserved now, so a duplicate later in the batch is caught
+                self.user_ids[key] = None
+
+            taken["username"].add(data["username"])
+            taken["email"].add(data["email"])
+            keys.append(key)
+            users.append(User(**data))
+
+        User.objects.bulk_create(users)
+
+        for key, user in zip(keys, users):
+            if key is not None:
+                self.user_ids[key] = user.pk
+
+        return len(users)
+
+    def resolve(self, keys, ids, queryset):
+        """
+        Primary keys of file ids, from the ids imported so far or else from queryset. Ids of the
+        imported users are never looked up in the database, they are not primary keys.
+
+        :return: {file id: primary key} of the keys that exist
+        """
+
+        resolved = {key: ids[key] for key in keys if ids.get(key) is not None}
+        missing = {
+            to_pk(key): key
+            for key in keys
+            if key not in ids and key not in self.user_ids and to_pk(key) is not None
+        }
+
+        if missing:
+            for pk in queryset.filter(pk__in=missing).values_list("pk", flat=True):
+                resolved[missing[pk]] = pk
+
+        return resolved
+
+    def import_store_batch(self, batch):
+        valid = [
+            (line, to_key(row.get("user_id")), data)
+            for line, row, data in self.validate("stores", StoreWriteSerializer, batch)
+        ]
+
+        user_ids = self.resolve({key for _, key, _ in valid}, self.user_ids, User.objects.all())
+        # A user has at most one store, the store primary key is the user id
+        taken = set(Store.objects.filter(pk__in=user_ids.values()).values_list("pk", flat=True))
+        stores = []
+
+        for line, key, data in valid:
+            user_id = user_ids.get(key)
+
+            if user_id is None:
+                self.add_error("stores", line, [f"user_id: User with id {key} not found"])
+                continue
+
+            if user_id in taken:
+                self.add_error("stores", line, [f"user_id: User with id {key} already has a store"])
+                continue
+
+            taken.add(user_id)
+            self.store_ids[key] = user_id
+            stores.append(Store(user_id=user_id, **data))
+
+        Store.objects.bulk_create(stores)
+
+        return len(stores)
+
+    def import_product_batch(self, batch):
+        valid = [
+            (line, to_key(row.get("store_id")), data)
+            for line, row, data in self.validate("products", ProductWriteSerializer, batch)
+        ]
+
+        store_ids = self.resolve({key for _, key, _ in valid}, self.store_ids, Store.objects.all())
+        products = []
+        changes = StoreStatsChanges()
+
+        for line, key, data in valid:
+            store_id = store_ids.get(key)
+
+            if store_id is None:
+                self.add_error("products", line, [f"store_id: Store with id {key} not found"])
+                continue
+
+            products.append(Product(store_id=store_id, **data))
+            changes.add(store_id, data["quantity"], data["price"])
+
+        Product.objects.bulk_create(products)
+        changes.save()
+
+        return len(products)
+
+
+# Exported tables: model and columns, rows updated since a watermark are found by "updated_at"
+EXPORTS = {
+    "users": (User, ["id", "name", "username", "email", "updated_at"]),
+    "stores": (Store, ["user_id", "name", "location", "updated_at"]),
+    "products": (Product, ["id", "store_id", "name", "description", "price", "quantity", "updated_at"]),
+    "cart_items": (CartItem, ["id", "user_id", "product_id", "quantity"]),
+}
+
+
+class JSONLWriter:
+    extension = ".jsonl"
+
+    def __init__(self, file, model, columns):
+        self.file = file
+        self.columns = columns
+
+    def write(self, rows):
+        self.file.write(b"".join(fastjson.dumps(dict(zip(self.columns, row))) + b"\n" for row in rows))
+
+    def close(self):
+        pass
+
+
+class CSVWriter:
+    extension = ".csv"
+
+    def __init__(self, file, model, columns):
+        self.text = io.TextIOWrapper(file, encoding="utf-8", newline="", write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+
+    def close(self):
+        # Leave the file open for the caller
+        self.text.detach()
+
+
+class ParquetWriter:
+    """
+    Columnar Parquet file, every chunk is a row group. Needs pyarrow.
+    """
+
+    extension = ".parquet"
+
+    def __init__(self, file, model, columns):
+        self.schema = pyarrow.schema([
+            (column, self.column_type(model._meta.get_field(column)))
+            for column in columns
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(file, self.schema)
+
+    @staticmethod
+    def column_type(field):
+        if field.is_relation:
+            field = field.target_field
+
+        internal_type = field.get_internal_type()
+
+        if internal_type == "DecimalField":
+            return pyarrow.decimal128(field.max_digits, field.decimal_places)
+
+        if internal_type == "DateTimeField":
+            return pyarrow.timestamp("us", tz="UTC")
+
+        if internal_type in ("CharField", "TextField"):
+            return pyarrow.string()
+
+        return pyarrow.int64()
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORT_FORMATS = {
+    "jsonl": JSONLWriter,
+    "csv": CSVWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def export_rows(kind, writer_class, file, since=None, chunk_size=2000):
+    """
+    Write rows of table kind (see EXPORTS) to binary file
+    :param since: only rows updated at or after it, tables without "updated_at" are exported whole
+    :return: number of rows written
+    """
+
+    model, columns = EXPORTS[kind]
+    queryset = model.objects.order_by("pk")
+
+    if since is not None and "updated_at" in columns:
+        queryset = queryset.filter(updated_at__gte=since)
+
+    writer = writer_class(file, model, columns)
+    count = 0
+
+    for chunk in batches(queryset.values_list(*columns).iterator(chunk_size=chunk_size), chunk_size):
+        writer.write(chunk)
+        count += len(chunk)
+
+    writer.close()
+
+    return count
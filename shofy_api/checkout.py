@@ -0,0 +1,107 @@
+"""
+Checkout, turn the cart of a user into stock decrements
+
+Stock of every cart line is taken with a conditional UPDATE
+("SET quantity = quantity - n WHERE id = ... AND quantity >= n"), the check and the decrement are
+one statement, so concurrent checkouts can't both take the last units. Lines are processed in
+product id order, the row locks those updates take are always acquired in the same order and
+concurrent checkouts of the same products can't deadlock. If any line is short, the whole
+transaction is rolled back and every short line is reported.
+
+SQLite has no row locks, it serializes the transactions instead (transaction_mode IMMEDIATE in
+settings.DATABASES), so the lines read at the start can't change before they are updated.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shofy_api.models import CartItem, Product
+from shofy_api.stats import StoreStatsChanges
+
+
+class CheckoutResult:
+
+    def __init__(self):
+        self.items = []
+        self.shortages = []
+
+    def add_shortage(self, item, available):
+        self.shortages.append({
+            "product_id": item["product_id"],
+            "requested": item["quantity"],
+            "available": available
+        })
+
+    def summary(self):
+        """
+        Bought items and totals, prices as strings like the cart summary
+        """
+
+        items = []
+        total_price = Decimal(0)
+
+        for item in self.items:
+            line_price = item["product__price"] * item["quantity"]
+            total_price += line_price
+            items.append({
+                "product_id": item["product_id"],
+                "quantity": item["quantity"],
+                "price": str(item["product__price"]),
+                "total_price": str(line_price)
+            })
+
+        return {
+            "items": items,
+            "total_quantity": sum(item["quantity"] for item in self.items),
+            "total_price": str(total_price)
+        }
+
+
+def checkout(user_id):
+    """
+    Take stock for every cart item of user and empty the cart, all or nothing
+
+    :return: CheckoutResult, nothing was written if it has shortages
+    """
+
+    result = CheckoutResult()
+
+    with transaction.atomic():
+        items = list(
+            CartItem.objects
+            .filter(user_id=user_id)
+            .order_by("product_id")
+            .values("id", "product_id", "quantity", "product__price", "product__store_id")
+        )
+        now = timezone.now()
+
+        for item in items:
+            taken = Product.objects.filter(pk=item["product_id"], quantity__gte=item["quantity"]).update(
+                quantity=F("quantity") - item["quantity"],
+                # update() skips auto_now, bump the version for ETags and the entity cache
+                updated_at=now
+            )
+
+            if taken:
+                result.items.append(item)
+            else:
+                available = Product.objects.values_list("quantity", flat=True).get(pk=item["product_id"])
+                result.add_shortage(item, available)
+
+        if result.shortages:
+            transaction.set_rollback(True)
+        else:
+            CartItem.objects.filter(pk__in=[item["id"] for item in items]).delete()
+
+            changes = StoreStatsChanges()
+
+            for item in result.items:
+                # Sold units leave the stock, the products stay
+                changes.remove(item["product__store_id"], item["quantity"], item["product__price"], count=0)
+
+            changes.save()
+
+    return result
@@ -1,19 +1,142 @@
+import hashlib
+import json
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.response import Response
 from rest_framework.utils.serializer_helpers import ReturnDict
 
+from shofy_api import fastjson
+
+
+def build_response(data, message, status, etag=None, last_modified=None, **extra):
+    """
+    Build response envelope, extra keyword arguments (e.g. "next" cursor) are added to the envelope
+
+    :param etag: ETag header value, see make_etag
+    :param last_modified: datetime for Last-Modified header
+    """
 
-def build_response(data, message, status):
     response = {
         "message": message,
         "status": status,
-        "data": data
+        "data": data,
+        **extra
     }
 
-    return Response(
+    response = Response(
         data=response,
         status=status
     )
 
+    return set_version_headers(response, etag, last_modified)
+
+
+def set_version_headers(response, etag=None, last_modified=None):
+    if etag is not None:
+        response["ETag"] = etag
+
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+
+    return response
+
+
+def build_json_response(data, message, status, etag=None, last_modified=None, **extra):
+    """
+    Same envelope and JSON as build_response, for plain Django views (e.g. async views) outside DRF
+    """
+
+    response = {
+        "message": message,
+        "status": status,
+        "data": data,
+        **extra
+    }
+
+    response = HttpResponse(
+        fastjson.dumps(response),
+        status=status,
+        content_type="application/json"
+    )
+
+    return set_version_headers(response, etag, last_modified)
+
+
+def is_streaming(request):
+    return request.GET.get("stream") in ("1", "true")
+
+
+def build_streaming_response(queryset, row_serializer, message, chunk_size=2000):
+    """
+    Stream the whole queryset as the usual response envelope, rows are read with
+    .values().iterator() and serialized chunk by chunk so memory does not grow with the table.
+
+    "data" is written before "message", so message(count) can use the number of streamed rows.
+    """
+
+    def stream():
+        count = 0
+        chunk = []
+
+        yield "{\"data\": ["
+
+        for row in row_serializer.values(queryset).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+
+            if len(chunk) == chunk_size:
+                yield (b"," if count else b"") + _encode_rows(row_serializer, chunk)
+                count += len(chunk)
+                chunk = []
+
+        if chunk:
+            yield (b"," if count else b"") + _encode_rows(row_serializer, chunk)
+            count += len(chunk)
+
+        yield f"], \"message\": {json.dumps(message(count))}, \"status\": 200}}"
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
+
+
+def _encode_rows(row_serializer, rows):
+    # Encode the chunk as one array and drop the brackets
+    return fastjson.dumps(row_serializer.serialize(rows))[1:-1]
+
+
+def make_etag(*version):
+    """
+    Strong ETag from the version of the response data, e.g. ("product", id, updated_at).
+    Same version always serializes to the same bytes, so the data itself is not hashed.
+    """
+
+    digest = hashlib.blake2b(repr(version).encode(), digest_size=12).hexdigest()
+
+    return f"\"{digest}\""
+
+
+def is_conditional(request):
+    return "HTTP_IF_NONE_MATCH" in request.META or "HTTP_IF_MODIFIED_SINCE" in request.META
+
+
+def not_modified(request, etag, last_modified=None, response_class=Response):
+    """
+    Evaluate If-None-Match / If-Modified-Since of request
+    :param response_class: HttpResponse for plain Django views outside DRF
+    :return: 304 response if client copy is still fresh, otherwise None
+    """
+
+    conditional_response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp())
+    )
+
+    if conditional_response is None:
+        return None
+
+    return set_version_headers(response_class(status=conditional_response.status_code), etag, last_modified)
+
 
 def merge_serializer_errors(errors: ReturnDict):
     new_errors = []
@@ -0,0 +1,106 @@
+"""
+JSON renderer and parser backed by orjson, when it is installed
+
+Output is the same JSON as DRF's JSONRenderer (compact, UTF-8, datetimes encoded the same way),
+several times faster for large lists. Without orjson both classes fall back to DRF's stdlib json
+implementations.
+
+Decimals are always written the way DRF's DecimalField serializes them: as strings with the
+COERCE_DECIMAL_TO_STRING setting (the default), else as numbers, so a field keeps one JSON type
+whatever its value. Request bodies with numbers a float can not hold are parsed with the stdlib
+parser into Decimal, so no digits are lost.
+"""
+
+import json
+from decimal import Decimal
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Significant digits a float keeps exactly (sys.float_info.dig)
+FLOAT_DIGITS = 15
+
+# Numbers that may not fit a float are runs of 16 or more digits and dots, found by mapping
+# those to "0" (much faster than a regular expression on large bodies)
+NUMBER_CHARACTERS = bytes.maketrans(b"0123456789.", b"0" * 11)
+LONG_NUMBER = b"0" * (FLOAT_DIGITS + 1)
+
+
+class DecimalJSONEncoder(JSONEncoder):
+    """
+    DRF's encoder with Decimals encoded like DecimalField (DRF's encoder always writes floats)
+    """
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj) if api_settings.COERCE_DECIMAL_TO_STRING else float(obj)
+
+        # Everything else (datetime, UUID, lazy strings, querysets...) the way DRF encodes it
+        return super().default(obj)
+
+
+_default = DecimalJSONEncoder().default
+
+
+def dumps(data):
+    """
+    Encode data as compact UTF-8 JSON
+    :return: bytes
+    """
+
+    if orjson is not None:
+        try:
+            # Passthrough: DRF formats datetimes differently than orjson ("Z" instead of "+00:00")
+            return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            # Not supported by orjson (non-string dict keys, integers over 64 bits), try json
+            pass
+
+    return json.dumps(
+        data, cls=DecimalJSONEncoder, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def loads(data):
+    """
+    Decode JSON bytes, floats that need more precision than a float has are parsed as Decimal.
+    NaN and Infinity are rejected like DRF's strict JSON parsing.
+    """
+
+    if orjson is None or data.translate(NUMBER_CHARACTERS).find(LONG_NUMBER) != -1:
+        return json.loads(data, parse_float=Decimal, parse_constant=strict_constant)
+
+    return orjson.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder_class = DecimalJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        # Indented output (e.g. "Accept: application/json; indent=4") is left to DRF
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {e}")
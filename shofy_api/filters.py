@@ -0,0 +1,101 @@
+"""
+Filtering and ordering of product listings
+
+Query parameters, all optional and combined:
+    store: store id
+    min_price, max_price: inclusive price range
+    in_stock: "1" / "true" for products with quantity > 0, "0" / "false" for sold out products
+    name_prefix: products whose name starts with it, case-insensitive
+    ordering: one of PRODUCT_ORDERINGS, "-" for descending, default "id"
+
+Filters become WHERE conditions of the listing query, so they combine with cursor pagination.
+Each one is backed by an index of Product (see Product.Meta.indexes).
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from shofy_api.pagination import CursorPaginator
+
+# Ordering query parameter: CursorPaginator ordering
+PRODUCT_ORDERINGS = {
+    "id": "pk",
+    "-id": "-pk",
+    "price": "price",
+    "-price": "-price",
+}
+
+BOOLEANS = {"1": True, "true": True, "0": False, "false": False}
+
+
+class InvalidFilter(Exception):
+    """
+    Raised when a filter or ordering query parameter can not be used
+    """
+
+
+def _parse(request, name, parse):
+    value = request.GET.get(name, "")
+
+    if value == "":
+        return None
+
+    try:
+        return parse(value)
+    except (ValueError, KeyError, InvalidOperation):
+        raise InvalidFilter(f"Invalid {name} \"{value}\"")
+
+
+def _parse_price(value):
+    price = Decimal(value)
+
+    if not price.is_finite():
+        raise ValueError(value)
+
+    return price
+
+
+def filter_products(queryset, request):
+    """
+    Filter queryset of products by the request query parameters
+    """
+
+    store = _parse(request, "store", int)
+    min_price = _parse(request, "min_price", _parse_price)
+    max_price = _parse(request, "max_price", _parse_price)
+    in_stock = _parse(request, "in_stock", lambda value: BOOLEANS[value.lower()])
+    name_prefix = request.GET.get("name_prefix", "")
+
+    if store is not None:
+        queryset = queryset.filter(store_id=store)
+
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    if in_stock is True:
+        queryset = queryset.filter(quantity__gt=0)
+    elif in_stock is False:
+        queryset = queryset.filter(quantity=0)
+
+    if name_prefix:
+        # LIKE 'prefix%' on SQLite, answered from the NOCASE name index
+        queryset = queryset.filter(name__istartswith=name_prefix)
+
+    return queryset
+
+
+def product_paginator(request):
+    """
+    Cursor paginator ordered by the "ordering" query parameter
+    """
+
+    ordering = request.GET.get("ordering") or "id"
+
+    if ordering not in PRODUCT_ORDERINGS:
+        raise InvalidFilter(
+            f"Invalid ordering \"{ordering}\", use one of: {', '.join(PRODUCT_ORDERINGS)}"
+        )
+
+    return CursorPaginator(PRODUCT_ORDERINGS[ordering])
@@ -0,0 +1,138 @@
+"""
+Idempotency-Key support for POST endpoints
+
+A POST with an "Idempotency-Key" header runs once: its successful response is stored under the
+key and every retry with the same key gets the stored response back, read with one primary key
+lookup, without running the view again. Retries of a cart add don't add the quantity twice.
+
+The response is stored in the same transaction as the writes of the view, so a write is never
+committed without its response or the other way around. Requests racing with the same key both
+run the view, the one that stores the key second is rolled back and replays the first one.
+
+Keys are scoped to the client (authenticated user, otherwise IP address, see
+throttling.get_client): the same key sent by another client is another key and never replays
+this client's response.
+
+Only 2xx responses are stored, failed requests wrote nothing and a retry runs them again. Keys
+expire after settings.API_IDEMPOTENCY_TTL seconds, the purge_idempotency_keys command deletes
+expired keys.
+"""
+
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+
+from shofy_api import fastjson
+from shofy_api.extensions import build_response
+from shofy_api.models import IdempotencyKey
+from shofy_api.throttling import get_client
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, "API_IDEMPOTENCY_TTL", 24 * 60 * 60))
+
+
+def fingerprint(request):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+
+    return digest.hexdigest()
+
+
+def scoped_key(request, key):
+    """
+    :return: key as stored, prefixed by a hash of the client
+    """
+
+    client = hashlib.blake2b(get_client(request).encode(), digest_size=16).hexdigest()
+
+    return f"{client}:{key}"
+
+
+def find(key):
+    """
+    :return: stored key, None if there is none or it expired
+    """
+
+    stored = IdempotencyKey.objects.filter(key=key).first()
+
+    if stored is None or stored.created_at < timezone.now() - get_ttl():
+        return None
+
+    return stored
+
+
+def replay(stored, request_fingerprint):
+    if stored.fingerprint != request_fingerprint:
+        return build_response(
+            data=None,
+            message=f"{HEADER} was already used for a different request",
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    response = HttpResponse(bytes(stored.body), status=stored.status, content_type="application/json")
+    response["Idempotent-Replayed"] = "true"
+
+    return response
+
+
+def idempotent(view_method):
+    """
+    Decorate a POST method of an APIView to replay responses of requests with an Idempotency-Key
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return build_response(
+                data=None,
+                message=f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = scoped_key(request, key)
+        request_fingerprint = fingerprint(request)
+        stored = find(key)
+
+        if stored is not None:
+            return replay(stored, request_fingerprint)
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+
+                if status.is_success(response.status_code) and hasattr(response, "data"):
+                    # Replaces an expired key, a key stored by a concurrent request raises IntegrityError
+                    IdempotencyKey.objects.filter(key=key, created_at__lt=timezone.now() - get_ttl()).delete()
+                    IdempotencyKey.objects.create(
+                        key=key,
+                        fingerprint=request_fingerprint,
+                        status=response.status_code,
+                        body=fastjson.dumps(response.data)
+                    )
+        except IntegrityError:
+            stored = find(key)
+
+            if stored is None:
+                raise
+
+            return replay(stored, request_fingerprint)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,188 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shofy_api.benchmarks import percentile
+from shofy_api.models import *
+from shofy_api.urls import urlpatterns
+
+PRODUCT = {"name": "Bench product", "description": "Benchmark", "price": "1000.000", "quantity": 10}
+
+# Write requests per route, {route: {method: body(ids)}}. Every route is also requested with GET,
+# except the write-only ones listed here without "get".
+WRITES = {
+    "user/": {
+        "post": lambda ids: {"name": "Bench", "username": "bench", "email": "bench@mail.com"},
+    },
+    "user/<int:user_id>": {
+        "put": lambda ids: {"name": "Bench", "username": "bench", "email": "bench@mail.com"},
+        "delete": None,
+    },
+    "store/": {
+        "post": lambda ids: {"name": "Bench", "location": "Jakarta", "user_id": ids["free_user_id"]},
+    },
+    "store/<int:store_id>": {
+        "put": lambda ids: {"name": "Bench", "location": "Jakarta"},
+        "delete": None,
+    },
+    "product/": {
+        "post": lambda ids: {**PRODUCT, "store_id": ids["store_id"]},
+    },
+    "product/bulk": {
+        "post": lambda ids: {
+            "create": [{**PRODUCT, "store_id": ids["store_id"]}] * 50,
+            "update": [{"id": ids["product_id"], "quantity": 5}],
+        },
+    },
+    "product/<int:product_id>": {
+        "put": lambda ids: PRODUCT,
+        "delete": None,
+    },
+    "user/<int:user_id>/checkout": {
+        "post": None,
+    },
+    "cart/": {
+        "post": lambda ids: {"user_id": ids["user_id"], "product_id": ids["product_id"], "quantity": 1},
+    },
+    "cart/<int:cart_item_id>": {
+        "put": lambda ids: {"quantity": 3},
+        "delete": None,
+    },
+}
+WRITE_ONLY = {"product/bulk", "user/<int:user_id>/checkout"}
+QUERY = {
+    "product/search": "?q=lamp",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every route of the API in-process and report throughput, p50/p95/p99 latency, "
+        "query count and peak Python memory per endpoint. Write requests are rolled back, so "
+        "runs do not change the data. Runs against the configured database, seed it first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--filter", default="", help="Only endpoints whose route contains this")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def sample_ids(self):
+        # A user whose whole cart is in stock, so checkout succeeds
+        short_users = CartItem.objects.filter(quantity__gt=F("product__quantity")).values("user_id")
+        cart_item = CartItem.objects.exclude(user_id__in=short_users).order_by("pk").first()
+        product = Product.objects.order_by("pk").first()
+        free_user = User.objects.filter(store__isnull=True).order_by("pk").first()
+
+        if cart_item is None or product is None or free_user is None:
+            raise CommandError("Database needs users without store, products and cart items, seed it first")
+
+        return {
+            "user_id": cart_item.user_id,
+            "store_id": product.store_id,
+            "product_id": product.pk,
+            "cart_item_id": cart_item.pk,
+            "free_user_id": free_user.pk,
+        }
+
+    def endpoints(self, ids):
+        """
+        :return: list of (method, route, path, body)
+        """
+
+        endpoints = []
+
+        for pattern in urlpatterns:
+            route = str(pattern.pattern)
+            path = "/api/" + route.replace("<int:", "{").replace(">", "}").format(**ids) + QUERY.get(route, "")
+
+            if route not in WRITE_ONLY:
+                endpoints.append(("get", route, path, None))
+
+            for method, body in WRITES.get(route, {}).items():
+                endpoints.append((method, route, path, body and body(ids)))
+
+        return endpoints
+
+    def request(self, client, method, path, body):
+        if method == "get":
+            return client.get(path)
+
+        # Keep the data identical between requests and runs
+        with transaction.atomic():
+            response = client.generic(method.upper(), path, json.dumps(body or {}), "application/json")
+            transaction.set_rollback(True)
+
+        return response
+
+    def measure(self, client, method, route, path, body, requests, warmup):
+        for _ in range(warmup):
+            self.request(client, method, path, body)
+
+        latencies = []
+        status_codes = set()
+        start = time.perf_counter()
+
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            response = self.request(client, method, path, body)
+            latencies.append(time.perf_counter() - request_start)
+            status_codes.add(response.status_code)
+
+        elapsed = time.perf_counter() - start
+
+        # Queries and memory of one more (steady state) request, tracing would skew the timings above
+        with CaptureQueriesContext(connection) as queries:
+            tracemalloc.start()
+            self.request(client, method, path, body)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return {
+            "method": method.upper(),
+            "route": f"/api/{route}",
+            "status_codes": sorted(status_codes),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            # SAVEPOINT / RELEASE of the rollback are not queries of the endpoint
+            "queries": sum(not query["sql"].startswith(("SAVEPOINT", "RELEASE", "ROLLBACK")) for query in queries),
+            "peak_memory_kib": round(peak_memory / 1024, 1),
+        }
+
+    def handle(self, *args, **options):
+        ids = self.sample_ids()
+        client = Client()
+        results = []
+
+        # Test client sends "Host: testserver", all requests come from it, so no rate limits
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], API_THROTTLE_RATES={}):
+            for method, route, path, body in self.endpoints(ids):
+                if options["filter"] not in route:
+                    continue
+
+                results.append(self.measure(client, method, route, path, body, options["requests"], options["warmup"]))
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"ids": ids, "results": results}, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['method']:<6} {result['route']:<40} "
+                f"{result['requests_per_second']:>9} req/s  "
+                f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                f"queries {result['queries']:>3}  peak {result['peak_memory_kib']:>9} KiB  "
+                f"status {','.join(map(str, result['status_codes']))}"
+            )
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+
+from shofy_api.benchmarks import percentile
+
+
+def report(mode, path, latencies, errors, elapsed, concurrency):
+    return {
+        "mode": mode,
+        "path": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and p50/p99 latency of the sync endpoints (WSGI handler, one thread per "
+        "in-flight request) with the async endpoints (ASGI handler, one event loop) under concurrency. "
+        "Runs in-process against the configured database, seed it first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="Endpoint below /api/, can be repeated (default: product/)")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def run_wsgi(self, path, requests, concurrency):
+        def worker(count):
+            client = Client()
+            latencies = []
+            errors = 0
+
+            try:
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = client.get(f"/api/{path}")
+                    latencies.append(time.perf_counter() - start)
+                    errors += response.status_code >= 500
+            finally:
+                connection.close()
+
+            return latencies, errors
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(worker, [requests // concurrency] * concurrency))
+
+        latencies = [latency for result, _ in results for latency in result]
+        errors = sum(errors for _, errors in results)
+
+        return report("wsgi", f"/api/{path}", latencies, errors, time.perf_counter() - start, concurrency)
+
+    def run_asgi(self, mode, path, requests, concurrency):
+        latencies = []
+        statuses = []
+
+        async def worker(client, count):
+            for _ in range(count):
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                statuses.append(response.status_code)
+
+        async def main():
+            client = AsyncClient()
+            start = time.perf_counter()
+
+            await asyncio.gather(*[worker(client, requests // concurrency) for _ in range(concurrency)])
+
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(main())
+        errors = sum(status >= 500 for status in statuses)
+
+        return report(mode, path, latencies, errors, elapsed, concurrency)
+
+    def handle(self, *args, **options):
+        # Test clients send "Host: testserver", all requests come from them, so no rate limits
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], API_THROTTLE_RATES={}):
+            results = self.run(options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<11} {result['path']:<30} "
+                f"{result['requests_per_second']:>9} req/s  "
+                f"p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                f"errors {result['errors']}"
+            )
+
+    def run(self, options):
+        results = []
+
+        for path in options["paths"] or ["product/"]:
+            requests, concurrency = options["requests"], options["concurrency"]
+
+            results.append(self.run_wsgi(path, requests, concurrency))
+            # Sync APIView under ASGI, every request hops to a thread
+            results.append(self.run_asgi("asgi-sync", f"/api/{path}", requests, concurrency))
+            results.append(self.run_asgi("asgi-async", f"/api/async/{path}", requests, concurrency))
+
+        return results
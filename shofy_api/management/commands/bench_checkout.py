@@ -0,0 +1,172 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from shofy_api.cache import product_cache
+from shofy_api.benchmarks import percentile
+from shofy_api.models import *
+
+
+class FlashSale:
+    """
+    Buyers with carts of the same few products, created for the run and deleted afterwards
+    """
+
+    def __init__(self, buyers, products, stock, max_quantity, seed):
+        self.random = random.Random(seed)
+        self.seller = User.objects.create(name="Flash sale", username="flashsale", email="flashsale@mail.com")
+        store = Store.objects.create(name="Flash sale", location="Jakarta", user=self.seller)
+
+        self.products = Product.objects.bulk_create([
+            Product(name=f"Flash sale {i}", description="Benchmark", price="1000.000", quantity=stock, store=store)
+            for i in range(products)
+        ])
+        self.stock = stock
+        self.buyers = User.objects.bulk_create([
+            User(name=f"Buyer {i}", username=f"flashbuyer{i}", email=f"flashbuyer{i}@mail.com")
+            for i in range(buyers)
+        ])
+        # {buyer id: {product id: quantity}}
+        self.carts = {
+            buyer.pk: {
+                product.pk: self.random.randint(1, max_quantity)
+                for product in self.random.sample(self.products, self.random.randint(1, min(3, products)))
+            }
+            for buyer in self.buyers
+        }
+
+        CartItem.objects.bulk_create([
+            CartItem(user_id=buyer_id, product_id=product_id, quantity=quantity)
+            for buyer_id, cart in self.carts.items()
+            for product_id, quantity in cart.items()
+        ])
+
+    def verify(self, bought):
+        """
+        :return: per product stock, units sold and units bought by successful checkouts
+        """
+
+        quantities = dict(Product.objects.filter(pk__in=[p.pk for p in self.products]).values_list("pk", "quantity"))
+        products = []
+
+        for product in self.products:
+            products.append({
+                "product_id": product.pk,
+                "stock": self.stock,
+                "sold": self.stock - quantities[product.pk],
+                "bought": sum(self.carts[buyer_id].get(product.pk, 0) for buyer_id in bought)
+            })
+
+        return products
+
+    def delete(self):
+        # Cascades to the store, products and cart items
+        User.objects.filter(pk__in=[self.seller.pk, *[buyer.pk for buyer in self.buyers]]).delete()
+        product_cache.invalidate(*[product.pk for product in self.products])
+
+
+class Command(BaseCommand):
+    help = (
+        "Flash sale stress test: buyers check out carts of the same few products from parallel "
+        "threads through POST /api/user/<id>/checkout. Reports checkout throughput and latency "
+        "and fails if any product was oversold. Creates its own products and buyers and deletes "
+        "them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=500)
+        parser.add_argument("--products", type=int, default=5)
+        parser.add_argument("--stock", type=int, default=200, help="Initial stock of every product")
+        parser.add_argument("--max-quantity", type=int, default=3, help="Max quantity of a cart item")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def run(self, buyer_ids, threads):
+        queue = list(buyer_ids)
+        lock = threading.Lock()
+        results = []
+
+        def worker():
+            client = Client()
+
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        buyer_id = queue.pop()
+
+                    start = time.perf_counter()
+                    status_code = client.post(f"/api/user/{buyer_id}/checkout").status_code
+
+                    with lock:
+                        results.append((buyer_id, status_code, time.perf_counter() - start))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+
+        for thread in workers:
+            thread.start()
+
+        for thread in workers:
+            thread.join()
+
+        return results, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        sale = FlashSale(options["buyers"], options["products"], options["stock"], options["max_quantity"],
+                         options["seed"])
+
+        try:
+            # Test client sends "Host: testserver", all requests come from it, so no rate limits
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], API_THROTTLE_RATES={}):
+                results, elapsed = self.run([buyer.pk for buyer in sale.buyers], options["threads"])
+
+            bought = [buyer_id for buyer_id, status_code, _ in results if status_code == 200]
+            products = sale.verify(bought)
+        finally:
+            sale.delete()
+
+        latencies = [latency for _, _, latency in results]
+        result = {
+            "threads": options["threads"],
+            "checkouts": len(results),
+            "checkouts_per_second": round(len(results) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "bought": len(bought),
+            "insufficient_stock": sum(status_code == 409 for _, status_code, _ in results),
+            "errors": sum(status_code not in (200, 409) for _, status_code, _ in results),
+            "oversold": sum(max(0, product["sold"] - product["stock"]) for product in products),
+            "products": products,
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+        else:
+            self.stdout.write(
+                f"{result['checkouts']} checkouts in {options['threads']} threads: "
+                f"{result['checkouts_per_second']} checkouts/s  "
+                f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms\n"
+                f"bought {result['bought']}  insufficient stock {result['insufficient_stock']}  "
+                f"errors {result['errors']}  oversold units {result['oversold']}"
+            )
+
+            for product in products:
+                self.stdout.write(
+                    f"  product {product['product_id']}: stock {product['stock']}  sold {product['sold']}  "
+                    f"bought by successful checkouts {product['bought']}"
+                )
+
+        if result["oversold"] or any(product["sold"] != product["bought"] for product in products):
+            raise CommandError("Stock does not match successful checkouts")
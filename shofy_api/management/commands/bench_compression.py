@@ -0,0 +1,70 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from shofy_api.benchmarks import best_of
+from shofy_api.compression import available_encoders
+from shofy_api.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compress response bodies of list and detail endpoints with every available encoding, "
+        "report compressed size, time to compress and time to hash the body for a compressed "
+        "cache lookup. Seed the database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def bodies(self):
+        product = Product.objects.order_by("pk").first()
+        paths = [
+            f"/api/product/{product.pk}",
+            f"/api/store/{product.store_id}/products",
+            "/api/product/",
+            "/api/product/?limit=500",
+        ]
+
+        # Test client sends "Host: testserver", all requests come from it, so no rate limits
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], API_THROTTLE_RATES={}):
+            client = Client()
+
+            for path in paths:
+                yield path, client.get(path).content
+
+    def handle(self, *args, **options):
+        encoders = available_encoders()
+        repeat = options["repeat"]
+        results = []
+
+        for path, body in self.bodies():
+            hash_time, _ = best_of(repeat, lambda: hashlib.blake2b(body, digest_size=16).hexdigest())
+
+            for name, encoder in encoders.items():
+                compress_time, compressed = best_of(repeat, lambda: encoder.compress(body))
+
+                results.append({
+                    "path": path,
+                    "encoding": name,
+                    "bytes": len(body),
+                    "compressed_bytes": len(compressed),
+                    "ratio": round(len(body) / len(compressed), 1),
+                    "compress_ms": round(compress_time * 1000, 3),
+                    "hash_ms": round(hash_time * 1000, 3),
+                })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['path']:<32} {result['encoding']:<5} {result['bytes']:>8} B -> "
+                f"{result['compressed_bytes']:>7} B ({result['ratio']:>4}x)  "
+                f"compress {result['compress_ms']:>7} ms  hash {result['hash_ms']:>6} ms"
+            )
@@ -0,0 +1,83 @@
+import io
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from shofy_api import fastjson
+from shofy_api.benchmarks import best_of
+from shofy_api.fastjson import FastJSONParser, FastJSONRenderer
+from shofy_api.models import CartItem, Product
+from shofy_api.row_serializers import cart_item_rows, product_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Render list responses and parse bulk request bodies with DRF's JSONRenderer / JSONParser "
+        "and with FastJSONRenderer / FastJSONParser. Seed the database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, action="append", help="List sizes (default: 50, 500, 5000)")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def compare(self, name, baseline, fast, repeat):
+        baseline_time, baseline_result = best_of(repeat, baseline)
+        fast_time, fast_result = best_of(repeat, fast)
+
+        if name.startswith("parse") and baseline_result != fast_result:
+            raise CommandError(f"{name}: parsers disagree")
+
+        return {
+            "case": name,
+            "drf_ms": round(baseline_time * 1000, 3),
+            "fast_ms": round(fast_time * 1000, 3),
+            "speedup": round(baseline_time / fast_time, 1),
+        }
+
+    def handle(self, *args, **options):
+        if fastjson.orjson is None:
+            self.stderr.write("orjson is not installed, the fast classes fall back to DRF's")
+
+        repeat = options["repeat"]
+        results = []
+
+        for rows in options["rows"] or [50, 500, 5000]:
+            for name, queryset, row_serializer in (
+                ("products", Product.objects.order_by("pk"), product_rows),
+                ("cart items", CartItem.objects.order_by("pk"), cart_item_rows),
+            ):
+                data = row_serializer.serialize(row_serializer.values(queryset)[:rows])
+                envelope = {"message": f"Count: {len(data)}", "status": 200, "data": data, "next": None}
+
+                results.append(self.compare(
+                    f"render {len(data)} {name}",
+                    lambda: JSONRenderer().render(envelope),
+                    lambda: FastJSONRenderer().render(envelope),
+                    repeat
+                ))
+
+            items = [
+                {"name": f"Product {i}", "description": "desc", "price": 1234.567, "quantity": 10, "store_id": 1}
+                for i in range(rows)
+            ]
+            body = json.dumps({"create": items}).encode()
+
+            results.append(self.compare(
+                f"parse {rows} bulk items",
+                lambda: JSONParser().parse(io.BytesIO(body)),
+                lambda: FastJSONParser().parse(io.BytesIO(body)),
+                repeat
+            ))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['case']:<28} DRF {result['drf_ms']:>9} ms  fast {result['fast_ms']:>8} ms  "
+                f"({result['speedup']}x)"
+            )
@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shofy_api.benchmarks import best_of
+from shofy_api.models import *
+from shofy_api.row_serializers import cart_item_rows, product_rows, store_rows, user_rows
+from shofy_api.serializers import *
+
+ENTITIES = {
+    "user": (lambda: User.objects.order_by("pk"), UserSerializer, user_rows),
+    "store": (lambda: Store.objects.order_by("pk"), StoreSerializer, store_rows),
+    "product": (lambda: Product.objects.order_by("pk"), ProductSerializer, product_rows),
+    "cart_item": (lambda: CartItem.objects.select_related("user", "product").order_by("pk"),
+                  CartItemSerializer, cart_item_rows),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-row cost of the DRF ModelSerializers vs the .values() row serializers used by the "
+        "read endpoints, for loading + serializing and for serializing alone. Seed the database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def measure(self, name, queryset, serializer_class, row_serializer, rows, repeat):
+        instances_time, instances = best_of(repeat, lambda: list(queryset()[:rows]))
+        values_time, values = best_of(repeat, lambda: list(row_serializer.values(queryset())[:rows]))
+
+        if not instances:
+            raise CommandError(f"No {name} rows, seed the database first")
+
+        drf_time, drf_data = best_of(repeat, lambda: serializer_class(instances, many=True).data)
+        row_time, row_data = best_of(repeat, lambda: row_serializer.serialize(values))
+
+        if json.dumps(drf_data, default=str) != json.dumps(row_data, default=str):
+            raise CommandError(f"{name}: row serializer output differs from {serializer_class.__name__}")
+
+        count = len(instances)
+
+        def per_row(seconds):
+            return round(seconds / count * 1_000_000, 2)
+
+        return {
+            "entity": name,
+            "rows": count,
+            "drf_serialize_us_per_row": per_row(drf_time),
+            "row_serialize_us_per_row": per_row(row_time),
+            "serialize_speedup": round(drf_time / row_time, 1),
+            "drf_total_us_per_row": per_row(instances_time + drf_time),
+            "row_total_us_per_row": per_row(values_time + row_time),
+            "total_speedup": round((instances_time + drf_time) / (values_time + row_time), 1),
+        }
+
+    def handle(self, *args, **options):
+        results = [
+            self.measure(name, *entity, options["rows"], options["repeat"])
+            for name, entity in ENTITIES.items()
+        ]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['entity']:<10} {result['rows']:>6} rows  "
+                f"serialize {result['drf_serialize_us_per_row']:>7} -> {result['row_serialize_us_per_row']:>5} us/row "
+                f"({result['serialize_speedup']}x)  "
+                f"load+serialize {result['drf_total_us_per_row']:>7} -> {result['row_total_us_per_row']:>5} us/row "
+                f"({result['total_speedup']}x)"
+            )
@@ -0,0 +1,154 @@
+import json
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from shofy_api.sqlite import apply_pragmas, get_pragmas
+
+READ_SQL = (
+    "SELECT id, name, description, price, quantity, store_id FROM shofy_api_product "
+    "WHERE id > ? ORDER BY id LIMIT 50"
+)
+WRITE_SQL = (
+    "INSERT INTO shofy_api_cartitem (user_id, product_id, quantity) VALUES (?, ?, 1) "
+    "ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = shofy_api_cartitem.quantity + 1"
+)
+
+
+class Workload:
+    """
+    Mixed product page reads and cart upserts against one SQLite file
+    """
+
+    def __init__(self, path, pragmas, persistent, user_ids, product_ids):
+        self.path = path
+        self.pragmas = pragmas
+        self.persistent = persistent
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.lock = threading.Lock()
+
+    def connect(self):
+        # timeout=0: without the busy_timeout pragma a locked database fails right away
+        db = sqlite3.connect(self.path, timeout=0, isolation_level=None, check_same_thread=False)
+        apply_pragmas(db.cursor(), self.pragmas)
+        return db
+
+    def set_journal_mode(self, journal_mode):
+        # journal_mode is stored in the database file, set it once before the workers start
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.execute(f"PRAGMA journal_mode = {journal_mode}")
+        db.close()
+
+    def run_thread(self, operation, deadline):
+        db = self.connect() if self.persistent else None
+        done = errors = 0
+
+        while time.perf_counter() < deadline:
+            current = db
+
+            try:
+                # Without persistent connections every operation opens a new one, like CONN_MAX_AGE=0
+                current = current or self.connect()
+                operation(current)
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+            finally:
+                if db is None and current is not None:
+                    current.close()
+
+        if db is not None:
+            db.close()
+
+        return done, errors
+
+    def read(self, db):
+        db.execute(READ_SQL, [random.choice(self.product_ids) - 1]).fetchall()
+
+    def write(self, db):
+        db.execute(WRITE_SQL, [random.choice(self.user_ids), random.choice(self.product_ids)])
+
+    def run(self, readers, writers, seconds):
+        self.set_journal_mode(self.pragmas.get("journal_mode", "DELETE"))
+        deadline = time.perf_counter() + seconds
+        results = {"reads": [], "writes": []}
+
+        def target(kind, operation):
+            result = self.run_thread(operation, deadline)
+            with self.lock:
+                results[kind].append(result)
+
+        threads = [threading.Thread(target=target, args=("reads", self.read)) for _ in range(readers)]
+        threads += [threading.Thread(target=target, args=("writes", self.write)) for _ in range(writers)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return {
+            "reads_per_second": round(sum(done for done, _ in results["reads"]) / seconds, 1),
+            "writes_per_second": round(sum(done for done, _ in results["writes"]) / seconds, 1),
+            "locked_errors": sum(errors for _, errors in results["reads"] + results["writes"])
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed read/write throughput of a copy of the SQLite database, with default SQLite settings "
+        "(rollback journal, no busy timeout, connection per operation) and with SQLITE_PRAGMAS "
+        "and persistent connections. The database needs products and users, seed it first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Only SQLite databases can be benchmarked")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM shofy_api_user")
+            user_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT id FROM shofy_api_product")
+            product_ids = [row[0] for row in cursor.fetchall()]
+
+        if not user_ids or not product_ids:
+            raise CommandError("Database has no users or products")
+
+        profiles = {
+            "default": ({}, False),
+            "tuned": (get_pragmas(), True),
+        }
+        results = {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, (pragmas, persistent) in profiles.items():
+                path = Path(directory) / f"{name}.sqlite3"
+                shutil.copyfile(connection.settings_dict["NAME"], path)
+
+                workload = Workload(str(path), pragmas, persistent, user_ids, product_ids)
+                results[name] = workload.run(options["readers"], options["writers"], options["seconds"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<8} reads {result['reads_per_second']:>9}/s  "
+                f"writes {result['writes_per_second']:>8}/s  "
+                f"locked errors {result['locked_errors']}"
+            )
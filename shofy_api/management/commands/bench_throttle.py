@@ -0,0 +1,62 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from shofy_api.throttling import ThrottleMiddleware
+
+PATHS = ["/api/product/", "/api/product/1", "/api/user/1/cart", "/api/async/cart/1"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the rate limiter per request (route lookup, client lookup and taking a token) with "
+        "the in-process and the Django cache backend. Requests come from many clients, like "
+        "production traffic, so buckets are created, updated and evicted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100_000)
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def measure(self, backend, requests, clients):
+        # A rate no client reaches, every request takes a token
+        with override_settings(API_THROTTLE_RATES={"*": (1_000_000, 1_000_000)}, API_THROTTLE_BACKEND=backend):
+            middleware = ThrottleMiddleware(lambda request: HttpResponse())
+
+        factory = RequestFactory()
+        batch = [
+            factory.get(PATHS[i % len(PATHS)], REMOTE_ADDR=f"10.0.{i % clients // 256}.{i % clients % 256}")
+            for i in range(min(requests, 10 * clients))
+        ]
+        rejected = 0
+        start = time.perf_counter()
+
+        for i in range(requests):
+            rejected += middleware.check(batch[i % len(batch)]) is not None
+
+        elapsed = time.perf_counter() - start
+
+        return {
+            "backend": backend if backend == "memory" else f"cache ({settings.API_THROTTLE_CACHE})",
+            "requests": requests,
+            "rejected": rejected,
+            "us_per_request": round(elapsed / requests * 1_000_000, 2),
+        }
+
+    def handle(self, *args, **options):
+        results = [self.measure(backend, options["requests"], options["clients"]) for backend in ("memory", "cache")]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['backend']:<20} {result['us_per_request']:>7} us/request  "
+                f"({result['requests']} requests, {result['rejected']} rejected)"
+            )
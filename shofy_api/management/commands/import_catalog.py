@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shofy_api.catalog import CatalogImporter, detect_format, read_rows
+
+KINDS = ("users", "stores", "products")
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users, stores and products from CSV or JSONL files (format from the extension: "
+        ".csv, .jsonl, .ndjson). Files are streamed and inserted in batches with bulk_create, one "
+        "transaction per batch, memory does not grow with the file size. Stores refer to users and "
+        "products to stores by the ids of the imported files, or by primary key of existing rows. "
+        "See shofy_api.catalog for the columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", help="Users file")
+        parser.add_argument("--stores", help="Stores file")
+        parser.add_argument("--products", help="Products file")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--progress-every", type=int, default=50_000,
+                            help="Report progress every this many rows, 0 to disable")
+
+    def handle(self, *args, **options):
+        files = [(kind, options[kind]) for kind in KINDS if options[kind]]
+
+        if not files:
+            raise CommandError("Nothing to import, pass --users, --stores and/or --products")
+
+        try:
+            formats = {kind: detect_format(path) for kind, path in files}
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        importer = CatalogImporter(options["batch_size"], self.progress_reporter(options["progress_every"]))
+        start = time.perf_counter()
+
+        # Users before stores before products, so references to rows of the other files resolve
+        for kind, path in files:
+            try:
+                with open(path, "rb") as file:
+                    getattr(importer, f"import_{kind}")(read_rows(file, formats[kind]))
+            except OSError as e:
+                raise CommandError(f"Can not read {path}: {e}")
+
+        for kind, line, errors in sorted(importer.errors, key=lambda error: (KINDS.index(error[0]), error[1])):
+            self.stderr.write(f"{kind} line {line}: {'; '.join(errors)}")
+
+        elapsed = time.perf_counter() - start
+        imported = sum(importer.imported.values())
+
+        self.stdout.write(
+            f"Imported {importer.imported['users']} users, {importer.imported['stores']} stores and "
+            f"{importer.imported['products']} products in {elapsed:.1f}s "
+            f"({imported / elapsed:.0f} rows/s), skipped {sum(importer.skipped.values())} invalid rows"
+        )
+
+    def progress_reporter(self, every):
+        if not every:
+            return None
+
+        reported = {}
+
+        def progress(kind, read, imported, elapsed):
+            if read // every > reported.get(kind, 0):
+                reported[kind] = read // every
+                self.stdout.write(f"{kind}: {read} rows read, {imported} imported, {read / elapsed:.0f} rows/s")
+
+        return progress
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shofy_api.idempotency import get_ttl
+from shofy_api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored responses of Idempotency-Key requests older than settings.API_IDEMPOTENCY_TTL. "
+        "Expired keys are never replayed, this only keeps the table small."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - get_ttl()).delete()
+
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
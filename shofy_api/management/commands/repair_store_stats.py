@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shofy_api.stats import repair
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stats of every store from its products, fix the stored stats that drifted "
+        "and report them. Run it after writing products outside the API (seed, raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+        parser.add_argument("--json", action="store_true", help="Print drifted stores as JSON")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = repair(dry_run=options["dry_run"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(drift, indent=2))
+            return
+
+        for store in drift:
+            changes = ", ".join(
+                f"{field} {store['stored'][field]} -> {value}"
+                for field, value in store["computed"].items()
+                if store["stored"][field] != value
+            )
+            self.stdout.write(f"store {store['store_id']}: {changes}")
+
+        action = "found" if options["dry_run"] else "fixed"
+        self.stdout.write(f"Drift {action} in {len(drift)} stores")
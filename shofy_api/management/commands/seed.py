@@ -0,0 +1,150 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shofy_api.cache import product_cache
+from shofy_api.models import *
+
+ADJECTIVES = ["red", "blue", "green", "black", "white", "large", "small", "wooden", "steel", "cotton",
+              "leather", "vintage", "modern", "classic", "portable", "wireless", "organic", "premium"]
+NOUNS = ["shirt", "chair", "table", "lamp", "phone", "laptop", "watch", "bag", "shoe", "jacket",
+         "mug", "bottle", "speaker", "camera", "book", "pillow", "blanket", "backpack"]
+CITIES = ["Jakarta", "Bandung", "Surabaya", "Medan", "Semarang", "Makassar", "Denpasar", "Yogyakarta"]
+
+
+def count(value):
+    """
+    Row count argument, accepts suffixes: 10k, 1M
+    """
+
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1:].lower()
+
+    try:
+        if suffix in multipliers:
+            return int(float(value[:-1]) * multipliers[suffix])
+
+        return int(value)
+    except ValueError:
+        raise CommandError(f"Invalid count: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, stores, products and cart items with synthetic data using bulk_create. "
+        "By default there is one user per 10 products, every other user owns a store and the "
+        "cart items are half the product count. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=count, default=10_000, help="e.g. 10k, 100k, 1M")
+        parser.add_argument("--users", type=count)
+        parser.add_argument("--stores", type=count)
+        parser.add_argument("--cart-items", type=count)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--flush", action="store_true", help="Delete existing users (and everything they own) first")
+
+    def handle(self, *args, **options):
+        products = options["products"]
+        users = options["users"] or max(1, products // 10)
+        stores = options["stores"] or max(1, users // 2)
+        cart_items = options["cart_items"] if options["cart_items"] is not None else products // 2
+
+        if stores > users:
+            raise CommandError("Every store needs its own user, --stores must not exceed --users")
+
+        if products and not stores:
+            raise CommandError("Products need at least one store")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            if options["flush"]:
+                User.objects.all().delete()
+
+            user_ids = self.seed_users(users)
+            store_ids = self.seed_stores(user_ids[:stores])
+            product_ids = self.seed_products(store_ids, products)
+            cart_item_count = self.seed_cart_items(user_ids, product_ids, cart_items)
+
+        # Rows were written behind the entity cache (all entity types share one backend)
+        product_cache.backend.clear()
+
+        self.stdout.write(
+            f"Seeded {len(user_ids)} users, {len(store_ids)} stores, {len(product_ids)} products and "
+            f"{cart_item_count} cart items in {time.perf_counter() - start:.1f}s"
+        )
+
+    def insert(self, model, rows):
+        """
+        bulk_create rows (any iterable) in batches without materializing all of them
+        :return: primary keys of the inserted rows
+        """
+
+        last_pk = model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        batch = []
+
+        for row in rows:
+            batch.append(row)
+
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            model.objects.bulk_create(batch)
+
+        return list(model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True))
+
+    def seed_users(self, count):
+        offset = User.objects.count()
+
+        return self.insert(User, (
+            User(name=f"User {i}", username=f"user{i}", email=f"user{i}@mail.com")
+            for i in range(offset, offset + count)
+        ))
+
+    def seed_stores(self, user_ids):
+        Store.objects.bulk_create(
+            [Store(user_id=pk, name=f"Store {pk}", location=self.rng.choice(CITIES)) for pk in user_ids],
+            batch_size=self.batch_size
+        )
+
+        return user_ids
+
+    def seed_products(self, store_ids, count):
+        def rows():
+            for i in range(count):
+                adjective, noun = self.rng.choice(ADJECTIVES), self.rng.choice(NOUNS)
+
+                yield Product(
+                    name=f"{adjective.title()} {noun} {i}",
+                    description=f"A {adjective} {noun} from {self.rng.choice(CITIES)}",
+                    price=Decimal(self.rng.randrange(1_000, 10_000_000_000)).scaleb(-3),
+                    quantity=self.rng.randrange(0, 1000),
+                    store_id=store_ids[i % len(store_ids)]
+                )
+
+        return self.insert(Product, rows())
+
+    def seed_cart_items(self, user_ids, product_ids, count):
+        if not product_ids:
+            return 0
+
+        per_user, remainder = divmod(count, len(user_ids))
+
+        def rows():
+            for i, user_id in enumerate(user_ids):
+                size = min(per_user + (i < remainder), len(product_ids))
+
+                # Distinct products per user, (user, product) is unique
+                for product_id in self.rng.sample(product_ids, size):
+                    yield CartItem(user_id=user_id, product_id=product_id, quantity=self.rng.randrange(1, 10))
+
+        return len(self.insert(CartItem, rows()))
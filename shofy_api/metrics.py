@@ -0,0 +1,274 @@
+"""
+Per-request performance metrics
+
+MetricsMiddleware measures every request: number of DB queries and time spent in them, time
+spent serializing (serializer .data), rendering the response and in total. Each response gets
+a Server-Timing header with those numbers, and they are aggregated per route into histograms
+served in Prometheus text format by MetricsView ("/metrics").
+
+Queries are measured by an execute wrapper installed on every database connection, it reports
+to the request in the current context, so queries of async views run by the ORM in a worker
+thread are counted too.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from shofy_api.cache import cache_stats
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_request = ContextVar("current_request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("start", "queries", "db", "serialize", "render")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db * 1000:.3f};desc="{self.queries} queries", '
+            f"serialize;dur={self.serialize * 1000:.3f}, "
+            f"render;dur={self.render * 1000:.3f}, "
+            f"total;dur={total * 1000:.3f}"
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper, adds query count and time to the current request
+    """
+
+    metrics = current_request.get()
+
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created signal receiver, wrappers outlive reconnects so install only once
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serialize_timer():
+    metrics = current_request.get()
+
+    if metrics is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        metrics.serialize += time.perf_counter() - start
+
+
+# Histograms per route, stage: (metric name, help)
+STAGES = {
+    "total": ("shofy_http_request_duration_seconds", "Total request time"),
+    "db": ("shofy_db_duration_seconds", "Time spent in DB queries per request"),
+    "serialize": ("shofy_serialize_duration_seconds", "Serialization time per request"),
+    "render": ("shofy_render_duration_seconds", "Response rendering time per request"),
+}
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_labels(**labels):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+
+
+class RouteMetrics:
+    """
+    Aggregated metrics of one (method, route)
+    """
+
+    __slots__ = ("statuses", "queries", "histograms")
+
+    def __init__(self):
+        self.statuses = {}
+        self.queries = 0
+        # stage: [count per bucket (last one is +Inf), sum]
+        self.histograms = {stage: [[0] * (len(DURATION_BUCKETS) + 1), 0.0] for stage in STAGES}
+
+    def observe(self, status, metrics, total):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.queries += metrics.queries
+
+        for stage, value in (("total", total), ("db", metrics.db),
+                             ("serialize", metrics.serialize), ("render", metrics.render)):
+            histogram = self.histograms[stage]
+            histogram[0][bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[1] += value
+
+
+class Registry:
+    """
+    Per-route request metrics of this process
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.routes = {}
+
+    def observe(self, method, route, status, metrics, total):
+        with self._lock:
+            route_metrics = self.routes.get((method, route))
+
+            if route_metrics is None:
+                route_metrics = self.routes[(method, route)] = RouteMetrics()
+
+            route_metrics.observe(status, metrics, total)
+
+    def render_text(self):
+        with self._lock:
+            routes = [
+                (method, route, dict(metrics.statuses), metrics.queries,
+                 {stage: (list(buckets), total) for stage, (buckets, total) in metrics.histograms.items()})
+                for (method, route), metrics in self.routes.items()
+            ]
+
+        lines = [
+            "# HELP shofy_http_requests_total Requests",
+            "# TYPE shofy_http_requests_total counter",
+        ]
+
+        for method, route, statuses, _, _ in routes:
+            for status, count in statuses.items():
+                labels = format_labels(method=method, route=route, status=status)
+                lines.append(f"shofy_http_requests_total{{{labels}}} {count}")
+
+        lines.append("# HELP shofy_db_queries_total DB queries")
+        lines.append("# TYPE shofy_db_queries_total counter")
+
+        for method, route, _, queries, _ in routes:
+            lines.append(f"shofy_db_queries_total{{{format_labels(method=method, route=route)}}} {queries}")
+
+        for stage, (name, documentation) in STAGES.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} histogram")
+
+            for method, route, _, _, histograms in routes:
+                labels = format_labels(method=method, route=route)
+                bucket_counts, total = histograms[stage]
+                cumulative = 0
+
+                for bound, bucket_count in zip((*DURATION_BUCKETS, "+Inf"), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+                lines.append(f"{name}_sum{{{labels}}} {total}")
+                lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        for counter, documentation in (("hits", "Entity cache hits"), ("misses", "Entity cache misses")):
+            lines.append(f"# HELP shofy_entity_cache_{counter}_total {documentation}")
+            lines.append(f"# TYPE shofy_entity_cache_{counter}_total counter")
+
+            for cache, stats in cache_stats().items():
+                lines.append(f"shofy_entity_cache_{counter}_total{{{format_labels(cache=cache)}}} {stats[counter]}")
+
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self.routes.clear()
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """
+    Measure requests, add Server-Timing header and record them in the registry.
+    Put it first in MIDDLEWARE so the total includes the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, time it with a post-render callback
+        metrics = current_request.get()
+
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def finish_render(response):
+                metrics.render += time.perf_counter() - start
+
+            response.add_post_render_callback(finish_render)
+
+        return response
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.start
+        match = request.resolver_match
+        # Unresolved paths share one label, keeping the number of series bounded
+        route = f"/{match.route}" if match is not None else "unmatched"
+        method = request.method if request.method in HTTP_METHODS else "other"
+
+        registry.observe(method, route, response.status_code, metrics, total)
+        response["Server-Timing"] = metrics.server_timing(total)
+
+        return response
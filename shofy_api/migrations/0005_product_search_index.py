@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# The SQL is frozen here, not imported from shofy_api.search: later changes to the app code must
+# not change what this migration did. search.install() recreates the triggers after migrate.
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shofy_api_product_fts USING fts5("
+    "name, description, content='shofy_api_product', content_rowid='id', prefix='2 3')"
+)
+
+# Index products created before the search index existed
+REBUILD = "INSERT INTO shofy_api_product_fts(shofy_api_product_fts) VALUES ('rebuild')"
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS shofy_api_product_fts_ai AFTER INSERT ON shofy_api_product BEGIN
+        INSERT INTO shofy_api_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shofy_api_product_fts_ad AFTER DELETE ON shofy_api_product BEGIN
+        INSERT INTO shofy_api_product_fts(shofy_api_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shofy_api_product_fts_au AFTER UPDATE OF name, description ON shofy_api_product BEGIN
+        INSERT INTO shofy_api_product_fts(shofy_api_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shofy_api_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS shofy_api_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shofy_api_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shofy_api_product_fts_au",
+    "DROP TABLE IF EXISTS shofy_api_product_fts",
+]
+
+
+def install_search_index(apps, schema_editor):
+    # FTS5 is SQLite only, other databases search with LIKE
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(REBUILD)
+
+        for trigger in CREATE_TRIGGERS:
+            cursor.execute(trigger)
+
+
+def uninstall_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shofy_api', '0004_alter_cartitem_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
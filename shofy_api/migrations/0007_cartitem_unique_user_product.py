@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """
+    Sum quantity of duplicate (user, product) cart items into the oldest one
+    """
+
+    CartItem = apps.get_model('shofy_api', 'CartItem')
+    duplicates = (
+        CartItem.objects
+        .values('user', 'product')
+        .annotate(count=Count('id'), first_id=Min('id'), total=Sum('quantity'))
+        .filter(count__gt=1)
+    )
+
+    for duplicate in duplicates:
+        items = CartItem.objects.filter(user=duplicate['user'], product=duplicate['product'])
+        items.filter(id=duplicate['first_id']).update(quantity=duplicate['total'])
+        items.exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shofy_api', '0006_product_updated_at_store_updated_at_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_item_user_product'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Fail with the duplicated values instead of an IntegrityError, they have to be fixed by hand
+    """
+
+    User = apps.get_model('shofy_api', 'User')
+    duplicates = []
+
+    for field in ('username', 'email'):
+        rows = (
+            User.objects.using(schema_editor.connection.alias)
+            .values(field)
+            .annotate(count=Count('pk'))
+            .filter(count__gt=1)
+            .order_by(field)
+        )
+        duplicates += [f"{field} {row[field]!r} ({row['count']} users)" for row in rows[:20]]
+
+    if duplicates:
+        raise RuntimeError(
+            "Can't make user username and email unique, rename or delete the duplicates first: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shofy_api', '0011_storestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_username_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_email_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('username',), name='user_username_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('email',), name='user_email_unique'),
+        ),
+    ]
@@ -1,10 +1,22 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import BigIntegerField, Count, F, Q, Sum
+from django.db.models.functions import Cast, Collate, Round
 
 
 class User(models.Model):
     name = models.CharField(max_length=50)
     username = models.CharField(max_length=20)
     email = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Also the indexes of the "?username=" / "?email=" lookups
+            models.UniqueConstraint(fields=["username"], name="user_username_unique"),
+            models.UniqueConstraint(fields=["email"], name="user_email_unique")
+        ]
 
     def __str__(self):
         return f"User(name={self.name}, username={self.username}, email={self.email})"
@@ -14,6 +26,7 @@ class Store(models.Model):
     name = models.CharField(max_length=30)
     location = models.CharField(max_length=50)
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Store(name={self.name}, location={self.location}, user={self.user})"
@@ -25,6 +38,18 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=14, decimal_places=3)  # max price: Rp.999.999.999,999
     quantity = models.PositiveIntegerField()
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="products")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Products of a store ordered by price
+            models.Index(fields=["store", "price"], name="product_store_price_idx"),
+            # Price range and ordering of product listings (see filters.py)
+            models.Index(fields=["price"], name="product_price_idx"),
+            models.Index(fields=["price"], condition=Q(quantity__gt=0), name="product_in_stock_price_idx"),
+            # Case-insensitive name prefix, SQLite LIKE only uses an index with NOCASE collation
+            models.Index(Collate("name", "NOCASE"), name="product_name_nocase_idx")
+        ]
 
     def __str__(self):
         return (f"Product("
@@ -36,6 +61,116 @@ class Product(models.Model):
                 f")")
 
 
+class CartItemManager(models.Manager):
+
+    def add_quantity(self, user_id, product_id, quantity):
+        """
+        Add quantity to the (user, product) cart item, create it if it does not exist.
+        Safe under concurrent calls, raises IntegrityError if user or product does not exist.
+
+        :return: cart item (with updated quantity) and whether it was created
+        """
+
+        connection = connections[self.db]
+        features = connection.features
+
+        if features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert:
+            # The increment happens in the database so parallel adds are not lost. An existing item
+            # (the common case) is one statement. An upsert can't tell whether it inserted, only
+            # an INSERT ... DO NOTHING that returns a row did, else a concurrent add created the item.
+            table = self.model._meta.db_table
+
+            with connection.cursor() as cursor:
+                while True:
+                    cursor.execute(
+                        f"UPDATE {table} SET quantity = quantity + %s WHERE user_id = %s AND product_id = %s "
+                        f"RETURNING id, quantity",
+                        [quantity, user_id, product_id]
+                    )
+                    row = cursor.fetchone()
+
+                    if row is not None:
+                        created = False
+                        break
+
+                    cursor.execute(
+                        f"INSERT INTO {table} (user_id, product_id, quantity) VALUES (%s, %s, %s) "
+                        f"ON CONFLICT (user_id, product_id) DO NOTHING RETURNING id, quantity",
+                        [user_id, product_id, quantity]
+                    )
+                    row = cursor.fetchone()
+
+                    if row is not None:
+                        created = True
+                        break
+
+            cart_item_id, new_quantity = row
+
+            return self.model(id=cart_item_id, user_id=user_id, product_id=product_id, quantity=new_quantity), created
+
+        items = self.filter(user_id=user_id, product_id=product_id)
+
+        if items.update(quantity=F("quantity") + quantity):
+            return items.get(), False
+
+        try:
+            with transaction.atomic():
+                return self.create(user_id=user_id, product_id=product_id, quantity=quantity), True
+        except IntegrityError:
+            # Created by a concurrent request in the meantime, re-raise if user or product is missing
+            if not items.update(quantity=F("quantity") + quantity):
+                raise
+
+            return items.get(), False
+
+    def summary(self, user_id):
+        """
+        Cart totals of user, overall and per store, computed in one GROUP BY query
+
+        Prices are summed as integer thousandths (price decimal places), SQLite stores decimals
+        as floating point and summing them directly would lose digits.
+        """
+
+        decimal_places = Product._meta.get_field("price").decimal_places
+        price_units = Cast(Round(F("product__price") * 10 ** decimal_places), BigIntegerField())
+
+        stores = (
+            self.filter(user_id=user_id)
+            .values(store=F("product__store"))
+            .annotate(
+                item_count=Count("pk"),
+                total_quantity=Sum("quantity"),
+                total_units=Sum(F("quantity") * price_units)
+            )
+            .order_by("store")
+        )
+
+        def to_price(units):
+            return str(Decimal(units).scaleb(-decimal_places))
+
+        summary = {
+            "item_count": 0,
+            "total_quantity": 0,
+            "total_price": 0,
+            "stores": []
+        }
+
+        for store in stores:
+            summary["item_count"] += store["item_count"]
+            summary["total_quantity"] += store["total_quantity"]
+            summary["total_price"] += store["total_units"]
+            summary["stores"].append({
+                "store": store["store"],
+                "item_count": store["item_count"],
+                "total_quantity": store["total_quantity"],
+                "total_price": to_price(store["total_units"])
+            })
+
+        summary["total_price"] = to_price(summary["total_price"])
+
+        return summary
+
+
 class CartItem(models.Model):
     """
     Shopping cart item
@@ -46,3 +181,39 @@ class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="cart")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+
+    objects = CartItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_cart_item_user_product")
+        ]
+
+
+class StoreStats(models.Model):
+    """
+    Denormalized product totals of a store, kept up to date by the product writes (see
+    shofy_api.stats)
+    """
+
+    store = models.OneToOneField(Store, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    product_count = models.BigIntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    # Sum of price * quantity in thousandths (price decimal places), exact unlike SQLite decimals
+    inventory_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a POST request sent with an Idempotency-Key header, replayed to retries of it
+    (see shofy_api.idempotency)
+    """
+
+    # Client hash and Idempotency-Key header (up to 255 characters), see idempotency.scoped_key
+    key = models.CharField(max_length=300, primary_key=True)
+    # Hash of method, path and body, a key can't be reused for a different request
+    fingerprint = models.CharField(max_length=32)
+    status = models.PositiveSmallIntegerField()
+    body = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,144 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidPage(Exception):
+    """
+    Raised when "limit" or "cursor" query parameter can not be used
+    """
+
+
+class CursorPaginator:
+    """
+    Keyset (cursor) pagination
+
+    Rows are ordered by the given column with primary key as tie breaker, the cursor holds
+    the (column, pk) value of the last row on the page, so the next page is fetched with
+    "WHERE (column, pk) > (value, last_pk)" and costs the same no matter how deep it is.
+
+    Query parameters:
+        limit: number of rows per page, capped to max_limit
+        cursor: opaque cursor from "next" of previous response
+    """
+
+    limit_query_param = "limit"
+    cursor_query_param = "cursor"
+
+    def __init__(self, ordering="pk"):
+        self.descending = ordering.startswith("-")
+        self.field = ordering.lstrip("-")
+        self.default_limit = getattr(settings, "API_PAGE_SIZE", 50)
+        self.max_limit = getattr(settings, "API_MAX_PAGE_SIZE", 500)
+
+    def get_limit(self, request):
+        # request.GET works for both DRF and plain Django requests
+        limit = request.GET.get(self.limit_query_param)
+
+        if limit is None:
+            return self.default_limit
+
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise InvalidPage(f"Invalid limit \"{limit}\"")
+
+        if limit < 1:
+            raise InvalidPage(f"Invalid limit \"{limit}\"")
+
+        return min(limit, self.max_limit)
+
+    def encode_cursor(self, row, pk_name):
+        position = [_row_value(row, self.field, pk_name), _row_value(row, "pk", pk_name)]
+        raw = json.dumps(position, cls=DjangoJSONEncoder).encode()
+
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            value, pk = json.loads(raw)
+        except (ValueError, TypeError):
+            raise InvalidPage("Invalid cursor")
+
+        return value, pk
+
+    def order_queryset(self, queryset):
+        prefix = "-" if self.descending else ""
+
+        if self.field == "pk":
+            return queryset.order_by(f"{prefix}pk")
+
+        return queryset.order_by(f"{prefix}{self.field}", f"{prefix}pk")
+
+    def seek(self, queryset, cursor):
+        """
+        Filter queryset to rows after cursor position
+        """
+
+        value, pk = self.decode_cursor(cursor)
+        lookup = "lt" if self.descending else "gt"
+
+        try:
+            if self.field == "pk":
+                return queryset.filter(**{f"pk__{lookup}": pk})
+
+            return queryset.filter(
+                Q(**{f"{self.field}__{lookup}": value}) |
+                Q(**{self.field: value, f"pk__{lookup}": pk})
+            )
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidPage("Invalid cursor")
+
+    def page_queryset(self, queryset, request):
+        """
+        :return: queryset of the requested page plus one extra row and the page limit
+        """
+
+        limit = self.get_limit(request)
+        cursor = request.GET.get(self.cursor_query_param)
+
+        queryset = self.order_queryset(queryset)
+
+        if cursor:
+            queryset = self.seek(queryset, cursor)
+
+        # Fetch one extra row to know if there is a next page without running COUNT(*)
+        return queryset[:limit + 1], limit
+
+    def finish_page(self, rows, limit, queryset):
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, self.encode_cursor(rows[-1], queryset.model._meta.pk.attname)
+
+        return rows, None
+
+    def paginate(self, queryset, request):
+        """
+        :return: rows of the requested page and cursor of next page (None if this is the last page)
+        """
+
+        page, limit = self.page_queryset(queryset, request)
+
+        return self.finish_page(list(page), limit, page)
+
+    async def apaginate(self, queryset, request):
+        """
+        Async version of paginate, rows are read with the async ORM
+        """
+
+        page, limit = self.page_queryset(queryset, request)
+
+        return self.finish_page([row async for row in page], limit, page)
+
+
+def _row_value(row, field, pk_name):
+    if isinstance(row, dict):
+        # Rows from .values() are keyed by column name, not "pk"
+        return row[pk_name if field == "pk" else field]
+
+    return getattr(row, field)
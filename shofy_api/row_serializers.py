@@ -0,0 +1,229 @@
+"""
+Read-only serializers of .values() rows
+
+They produce the same data as the DRF serializers in serializers.py but skip model instances
+and DRF field machinery: the queryset is read with .values() and each row dict is mapped to the
+output dict directly. DRF serializers are still used for validating writes.
+
+Responses can be narrowed with the "fields" query parameter (e.g. "?fields=id,name,price", nested
+fields with a dot: "?fields=id,product.name"), select() returns a serializer of only those
+fields, which also reads only their columns.
+"""
+
+import copy
+
+from shofy_api.metrics import serialize_timer
+
+FIELDS_QUERY_PARAM = "fields"
+
+
+class InvalidFields(Exception):
+    """
+    Raised when "fields" query parameter names a field the response does not have
+    """
+
+
+def decimal_to_string(value):
+    # Same as DRF DecimalField, values from the database are already quantized to decimal_places
+    return None if value is None else f"{value:f}"
+
+
+class RowSerializer:
+    """
+    Fields are (output name, values() lookup) or (output name, values() lookup, converter),
+    or (output name, RowSerializer class) for a nested related object.
+    """
+
+    fields = ()
+
+    def __init__(self, prefix=""):
+        self.columns = []
+        self.nested = {}
+        # Requested field names, empty for all fields
+        self.selection = ()
+
+        for name, source, *converter in self.fields:
+            if isinstance(source, type):
+                nested = self.nested[name] = source(f"{prefix}{name}__")
+                self.columns.append((name, None, nested.to_representation))
+            else:
+                self.columns.append((name, prefix + source, converter[0] if converter else None))
+
+        self.lookups = self.column_lookups()
+
+    def column_lookups(self):
+        lookups = []
+
+        for name, lookup, _ in self.columns:
+            if lookup is None:
+                lookups += self.nested[name].lookups
+            else:
+                lookups.append(lookup)
+
+        return lookups
+
+    def values(self, queryset, *extra):
+        """
+        :param extra: columns to read besides the fields, e.g. the ordering column of a paginator
+        """
+
+        # The primary key is always read, pagination cursors are built from it
+        pk_name = queryset.model._meta.pk.attname
+        lookups = list(self.lookups)
+
+        for name in (pk_name, *extra):
+            name = pk_name if name == "pk" else name
+
+            if name not in lookups:
+                lookups.append(name)
+
+        return queryset.values(*lookups)
+
+    def select(self, fields):
+        """
+        Serializer of only the given fields, in the order of this serializer
+        :param fields: output field names, "name.field" for a field of nested name
+        """
+
+        names = {column[0] for column in self.columns}
+        requested = {}
+
+        for field in fields:
+            name, _, nested_field = field.partition(".")
+
+            if name not in names or (nested_field and name not in self.nested):
+                raise InvalidFields(f"Unknown field \"{field}\"")
+
+            # An empty nested field means the whole nested object
+            requested.setdefault(name, set()).add(nested_field)
+
+        selected = copy.copy(self)
+        selected.columns = []
+        selected.nested = {}
+        selected.selection = tuple(fields)
+
+        for name, lookup, converter in self.columns:
+            if name not in requested:
+                continue
+
+            if lookup is None:
+                nested = self.nested[name]
+
+                if "" not in requested[name]:
+                    nested = nested.select(requested[name])
+
+                selected.nested[name] = nested
+                converter = nested.to_representation
+
+            selected.columns.append((name, lookup, converter))
+
+        selected.lookups = selected.column_lookups()
+
+        return selected
+
+    def for_request(self, request):
+        """
+        Serializer of the fields requested with the "fields" query parameter, self if there is none
+        """
+
+        # request.GET works for both DRF and plain Django requests
+        fields = [field.strip() for field in request.GET.get(FIELDS_QUERY_PARAM, "").split(",")]
+        fields = [field for field in fields if field]
+
+        if not fields:
+            return self
+
+        return self.select(fields)
+
+    def to_representation(self, row):
+        data = {}
+
+        for name, lookup, converter in self.columns:
+            if lookup is None:
+                data[name] = converter(row)
+            elif converter is None:
+                data[name] = row[lookup]
+            else:
+                data[name] = converter(row[lookup])
+
+        return data
+
+    def serialize(self, rows):
+        with serialize_timer():
+            return [self.to_representation(row) for row in rows]
+
+
+class UserRowSerializer(RowSerializer):
+    fields = (
+        ("id", "id"),
+        ("name", "name"),
+        ("username", "username"),
+        ("email", "email"),
+    )
+
+
+class StoreRowSerializer(RowSerializer):
+    fields = (
+        ("user", "user_id"),
+        ("name", "name"),
+        ("location", "location"),
+    )
+
+
+class ProductRowSerializer(RowSerializer):
+    fields = (
+        ("id", "id"),
+        ("name", "name"),
+        ("description", "description"),
+        ("price", "price", decimal_to_string),
+        ("quantity", "quantity"),
+        ("store", "store_id"),
+    )
+
+
+class CartItemRowSerializer(RowSerializer):
+    fields = (
+        ("id", "id"),
+        ("user", UserRowSerializer),
+        ("product", ProductRowSerializer),
+        ("quantity", "quantity"),
+    )
+
+
+class UserDetailRowSerializer(RowSerializer):
+    fields = (
+        ("name", "name"),
+        ("username", "username"),
+        ("email", "email"),
+    )
+
+
+class StoreDetailRowSerializer(RowSerializer):
+    fields = (
+        ("name", "name"),
+        ("location", "location"),
+        ("user", "user"),
+    )
+
+
+class ProductDetailRowSerializer(RowSerializer):
+    fields = (
+        ("id", "id"),
+        ("name", "name"),
+        ("description", "description"),
+        ("price", "price"),
+        ("quantity", "quantity"),
+        ("store", "store"),
+    )
+
+
+user_rows = UserRowSerializer()
+store_rows = StoreRowSerializer()
+product_rows = ProductRowSerializer()
+cart_item_rows = CartItemRowSerializer()
+
+# Detail endpoints keep the model_to_dict() shape. Their lookups are the output names, so the
+# cached data of an entity can be passed to select(...).to_representation() as well
+user_detail_rows = UserDetailRowSerializer()
+store_detail_rows = StoreDetailRowSerializer()
+product_detail_rows = ProductDetailRowSerializer()
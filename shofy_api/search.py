@@ -0,0 +1,159 @@
+"""
+Full-text product search backed by an SQLite FTS5 index
+
+The index is an external content FTS5 table over Product (name, description), it only stores
+the inverted index and reads the text from the product table. Triggers keep it in sync with
+every insert, update and delete of a product, including bulk writes.
+"""
+
+from django.db import connection
+from django.db.models import Q
+
+from shofy_api.models import Product
+from shofy_api.pagination import CursorPaginator
+
+FTS_TABLE = "shofy_api_product_fts"
+
+# bm25 column weights, a match in the name counts more than a match in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON shofy_api_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON shofy_api_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON shofy_api_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+
+def is_supported(connection):
+    return connection.vendor == "sqlite"
+
+
+def install(connection):
+    """
+    Create the FTS5 table and its triggers if they don't exist yet.
+
+    Safe to call repeatedly, SQLite drops triggers when a migration remakes the product table,
+    so this also runs after every migrate (see ShofyApiConfig.ready).
+    """
+
+    if not is_supported(connection):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        exists = cursor.fetchone() is not None
+
+        if not exists:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"name, description, content='shofy_api_product', content_rowid='id', prefix='2 3')"
+            )
+            # Index products created before the search index existed
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def uninstall(connection):
+    if not is_supported(connection):
+        return
+
+    with connection.cursor() as cursor:
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def build_match_query(text):
+    """
+    Turn user input into a safe FTS5 query, every word must match (as a prefix)
+
+    :return: FTS5 query or None if text has no words
+    """
+
+    terms = [term.replace('"', '""') for term in text.split()]
+
+    if not terms:
+        return None
+
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_products(text, request, fields=None):
+    """
+    Search products by name and description, best match first
+
+    :param fields: Product fields (attnames) to read, all when None, others are deferred
+    :return: products of the requested page and cursor of next page
+    """
+
+    match = build_match_query(text)
+
+    if match is None:
+        return [], None
+
+    if not is_supported(connection):
+        return _search_products_fallback(text, request, fields)
+
+    paginator = CursorPaginator("score")
+    limit = paginator.get_limit(request)
+    cursor = request.GET.get(paginator.cursor_query_param)
+
+    score = f"bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})"
+    if fields is None:
+        columns = "p.*"
+    else:
+        # Raw queries need the primary key
+        names = dict.fromkeys(["id", *fields])
+        columns = ", ".join(f"p.{Product._meta.get_field(name).column}" for name in names)
+
+    sql = (
+        f"SELECT {columns}, {score} AS score "
+        f"FROM {FTS_TABLE} JOIN shofy_api_product p ON p.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s"
+    )
+    params = [match]
+
+    if cursor:
+        # bm25 is lower for better matches, continue after the last (score, id) of previous page
+        last_score, last_id = paginator.decode_cursor(cursor)
+        sql += f" AND ({score} > %s OR ({score} = %s AND p.id > %s))"
+        params += [last_score, last_score, last_id]
+
+    sql += " ORDER BY score, p.id LIMIT %s"
+    params.append(limit + 1)
+
+    products = list(Product.objects.raw(sql, params))
+
+    if len(products) > limit:
+        products = products[:limit]
+        return products, paginator.encode_cursor(products[-1], "id")
+
+    return products, None
+
+
+def _search_products_fallback(text, request, fields):
+    queryset = Product.objects.all() if fields is None else Product.objects.only(*fields)
+
+    for term in text.split():
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+
+    return CursorPaginator().paginate(queryset, request)
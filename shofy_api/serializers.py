@@ -1,31 +1,91 @@
 from rest_framework import serializers
+from .metrics import serialize_timer
 from .models import User, Store, Product, CartItem
 
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+
+    @property
+    def data(self):
+        with serialize_timer():
+            return super().data
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    Time spent in .data counts as serialization time of the current request (see metrics),
+    many=True serializers need Meta.list_serializer_class = TimedListSerializer
+    """
+
+    @property
+    def data(self):
+        with serialize_timer():
+            return super().data
+
+
+class UserSerializer(TimedModelSerializer):
 
     class Meta:
         model = User
-        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        exclude = ['updated_at']
+
+
+class UserWriteSerializer(TimedModelSerializer):
+    """
+    User fields without the username / email uniqueness validators (a query per field and row),
+    callers check a batch of users at once
+    """
+
+    class Meta:
+        model = User
+        fields = ['name', 'username', 'email']
+        extra_kwargs = {
+            'username': {'validators': []},
+            'email': {'validators': []}
+        }
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedModelSerializer):
 
     class Meta:
         model = Product
-        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        exclude = ['updated_at']
+
+
+class ProductWriteSerializer(TimedModelSerializer):
+    """
+    Product fields without the store relation, validating it does not query the database
+    """
+
+    class Meta:
+        model = Product
+        fields = ['name', 'description', 'price', 'quantity']
 
 
-class StoreSerializer(serializers.ModelSerializer):
+class StoreWriteSerializer(TimedModelSerializer):
+    """
+    Store fields without the user relation, validating it does not query the database
+    """
+
     class Meta:
         model = Store
-        fields = '__all__'
+        fields = ['name', 'location']
+
+
+class StoreSerializer(TimedModelSerializer):
+    class Meta:
+        model = Store
+        list_serializer_class = TimedListSerializer
+        exclude = ['updated_at']
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedModelSerializer):
     user = UserSerializer()
     product = ProductSerializer()
 
     class Meta:
         model = CartItem
+        list_serializer_class = TimedListSerializer
         fields = '__all__'
@@ -0,0 +1,30 @@
+"""
+SQLite tuning, the SQLITE_PRAGMAS setting is applied to every new database connection
+"""
+
+from django.conf import settings
+
+
+def get_pragmas():
+    return getattr(settings, "SQLITE_PRAGMAS", {})
+
+
+def apply_pragmas(cursor, pragmas):
+    """
+    :param cursor: DB-API cursor of an SQLite connection
+    """
+
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    connection_created signal receiver
+    """
+
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, get_pragmas())
@@ -0,0 +1,194 @@
+"""
+Per store statistics: product count, units in stock and inventory value
+
+Stats are a StoreStats row per store, changed by every product write in the same transaction
+(single create, update, delete, bulk writes and checkout) with one UPDATE of relative amounts per
+store, so reading them is a primary key lookup instead of aggregating the store products.
+
+A store without a row (e.g. created before stats existed, or its products were seeded) gets one
+computed from its products the first time it is read or written. Writes that bypass the API
+(bulk_create, raw SQL) make rows drift, the repair_store_stats command recomputes every row.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import BigIntegerField, Count, F, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+from shofy_api.models import Product, Store, StoreStats
+
+PRICE_DECIMAL_PLACES = Product._meta.get_field("price").decimal_places
+
+FIELDS = ("product_count", "total_quantity", "inventory_value")
+
+
+def to_units(price):
+    """
+    Price as an integer number of thousandths
+    """
+
+    return int(round(Decimal(str(price)).scaleb(PRICE_DECIMAL_PLACES)))
+
+
+def to_price(units):
+    return str(Decimal(units).scaleb(-PRICE_DECIMAL_PLACES))
+
+
+class StoreStatsChanges:
+    """
+    Product changes of a write, summed per store and applied with save()
+    """
+
+    def __init__(self):
+        # store id: [product count, total quantity, inventory value]
+        self.stores = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, store_id, quantity, price, count=1):
+        change = self.stores[store_id]
+        change[0] += count
+        change[1] += quantity
+        change[2] += quantity * to_units(price)
+
+    def remove(self, store_id, quantity, price, count=1):
+        self.add(store_id, -quantity, price, -count)
+
+    def save(self):
+        """
+        Apply the changes, call it after the product writes and in the same transaction
+        """
+
+        # Store id order, concurrent writes lock the rows in the same order
+        changes = [(store_id, *change) for store_id, change in sorted(self.stores.items()) if any(change)]
+        self.stores.clear()
+
+        if not changes:
+            return
+
+        connection = connections[StoreStats.objects.db]
+        table = StoreStats._meta.db_table
+        now = StoreStats._meta.get_field("updated_at").get_db_prep_value(timezone.now(), connection)
+
+        # One statement for all stores of a batch, ORM updates cost ~1ms each to build
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {table} SET product_count = product_count + %s, "
+                f"total_quantity = total_quantity + %s, inventory_value = inventory_value + %s, "
+                f"updated_at = %s WHERE store_id = %s",
+                [(count, quantity, value, now, store_id) for store_id, count, quantity, value in changes]
+            )
+            updated = cursor.rowcount
+
+        if updated < len(changes):
+            store_ids = [store_id for store_id, *_ in changes]
+            existing = set(StoreStats.objects.filter(pk__in=store_ids).values_list("pk", flat=True))
+
+            # Products are already written, computing includes this change
+            recompute(*[store_id for store_id in store_ids if store_id not in existing])
+
+
+def compute(store_ids=None):
+    """
+    Aggregate stats from the products, in one GROUP BY query
+    :param store_ids: stores to compute, all if None
+    :return: {store id: {field: value}}, stores without products are missing
+    """
+
+    price_units = Cast(Round(F("price") * 10 ** PRICE_DECIMAL_PLACES), BigIntegerField())
+    products = Product.objects.all()
+
+    if store_ids is not None:
+        products = products.filter(store_id__in=store_ids)
+
+    rows = (
+        products
+        .values("store_id")
+        .annotate(
+            product_count=Count("pk"),
+            total_quantity=Coalesce(Sum("quantity"), 0),
+            inventory_value=Coalesce(Sum(F("quantity") * price_units), 0)
+        )
+        .order_by()
+    )
+
+    return {row.pop("store_id"): row for row in rows}
+
+
+def recompute(*store_ids):
+    """
+    Replace the stats rows of stores with stats computed from their products
+    :return: the new rows
+    """
+
+    computed = compute(store_ids)
+    zero = dict.fromkeys(FIELDS, 0)
+    rows = [StoreStats(store_id=store_id, **computed.get(store_id, zero)) for store_id in store_ids]
+
+    # INSERT ... ON CONFLICT DO UPDATE, a row created concurrently is overwritten
+    StoreStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["store"],
+        update_fields=[*FIELDS, "updated_at"]
+    )
+
+    return rows
+
+
+def get_store_stats(store_id):
+    """
+    :return: stats of store as response data, raises StoreStats.DoesNotExist if there is no such store
+    """
+
+    try:
+        stats = StoreStats.objects.get(pk=store_id)
+    except StoreStats.DoesNotExist:
+        if not Store.objects.filter(pk=store_id).exists():
+            raise
+
+        stats, = recompute(store_id)
+
+    return {
+        "store_id": stats.store_id,
+        "product_count": stats.product_count,
+        "total_quantity": stats.total_quantity,
+        "inventory_value": to_price(stats.inventory_value),
+        "updated_at": stats.updated_at
+    }
+
+
+def repair(dry_run=False):
+    """
+    Recompute the stats of every store and fix rows that drifted
+
+    :return: list of drifted stores with stored and computed values, missing rows are not drift
+    """
+
+    computed = compute()
+    stored = {stats.store_id: stats for stats in StoreStats.objects.all()}
+    zero = dict.fromkeys(FIELDS, 0)
+    drift = []
+    missing = []
+
+    for store_id in Store.objects.values_list("pk", flat=True).order_by("pk"):
+        values = computed.get(store_id, zero)
+        stats = stored.get(store_id)
+
+        if stats is None:
+            missing.append(StoreStats(store_id=store_id, **values))
+            continue
+
+        current = {field: getattr(stats, field) for field in FIELDS}
+
+        if current != values:
+            drift.append({"store_id": store_id, "stored": current, "computed": values})
+
+            if not dry_run:
+                StoreStats.objects.filter(pk=store_id).update(**values, updated_at=timezone.now())
+
+    if missing and not dry_run:
+        StoreStats.objects.bulk_create(missing, batch_size=1000)
+
+    return drift
@@ -1,3 +1,1788 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from shofy_api import catalog, fastjson, stats
+from shofy_api.compression import CompressionMiddleware, GzipEncoder, negotiate
+from shofy_api.cache import LRUCache, product_cache, store_cache
+from shofy_api.extensions import build_streaming_response
+from shofy_api.metrics import registry
+from shofy_api.models import *
+from shofy_api.row_serializers import cart_item_rows, product_rows, store_rows, user_rows
+from shofy_api.serializers import *
+from shofy_api.throttling import MemoryBackend, Rate
+from shofy_api.urls import urlpatterns
+
+
+class ApiTestCase(TestCase):
+
+    def setUp(self):
+        # Entity cache outlives test transactions, don't leak cached rows between tests
+        caches["entities"].clear()
+
+
+def create_store(username="seller"):
+    user = User.objects.create(name="Seller", username=username, email=f"{username}@mail.com")
+    return Store.objects.create(name="Store", location="Jakarta", user=user)
+
+
+def create_products(store, count, price="1000"):
+    return Product.objects.bulk_create([
+        Product(name=f"Product {i}", description="desc", price=Decimal(price), quantity=10, store=store)
+        for i in range(count)
+    ])
+
+
+class CursorPaginationTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.products = create_products(self.store, 7)
+
+    def test_walk_all_pages(self):
+        ids = []
+        cursor = None
+
+        while True:
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+
+            body = self.client.get("/api/product/", params).json()
+            ids += [product["id"] for product in body["data"]]
+            cursor = body["next"]
+
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, [product.pk for product in self.products])
+
+    def test_deep_page_uses_keyset_not_offset(self):
+        first = self.client.get("/api/product/", {"limit": 3}).json()
+
+        with self.assertNumQueries(1) as ctx:
+            self.client.get("/api/product/", {"limit": 3, "cursor": first["next"]})
+
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertIn(">", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_store_products_paginated(self):
+        body = self.client.get(f"/api/store/{self.store.pk}/products", {"limit": 5}).json()
+
+        self.assertEqual(len(body["data"]), 5)
+        self.assertIsNotNone(body["next"])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get("/api/product/", {"limit": "abc"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/product/", {"limit": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/api/product/", {"cursor": "!!"}).status_code, 400)
+
+
+class CartQueryCountTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        store = create_store()
+        self.products = create_products(store, 10)
+        self.users = User.objects.bulk_create([
+            User(name=f"Buyer {i}", username=f"buyer{i}", email=f"buyer{i}@mail.com")
+            for i in range(10)
+        ])
+
+    def fill_cart(self, count):
+        CartItem.objects.all().delete()
+        CartItem.objects.bulk_create([
+            CartItem(user=self.users[i], product=self.products[i], quantity=1)
+            for i in range(count)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(user=self.users[0], product=product, quantity=1)
+            for product in self.products[1:count]
+        ])
+
+    def test_cart_list_query_count_is_flat(self):
+        for count in (1, 10):
+            self.fill_cart(count)
+
+            with self.assertNumQueries(1):
+                response = self.client.get("/api/cart/")
+
+            self.assertEqual(response.json()["data"][0]["product"]["id"], self.products[0].pk)
+
+    def test_user_cart_query_count_is_flat(self):
+        for count in (1, 10):
+            self.fill_cart(count)
+
+            # user lookup + cart items joined with product
+            with self.assertNumQueries(2):
+                response = self.client.get(f"/api/user/{self.users[0].pk}/cart")
+
+            self.assertEqual(len(response.json()["data"]), count)
+            self.assertEqual(response.json()["data"][0]["user"]["id"], self.users[0].pk)
+
+
+class ProductSearchTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+
+    def post_product(self, name, description):
+        return self.client.post("/api/product/", {
+            "name": name,
+            "description": description,
+            "price": "1000",
+            "quantity": 1,
+            "store_id": self.store.pk
+        }, content_type="application/json").json()["data"]
+
+    def search(self, q, **params):
+        return self.client.get("/api/product/search", {"q": q, **params}).json()
+
+    def test_search_follows_product_writes(self):
+        product = self.post_product("Mechanical keyboard", "Blue switches")
+        self.post_product("Mouse pad", "Large, fits a keyboard and mouse")
+
+        # Name matches rank above description matches
+        self.assertEqual([p["name"] for p in self.search("keyboard")["data"]], ["Mechanical keyboard", "Mouse pad"])
+        self.assertEqual(len(self.search("keyb")["data"]), 2)
+
+        self.client.put(f"/api/product/{product['id']}", {
+            "name": "Office chair",
+            "description": "Ergonomic",
+            "price": "1000",
+            "quantity": 1
+        }, content_type="application/json")
+        self.assertEqual([p["name"] for p in self.search("chair")["data"]], ["Office chair"])
+        self.assertEqual(len(self.search("keyboard")["data"]), 1)
+
+        self.client.delete(f"/api/product/{product['id']}")
+        self.assertEqual(self.search("chair")["data"], [])
+
+    def test_search_pagination(self):
+        create_products(self.store, 5)
+
+        first = self.search("product", limit=3)
+        second = self.search("product", limit=3, cursor=first["next"])
+
+        ids = [p["id"] for p in first["data"] + second["data"]]
+        self.assertEqual(len(set(ids)), 5)
+        self.assertIsNone(second["next"])
+
+    def test_search_syntax_is_escaped(self):
+        self.post_product("Cable", "USB-C")
+
+        self.assertEqual(self.client.get("/api/product/search", {"q": 'usb-c "OR'}).status_code, 200)
+        self.assertEqual(self.search("")["data"], [])
+
+
+class LRUCacheTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache("test", {"OPTIONS": {"MAX_ENTRIES": 2}})
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires_after_timeout(self):
+        cache = LRUCache("test", {})
+        cache.set("a", 1, timeout=-1)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertFalse(cache.has_key("a"))
+
+
+class EntityCacheTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.product = create_products(self.store, 1)[0]
+
+    def test_product_detail_is_cached_until_update(self):
+        url = f"/api/product/{self.product.pk}"
+        hits = product_cache.hits
+
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.json()["data"]["name"], "Product 0")
+        self.assertEqual(product_cache.hits, hits + 1)
+
+        self.client.put(url, {
+            "name": "Renamed",
+            "description": "desc",
+            "price": "1000",
+            "quantity": 1
+        }, content_type="application/json")
+        self.assertEqual(self.client.get(url).json()["data"]["name"], "Renamed")
+
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_peek_and_version_count_hits_and_misses(self):
+        pk = self.product.pk
+        hits, misses = product_cache.hits, product_cache.misses
+
+        self.assertEqual(product_cache.peek_or_load(pk, lambda: ("partial", 1)), ("partial", 1))
+        self.assertEqual(product_cache.get_version(pk, lambda: 1), 1)
+        self.assertEqual((product_cache.hits, product_cache.misses), (hits, misses + 2))
+
+        product_cache.get_or_load(pk, lambda: ("full", 2))
+        self.assertEqual(product_cache.peek_or_load(pk, lambda: ("partial", 1)), ("full", 2))
+        self.assertEqual(product_cache.get_version(pk, lambda: 1), 2)
+        self.assertEqual((product_cache.hits, product_cache.misses), (hits + 2, misses + 3))
+
+    async def test_async_peek_and_version_count_hits_and_misses(self):
+        pk = self.product.pk
+        hits, misses = product_cache.hits, product_cache.misses
+
+        async def partial():
+            return "partial", 1
+
+        async def version():
+            return 1
+
+        self.assertEqual(await product_cache.apeek_or_load(pk, partial), ("partial", 1))
+        self.assertEqual(await product_cache.aget_version(pk, version), 1)
+        self.assertEqual((product_cache.hits, product_cache.misses), (hits, misses + 2))
+
+        product_cache.backend.set(product_cache.key(pk), ("full", 2))
+        self.assertEqual(await product_cache.apeek_or_load(pk, partial), ("full", 2))
+        self.assertEqual(await product_cache.aget_version(pk, version), 2)
+        self.assertEqual((product_cache.hits, product_cache.misses), (hits + 2, misses + 2))
+
+    def test_store_delete_invalidates_store_and_products(self):
+        self.client.get(f"/api/store/{self.store.pk}")
+        self.client.get(f"/api/product/{self.product.pk}")
+
+        self.client.delete(f"/api/store/{self.store.pk}")
+
+        self.assertIsNone(store_cache.backend.get(store_cache.key(self.store.pk)))
+        self.assertEqual(self.client.get(f"/api/store/{self.store.pk}").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/product/{self.product.pk}").status_code, 404)
+
+    def test_user_update_invalidates_user(self):
+        url = f"/api/user/{self.store.pk}"
+        self.client.get(url)
+
+        self.client.put(url, {
+            "name": "Renamed",
+            "username": "seller",
+            "email": "seller@mail.com"
+        }, content_type="application/json")
+
+        self.assertEqual(self.client.get(url).json()["data"]["name"], "Renamed")
+
+
+class ConditionalRequestTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.product = create_products(self.store, 2)[0]
+
+    def test_product_not_modified(self):
+        url = f"/api/product/{self.product.pk}"
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        self.assertIn("Last-Modified", response)
+
+        # Version is answered from the entity cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # Without a cached entry only the version column is read
+        caches["entities"].clear()
+        with self.assertNumQueries(1) as ctx:
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotIn("description", ctx.captured_queries[0]["sql"])
+
+        self.client.put(url, {
+            "name": "Renamed",
+            "description": "desc",
+            "price": "1000",
+            "quantity": 1
+        }, content_type="application/json")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_store_products_not_modified(self):
+        url = f"/api/store/{self.store.pk}/products"
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.delete(f"/api/product/{self.product.pk}")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_user_update_changes_etag(self):
+        url = f"/api/user/{self.store.pk}"
+        etag = self.client.get(url)["ETag"]
+
+        self.client.put(url, {
+            "name": "Renamed",
+            "username": "seller",
+            "email": "seller@mail.com"
+        }, content_type="application/json")
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_update_ignores_conditional_headers(self):
+        url = f"/api/user/{self.store.pk}"
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.put(url, {
+            "name": "Renamed",
+            "username": "seller",
+            "email": "seller@mail.com"
+        }, content_type="application/json", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(pk=self.store.pk).name, "Renamed")
+        self.assertEqual(self.client.put("/api/user/999", {
+            "name": "Renamed",
+            "username": "seller",
+            "email": "seller@mail.com"
+        }, content_type="application/json").status_code, 404)
+
+
+class StreamingListTest(ApiTestCase):
+
+    def test_stream_matches_regular_listing(self):
+        create_products(create_store(), 5)
+
+        response = self.client.get("/api/product/", {"stream": 1})
+        self.assertTrue(response.streaming)
+
+        body = json.loads(b"".join(response.streaming_content))
+        regular = self.client.get("/api/product/").json()
+
+        self.assertEqual(body["data"], regular["data"])
+        self.assertEqual(body["message"], "Product count: 5")
+        self.assertEqual(body["status"], 200)
+
+    def test_stream_in_chunks(self):
+        create_products(create_store(), 5)
+
+        response = build_streaming_response(Product.objects.order_by("pk"), product_rows, str, chunk_size=2)
+        body = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(len(body["data"]), 5)
+        self.assertEqual(body["message"], "5")
+
+    def test_stream_empty_table(self):
+        body = json.loads(b"".join(self.client.get("/api/cart/", {"stream": 1}).streaming_content))
+
+        self.assertEqual(body, {"data": [], "message": "No cart items", "status": 200})
+
+
+class BulkProductTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.products = create_products(self.store, 3)
+
+    def bulk(self, body):
+        return self.client.post("/api/product/bulk", body, content_type="application/json")
+
+    def new_product(self, i, store_id=None):
+        return {
+            "name": f"New {i}",
+            "description": "desc",
+            "price": "2500.5",
+            "quantity": i,
+            "store_id": store_id or self.store.pk
+        }
+
+    def test_create_update_delete(self):
+        response = self.bulk({
+            "create": [self.new_product(i) for i in range(100)],
+            "update": [{"id": self.products[0].pk, "quantity": 99}],
+            "delete": [self.products[1].pk]
+        })
+        data = response.json()["data"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data["created"]), 100)
+        self.assertEqual(data["created"][0]["price"], "2500.500")
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity, 99)
+        self.assertFalse(Product.objects.filter(pk=self.products[1].pk).exists())
+        self.assertEqual(Product.objects.count(), 102)
+
+    def test_query_count_does_not_grow_with_items(self):
+        stats.recompute(self.store.pk)
+
+        # savepoint, store lookup, multi-row insert, store stats update, release
+        for count in (10, 150):
+            with self.assertNumQueries(5):
+                self.bulk({"create": [self.new_product(i) for i in range(count)]})
+
+    def test_invalid_items_abort_whole_batch(self):
+        response = self.bulk({
+            "create": [self.new_product(1), self.new_product(2, store_id=999), {"name": "No price"}],
+            "update": [{"id": 999, "quantity": 1}, {"id": self.products[0].pk, "quantity": -1}],
+            "delete": [999]
+        })
+        errors = response.json()["data"]
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error["operation"], error["index"]) for error in errors],
+            [("create", 2), ("create", 1), ("update", 1), ("update", 0), ("delete", 0)]
+        )
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_update_and_delete_same_product(self):
+        stats.recompute(self.store.pk)
+        product_id = self.products[0].pk
+
+        response = self.bulk({"update": [{"id": product_id, "quantity": 100}], "delete": [product_id]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error["operation"], error["index"]) for error in response.json()["data"]],
+            [("delete", 0)]
+        )
+        self.assertEqual(Product.objects.get(pk=product_id).quantity, 10)
+        self.assertEqual(stats.repair(dry_run=True), [])
+
+    def test_invalid_ids(self):
+        response = self.bulk({
+            "create": [
+                self.new_product(1, store_id=[1]),
+                self.new_product(2, store_id="x"),
+                self.new_product(3, store_id={"id": 1}),
+                {**self.new_product(4), "store_id": True}
+            ],
+            "update": [{"id": "x", "quantity": 1}],
+            "delete": [[1], {"id": 1}, "x", self.products[0].pk]
+        })
+        errors = response.json()["data"]
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error["operation"], error["index"]) for error in errors],
+            [("create", 0), ("create", 1), ("create", 2), ("create", 3), ("update", 0),
+             ("delete", 0), ("delete", 1), ("delete", 2)]
+        )
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class UniqueUserTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+
+    def test_username_and_email_are_unique(self):
+        user = {"name": "Other", "username": "seller", "email": "other@mail.com"}
+
+        response = self.client.post("/api/user/", user, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post("/api/user/", {**user, "username": "other"}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        other_id = response.json()["data"]["id"]
+
+        # Keeping its own username is fine, taking the one of another user is not
+        response = self.client.put(f"/api/user/{self.store.pk}", {
+            "name": "Renamed", "username": "seller", "email": "seller@mail.com"
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.put(f"/api/user/{other_id}", {
+            "name": "Other", "username": "other", "email": "seller@mail.com"
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.get(pk=other_id).email, "other@mail.com")
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create(name="Copy", username="copy", email="seller@mail.com")
+
+
+class CartUpsertTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = create_products(create_store(), 1)[0]
+        self.user = User.objects.create(name="Buyer", username="buyer", email="buyer@mail.com")
+
+    def add(self, quantity, user_id=None, product_id=None):
+        return self.client.post("/api/cart/", {
+            "user_id": user_id or self.user.pk,
+            "product_id": product_id or self.product.pk,
+            "quantity": quantity
+        }, content_type="application/json")
+
+    def test_create_then_increment(self):
+        response = self.add(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["quantity"], 2)
+
+        # user, product, upsert
+        with self.assertNumQueries(3):
+            response = self.add(3)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["quantity"], 5)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+    def test_existing_empty_item_is_not_created(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=0)
+
+        response = self.add(2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["quantity"], 2)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_missing_user_or_product(self):
+        self.assertEqual(self.add(1, user_id=999).status_code, 404)
+        self.assertEqual(self.add(1, product_id=999).status_code, 404)
+        self.assertEqual(self.add(0).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartUpsertConcurrencyTest(TransactionTestCase):
+
+    def test_parallel_adds_are_not_lost(self):
+        product = create_products(create_store(), 1)[0]
+        user = User.objects.create(name="Buyer", username="buyer", email="buyer@mail.com")
+        threads, adds_per_thread = 8, 10
+
+        def add_many(_):
+            try:
+                for _ in range(adds_per_thread):
+                    response = self.client_class().post("/api/cart/", {
+                        "user_id": user.pk,
+                        "product_id": product.pk,
+                        "quantity": 1
+                    }, content_type="application/json")
+                    self.assertIn(response.status_code, (200, 201))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(add_many, range(threads)))
+
+        self.assertEqual(list(CartItem.objects.values_list("quantity", flat=True)), [threads * adds_per_thread])
+
+
+class CartSummaryTest(ApiTestCase):
+
+    def test_totals_keep_decimal_precision(self):
+        first = create_store("first")
+        second = create_store("second")
+        cheap = create_products(first, 1, price="0.1")[0]
+        pricey = create_products(second, 1, price="999999999.999")[0]
+        user = User.objects.create(name="Buyer", username="buyer", email="buyer@mail.com")
+        CartItem.objects.create(user=user, product=cheap, quantity=3)
+        CartItem.objects.create(user=user, product=pricey, quantity=7)
+
+        # user check + one aggregate query
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/user/{user.pk}/cart/summary")
+
+        summary = response.json()["data"]
+        self.assertEqual(summary["item_count"], 2)
+        self.assertEqual(summary["total_quantity"], 10)
+        self.assertEqual(summary["total_price"], "7000000000.293")
+        self.assertEqual(
+            [(store["store"], store["total_price"]) for store in summary["stores"]],
+            [(first.pk, "0.300"), (second.pk, "6999999999.993")]
+        )
+
+    def test_empty_cart_and_missing_user(self):
+        user = User.objects.create(name="Buyer", username="buyer", email="buyer@mail.com")
+
+        summary = self.client.get(f"/api/user/{user.pk}/cart/summary").json()["data"]
+        self.assertEqual(summary, {"item_count": 0, "total_quantity": 0, "total_price": "0.000", "stores": []})
+        self.assertEqual(self.client.get("/api/user/999/cart/summary").status_code, 404)
+
+
+class AsyncViewTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.products = create_products(self.store, 3)
+        CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=2)
+
+    async def test_async_views_match_sync_views(self):
+        cart_item = await CartItem.objects.aget()
+        paths = [
+            "user/", f"user/{self.store.pk}", f"user/{self.store.pk}/cart", "user/999",
+            "store/", f"store/{self.store.pk}", f"store/{self.store.pk}/products", "store/999",
+            "product/?limit=2", f"product/{self.products[0].pk}", "product/999",
+            "cart/", f"cart/{cart_item.pk}", "cart/999",
+        ]
+
+        for path in paths:
+            expected = await self.async_client.get(f"/api/{path}")
+            actual = await self.async_client.get(f"/api/async/{path}")
+
+            self.assertEqual(actual.status_code, expected.status_code, path)
+            self.assertEqual(actual.json(), expected.json(), path)
+
+    async def test_async_detail_not_modified(self):
+        for path in (f"user/{self.store.pk}", f"store/{self.store.pk}", f"product/{self.products[0].pk}?fields=id,name"):
+            expected = await self.async_client.get(f"/api/{path}")
+            actual = await self.async_client.get(f"/api/async/{path}")
+
+            self.assertEqual(actual["ETag"], expected["ETag"], path)
+            self.assertEqual(actual["Last-Modified"], expected["Last-Modified"], path)
+
+            response = await self.async_client.get(f"/api/async/{path}", headers={"If-None-Match": actual["ETag"]})
+
+            self.assertEqual(response.status_code, 304, path)
+            self.assertEqual(response.content, b"", path)
+
+
+class SQLitePragmaTest(TestCase):
+
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class QueryPlanTest(ApiTestCase):
+    """
+    Every query issued by the endpoints must use an index, a full table scan fails the test.
+    List endpoints are requested with a cursor, so they seek by primary key too.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.other_store = create_store("other")
+        self.products = create_products(self.store, 3)
+        self.cart_item = CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=1)
+
+    def cursor(self, path):
+        return self.client.get(f"/api/{path}?limit=1").json()["next"]
+
+    def query_plans(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            request()
+
+        plans = []
+
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query["sql"].split(" ", 1)[0] not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+                    continue
+
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append((query["sql"], [row[-1] for row in cursor.fetchall()]))
+
+        return plans
+
+    def assertNoTableScan(self, request, name):
+        for sql, plan in self.query_plans(request):
+            for detail in plan:
+                # SCAN is a full pass over a table or index, SEARCH seeks it
+                is_scan = detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail
+
+                self.assertFalse(is_scan, f"{name}: {detail}\n{sql}")
+
+    def test_read_endpoints(self):
+        user_id, product_id = self.store.pk, self.products[0].pk
+        paths = [
+            f"user/?cursor={self.cursor('user/')}",
+            "user/?username=seller",
+            "user/?email=seller@mail.com",
+            f"user/{user_id}",
+            f"user/{user_id}/cart",
+            f"user/{user_id}/cart?cursor={self.cursor(f'user/{user_id}/cart')}",
+            f"user/{user_id}/cart/summary",
+            f"store/?cursor={self.cursor('store/')}",
+            f"store/{user_id}",
+            f"store/{user_id}/products",
+            f"store/{user_id}/products?cursor={self.cursor(f'store/{user_id}/products')}",
+            f"product/?cursor={self.cursor('product/')}",
+            f"product/{product_id}",
+            "product/search?q=product",
+            f"cart/?cursor={self.cursor('cart/')}",
+            f"cart/{self.cart_item.pk}",
+        ]
+
+        for path in paths:
+            for prefix in ("/api/", "/api/async/"):
+                if prefix == "/api/async/" and ("summary" in path or "search" in path):
+                    continue
+
+                caches["entities"].clear()
+                self.assertNoTableScan(lambda: self.client.get(f"{prefix}{path}"), f"GET {prefix}{path}")
+
+    def test_store_products_by_price(self):
+        queryset = Product.objects.filter(store=self.store).order_by("price", "pk")
+        plan = self.query_plans(lambda: list(queryset))[0][1]
+
+        self.assertEqual(plan, ["SEARCH shofy_api_product USING INDEX product_store_price_idx (store_id=?)"])
+
+    def test_product_filters(self):
+        store_id = self.store.pk
+        indexes = {
+            "min_price=10&max_price=2000&ordering=price": "product_price_idx",
+            "in_stock=1&max_price=2000&ordering=-price": "product_in_stock_price_idx",
+            f"store={store_id}&in_stock=1&ordering=price": "product_store_price_idx",
+            f"store={store_id}&min_price=10": "product_store_price_idx",
+            "name_prefix=prod": "product_name_nocase_idx",
+        }
+
+        for query, index in indexes.items():
+            for prefix in ("/api/product/", "/api/async/product/", f"/api/store/{store_id}/products"):
+                separator = "&" if "?" in prefix else "?"
+                plans = self.query_plans(lambda: self.client.get(f"{prefix}{separator}{query}"))
+                details = [detail for _, plan in plans for detail in plan]
+
+                if prefix.startswith("/api/store/"):
+                    # Also filtered by store, any product index is fine
+                    index = "INDEX "
+
+                self.assertTrue(any(index in detail for detail in details), f"{prefix} {query}: {details}")
+                self.assertFalse(any(detail.startswith("SCAN ") for detail in details), f"{prefix} {query}: {details}")
+
+    def test_filter_users(self):
+        data = self.client.get("/api/user/?username=other").json()["data"]
+        self.assertEqual([user["username"] for user in data], ["other"])
+
+        data = self.client.get("/api/async/user/?email=seller@mail.com").json()["data"]
+        self.assertEqual([user["username"] for user in data], ["seller"])
+
+    def test_write_endpoints(self):
+        user_id, product_id = self.store.pk, self.products[1].pk
+        product = {"name": "New", "description": "desc", "price": "10.000", "quantity": 5}
+        requests = {
+            "POST /api/cart/": lambda: self.client.post(
+                "/api/cart/", {"user_id": user_id, "product_id": product_id, "quantity": 2},
+                content_type="application/json"
+            ),
+            "POST /api/product/": lambda: self.client.post(
+                "/api/product/", {**product, "store_id": user_id}, content_type="application/json"
+            ),
+            "PUT /api/product/{id}": lambda: self.client.put(
+                f"/api/product/{product_id}", product, content_type="application/json"
+            ),
+            "POST /api/product/bulk": lambda: self.client.post(
+                "/api/product/bulk",
+                {"create": [{**product, "store_id": user_id}], "update": [{"id": product_id, "quantity": 1}]},
+                content_type="application/json"
+            ),
+            "POST /api/user/{id}/checkout": lambda: self.client.post(f"/api/user/{user_id}/checkout"),
+            "DELETE /api/product/{id}": lambda: self.client.delete(f"/api/product/{product_id}"),
+            "DELETE /api/user/{id}": lambda: self.client.delete(f"/api/user/{self.other_store.pk}"),
+        }
+
+        for name, request in requests.items():
+            self.assertNoTableScan(request, name)
+
+
+class SeedCommandTest(ApiTestCase):
+
+    def test_seed(self):
+        call_command("seed", "--products=200", "--cart-items=150", "--batch-size=64", stdout=io.StringIO())
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Store.objects.count(), 10)
+        self.assertEqual(Product.objects.count(), 200)
+        self.assertEqual(CartItem.objects.count(), 150)
+        self.assertEqual(CartItem.objects.values("user", "product").distinct().count(), 150)
+        self.assertEqual(Product.objects.values("store").distinct().count(), 10)
+
+        # Seeded products are searchable
+        self.assertTrue(self.client.get("/api/product/search?q=lamp").json()["data"])
+
+        call_command("seed", "--products=1k", "--flush", stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 1000)
+        self.assertEqual(User.objects.count(), 100)
+
+
+class BenchApiCommandTest(ApiTestCase):
+
+    def test_every_route_is_benchmarked(self):
+        call_command("seed", "--products=100", stdout=io.StringIO())
+        cart_item_count = CartItem.objects.count()
+
+        stdout = io.StringIO()
+        call_command("bench_api", requests=2, warmup=0, json=True, stdout=stdout)
+        results = json.loads(stdout.getvalue())["results"]
+
+        benchmarked_routes = {result["route"] for result in results}
+        self.assertEqual(benchmarked_routes, {f"/api/{pattern.pattern}" for pattern in urlpatterns})
+
+        for result in results:
+            self.assertTrue(all(code < 400 for code in result["status_codes"]), result)
+
+        # Writes were rolled back
+        self.assertEqual(CartItem.objects.count(), cart_item_count)
+
+
+class MetricsTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        self.store = create_store()
+        self.products = create_products(self.store, 2)
+        CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=1)
+
+    def server_timing(self, response):
+        return dict(
+            metric.split(";", 1) for metric in response["Server-Timing"].split(", ")
+        )
+
+    def test_server_timing(self):
+        timing = self.server_timing(self.client.get(f"/api/user/{self.store.pk}/cart"))
+
+        self.assertEqual(set(timing), {"db", "serialize", "render", "total"})
+        self.assertIn('desc="2 queries"', timing["db"])
+
+    async def test_server_timing_counts_async_view_queries(self):
+        timing = self.server_timing(await self.async_client.get(f"/api/async/user/{self.store.pk}/cart"))
+
+        self.assertIn('desc="2 queries"', timing["db"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(f"/api/user/{self.store.pk}/cart")
+        self.client.get(f"/api/user/{self.store.pk}/cart")
+        self.client.get("/api/user/999/cart")
+
+        response = self.client.get("/metrics")
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        lines = response.content.decode().splitlines()
+        labels = 'method="GET",route="/api/user/<int:user_id>/cart"'
+
+        self.assertIn(f'shofy_http_requests_total{{{labels},status="200"}} 2', lines)
+        self.assertIn(f'shofy_http_requests_total{{{labels},status="404"}} 1', lines)
+        self.assertIn(f'shofy_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', lines)
+        self.assertIn(f'shofy_http_request_duration_seconds_count{{{labels}}} 3', lines)
+        self.assertIn(f'shofy_db_queries_total{{{labels}}} 5', lines)
+
+    @override_settings(API_METRICS_ALLOWED_IPS=["10.0.0.1"], API_METRICS_TOKEN="secret")
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+        with override_settings(API_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+
+class RowSerializerTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        create_products(self.store, 3, price="1234.5")
+        CartItem.objects.create(user=self.store.user, product=Product.objects.first(), quantity=2)
+
+    def test_same_data_as_model_serializers(self):
+        cases = [
+            (User.objects.all(), UserSerializer, user_rows),
+            (Store.objects.all(), StoreSerializer, store_rows),
+            (Product.objects.all(), ProductSerializer, product_rows),
+            (CartItem.objects.all(), CartItemSerializer, cart_item_rows),
+        ]
+
+        for queryset, serializer_class, row_serializer in cases:
+            expected = serializer_class(queryset.order_by("pk"), many=True).data
+            actual = row_serializer.serialize(row_serializer.values(queryset.order_by("pk")))
+
+            self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_single_row_queries(self):
+        cart_item_id = CartItem.objects.get().pk
+
+        with self.assertNumQueries(1):
+            self.client.get(f"/api/cart/{cart_item_id}")
+
+        # Detail responses keep the model_to_dict() shape
+        product = Product.objects.first()
+        data = self.client.get(f"/api/product/{product.pk}").json()["data"]
+        self.assertEqual(data, {
+            "id": product.pk, "name": "Product 0", "description": "desc", "price": "1234.500", "quantity": 10,
+            "store": self.store.pk
+        })
+
+
+class FastJSONTest(ApiTestCase):
+    data = {
+        "message": "Büyük mağaza",
+        "price": Decimal("1234.50"),
+        "created": datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc),
+        "items": [{"id": 1, "quantity": None, "ok": True}],
+    }
+
+    def test_same_output_as_drf(self):
+        # Decimals are encoded like DecimalField, DRF's encoder would write a float
+        expected = JSONRenderer().render({**self.data, "price": "1234.50"})
+
+        self.assertEqual(fastjson.FastJSONRenderer().render(self.data), expected)
+
+        with mock.patch.object(fastjson, "orjson", None):
+            self.assertEqual(fastjson.FastJSONRenderer().render(self.data), expected)
+
+    def test_decimal_precision(self):
+        data = {"small": Decimal("0.1"), "big": Decimal("12345678901234567.89")}
+
+        # One JSON type for every Decimal, whatever its digits
+        self.assertEqual(fastjson.dumps(data), b'{"small":"0.1","big":"12345678901234567.89"}')
+
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "COERCE_DECIMAL_TO_STRING": False}):
+            self.assertEqual(json.loads(fastjson.dumps(data)), {"small": 0.1, "big": 12345678901234567.89})
+
+            with mock.patch.object(fastjson, "orjson", None):
+                self.assertEqual(json.loads(fastjson.dumps(data)), {"small": 0.1, "big": 12345678901234567.89})
+
+        self.assertEqual(fastjson.loads(b'{"small":0.1}'), {"small": 0.1})
+        # A number a float can not hold switches the whole body to Decimal floats
+        parsed = fastjson.loads(b'{"small":0.1,"big":12345678901234567.89}')
+        self.assertEqual(parsed, {"small": Decimal("0.1"), "big": Decimal("12345678901234567.89")})
+
+    def test_invalid_body(self):
+        response = self.client.post("/api/product/", b'{"name": ', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post("/api/product/", b'{"price": NaN}', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.products = create_products(self.store, 3)
+        CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=2)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        return response, " ".join(query["sql"] for query in queries)
+
+    def test_list_reads_only_selected_columns(self):
+        response, sql = self.get("/api/product/?fields=name,id,price&limit=2")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()["data"][0]), ["id", "name", "price"])
+        self.assertNotIn("description", sql)
+
+        # Pagination still works without the primary key in the response
+        response = self.client.get("/api/product/?fields=name&limit=2")
+        self.assertEqual(response.json()["data"], [{"name": "Product 0"}, {"name": "Product 1"}])
+        cursor = response.json()["next"]
+        response = self.client.get(f"/api/product/?fields=name&limit=2&cursor={cursor}")
+        self.assertEqual(response.json()["data"], [{"name": "Product 2"}])
+
+    def test_nested_fields(self):
+        response, sql = self.get(f"/api/user/{self.store.user.pk}/cart?fields=quantity,product.name")
+
+        self.assertEqual(response.json()["data"], [{"product": {"name": "Product 0"}, "quantity": 2}])
+        # No user fields requested, so no join with the user table
+        self.assertNotIn("JOIN \"shofy_api_user\"", sql)
+
+    def test_detail(self):
+        url = f"/api/product/{self.products[0].pk}"
+
+        # Partial reads don't fill the entity cache
+        response, sql = self.get(f"{url}?fields=name,price")
+        self.assertEqual(response.json()["data"], {"name": "Product 0", "price": "1000.000"})
+        self.assertNotIn("description", sql)
+        self.assertIsNone(product_cache.backend.get(product_cache.key(self.products[0].pk)))
+
+        full = self.client.get(url)
+
+        # Once cached, the cached product is projected without a query
+        with self.assertNumQueries(0):
+            response = self.client.get(f"{url}?fields=name,price")
+
+        self.assertEqual(response.json()["data"], {"name": "Product 0", "price": "1000.000"})
+        self.assertNotEqual(response["ETag"], full["ETag"])
+
+    def test_search(self):
+        response, sql = self.get("/api/product/search?q=product&fields=name&limit=1")
+
+        self.assertEqual(response.json()["data"], [{"name": "Product 0"}])
+        self.assertNotIn("description", sql.split("FROM")[0])
+
+    def test_unknown_field(self):
+        for url in ("/api/product/?fields=secret", f"/api/product/{self.products[0].pk}?fields=store.name",
+                    "/api/async/cart/?fields=user.password"):
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Unknown field", response.json()["message"])
+
+
+class ProductFilterTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.other_store = create_store("other")
+        Product.objects.bulk_create([
+            Product(name=name, description="desc", price=Decimal(price), quantity=quantity, store=store)
+            for name, price, quantity, store in [
+                ("Red lamp", "150", 3, self.store),
+                ("red chair", "90", 0, self.store),
+                ("Blue lamp", "150", 1, self.store),
+                ("Green desk", "40", 7, self.other_store),
+                ("Rocket", "999", 2, self.other_store),
+            ]
+        ])
+
+    def names(self, query, pages=False):
+        response = self.client.get(f"/api/product/?fields=name&{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        names = [product["name"] for product in response.json()["data"]]
+
+        while pages and response.json()["next"]:
+            response = self.client.get(f"/api/product/?fields=name&{query}&cursor={response.json()['next']}")
+            names += [product["name"] for product in response.json()["data"]]
+
+        return names
+
+    def test_filters(self):
+        self.assertEqual(self.names(f"store={self.other_store.pk}"), ["Green desk", "Rocket"])
+        self.assertEqual(self.names("min_price=90&max_price=150"), ["Red lamp", "red chair", "Blue lamp"])
+        self.assertEqual(self.names("in_stock=1&max_price=150"), ["Red lamp", "Blue lamp", "Green desk"])
+        self.assertEqual(self.names("in_stock=false"), ["red chair"])
+        self.assertEqual(self.names("name_prefix=RED"), ["Red lamp", "red chair"])
+        self.assertEqual(self.names(f"store={self.store.pk}&in_stock=1&name_prefix=blue"), ["Blue lamp"])
+
+    def test_ordering_with_pagination(self):
+        # Equal prices are ordered by id, no product is skipped or repeated across pages
+        self.assertEqual(
+            self.names("ordering=price&limit=2", pages=True),
+            ["Green desk", "red chair", "Red lamp", "Blue lamp", "Rocket"]
+        )
+        self.assertEqual(
+            self.names("ordering=-price&in_stock=1&limit=1", pages=True),
+            ["Rocket", "Blue lamp", "Red lamp", "Green desk"]
+        )
+
+        data = self.client.get(f"/api/async/store/{self.store.pk}/products?ordering=-price&limit=5").json()["data"]
+        self.assertEqual([product["name"] for product in data], ["Blue lamp", "Red lamp", "red chair"])
+
+    def test_invalid(self):
+        for query in ("ordering=description", "min_price=cheap", "max_price=Infinity", "store=first", "in_stock=2"):
+            for prefix in ("/api/product/", "/api/async/product/"):
+                response = self.client.get(f"{prefix}?{query}")
+
+                self.assertEqual(response.status_code, 400, query)
+
+
+class CheckoutTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.lamp, self.desk = create_products(self.store, 2, price="12.500")
+        self.user = User.objects.create(name="Buyer", username="buyer", email="buyer@mail.com")
+        CartItem.objects.create(user=self.user, product=self.lamp, quantity=3)
+        CartItem.objects.create(user=self.user, product=self.desk, quantity=10)
+
+    def checkout(self, user_id=None):
+        return self.client.post(f"/api/user/{user_id or self.user.pk}/checkout")
+
+    def test_checkout(self):
+        # Cached product must show the new stock after checkout
+        self.client.get(f"/api/product/{self.lamp.pk}")
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], {
+            "items": [
+                {"product_id": self.lamp.pk, "quantity": 3, "price": "12.500", "total_price": "37.500"},
+                {"product_id": self.desk.pk, "quantity": 10, "price": "12.500", "total_price": "125.000"},
+            ],
+            "total_quantity": 13,
+            "total_price": "162.500"
+        })
+        self.assertEqual(dict(Product.objects.values_list("pk", "quantity")), {self.lamp.pk: 7, self.desk.pk: 0})
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(self.client.get(f"/api/product/{self.lamp.pk}").json()["data"]["quantity"], 7)
+
+        self.assertEqual(self.checkout().status_code, 400)
+
+    def test_insufficient_stock(self):
+        Product.objects.filter(pk=self.desk.pk).update(quantity=4)
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["data"], [{"product_id": self.desk.pk, "requested": 10, "available": 4}])
+        # All or nothing, the lamp stock taken before the desk was short is restored
+        self.assertEqual(dict(Product.objects.values_list("pk", "quantity")), {self.lamp.pk: 10, self.desk.pk: 4})
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_unknown_user(self):
+        self.assertEqual(self.checkout(user_id=999).status_code, 404)
+
+
+class CheckoutConcurrencyTest(TransactionTestCase):
+
+    def test_no_overselling(self):
+        store = create_store()
+        hot, plenty = create_products(store, 2)
+        Product.objects.filter(pk=hot.pk).update(quantity=20)
+        Product.objects.filter(pk=plenty.pk).update(quantity=1000)
+
+        users = User.objects.bulk_create([
+            User(name=f"Buyer {i}", username=f"buyer{i}", email=f"buyer{i}@mail.com") for i in range(30)
+        ])
+        requested = {}
+
+        for i, user in enumerate(users):
+            requested[user.pk] = i % 3 + 1
+            # Every cart has both products, concurrent checkouts update the same rows
+            CartItem.objects.create(user=user, product=hot, quantity=requested[user.pk])
+            CartItem.objects.create(user=user, product=plenty, quantity=1)
+
+        def buy(user):
+            try:
+                return user.pk, self.client_class().post(f"/api/user/{user.pk}/checkout").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(8) as executor:
+            results = dict(executor.map(buy, users))
+
+        self.assertEqual(set(results.values()) - {200, 409}, set())
+
+        bought = [user_id for user_id, status_code in results.items() if status_code == 200]
+        sold = sum(requested[user_id] for user_id in bought)
+
+        self.assertLessEqual(sold, 20)
+        self.assertEqual(Product.objects.get(pk=hot.pk).quantity, 20 - sold)
+        self.assertEqual(Product.objects.get(pk=plenty.pk).quantity, 1000 - len(bought))
+        # Stock left is less than any rejected buyer asked for
+        for user_id, status_code in results.items():
+            if status_code == 409:
+                self.assertGreater(requested[user_id], 20 - sold)
+        self.assertEqual(CartItem.objects.count(), 2 * (len(users) - len(bought)))
+
+
+class ThrottleTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.store = create_store()
+        self.product = create_products(self.store, 1)[0]
+
+    def get(self, path, client=None, **extra):
+        return (client or self.client).get(path, **extra)
+
+    @override_settings(API_THROTTLE_RATES={"GET /api/product/": (1, 2), "*": (100, 100)})
+    def test_rate_per_client_and_route(self):
+        self.assertEqual(self.get("/api/product/").status_code, 200)
+        self.assertEqual(self.get("/api/product/").status_code, 200)
+
+        response = self.get("/api/product/")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(response.json(), {"message": "Too many requests", "status": 429, "data": None})
+
+        # Other routes, methods and clients have their own buckets
+        self.assertEqual(self.get(f"/api/product/{self.product.pk}").status_code, 200)
+        self.assertEqual(self.get("/api/product/", REMOTE_ADDR="10.0.0.2").status_code, 200)
+        self.assertEqual(self.client.head("/api/product/").status_code, 200)
+
+    @override_settings(API_THROTTLE_RATES={"/api/product/": (1, 1)}, API_THROTTLE_NUM_PROXIES=1)
+    def test_forwarded_for(self):
+        self.assertEqual(self.get("/api/product/", HTTP_X_FORWARDED_FOR="1.1.1.1, 10.0.0.1").status_code, 200)
+        # Only the address added by our proxy counts, the client can't forge a new one
+        self.assertEqual(self.get("/api/product/", HTTP_X_FORWARDED_FOR="2.2.2.2, 10.0.0.1").status_code, 429)
+        self.assertEqual(self.get("/api/product/", HTTP_X_FORWARDED_FOR="10.0.0.2").status_code, 200)
+
+    @override_settings(API_THROTTLE_RATES={"*": (1, 2)}, API_THROTTLE_BACKEND="cache")
+    def test_cache_backend_is_shared(self):
+        other = self.client_class()
+
+        self.assertEqual(self.get("/api/product/").status_code, 200)
+        self.assertEqual(self.get("/api/product/", client=other).status_code, 200)
+        # Separate middleware instances, like separate processes, share the bucket
+        self.assertEqual(self.get("/api/product/").status_code, 429)
+        self.assertEqual(self.get("/api/product/", client=other).status_code, 429)
+
+    @override_settings(API_THROTTLE_RATES={"*": (1, 1)})
+    async def test_async_views(self):
+        self.assertEqual((await self.async_client.get("/api/async/product/")).status_code, 200)
+        self.assertEqual((await self.async_client.get("/api/async/product/")).status_code, 429)
+
+    def test_refill(self):
+        backend = MemoryBackend()
+        rate = Rate(10, 2)
+
+        with mock.patch("shofy_api.throttling.time.monotonic", return_value=100.0) as monotonic:
+            self.assertEqual(backend.take("key", rate), 0)
+            self.assertEqual(backend.take("key", rate), 0)
+            self.assertAlmostEqual(backend.take("key", rate), 0.1)
+            # Rejected requests don't take tokens
+            self.assertAlmostEqual(backend.take("key", rate), 0.1)
+
+            monotonic.return_value = 100.1
+            self.assertEqual(backend.take("key", rate), 0)
+            self.assertGreater(backend.take("key", rate), 0)
+
+            # Idle buckets fill up to burst, not beyond
+            monotonic.return_value = 200.0
+            self.assertEqual(backend.take("key", rate), 0)
+            self.assertEqual(backend.take("key", rate), 0)
+            self.assertGreater(backend.take("key", rate), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        backend = MemoryBackend(max_entries=2)
+        rate = Rate(1, 10)
+
+        for key in ("a", "b", "a", "c"):
+            backend.take(key, rate)
+
+        self.assertEqual(list(backend.buckets), ["a", "c"])
+
+
+class IdempotencyTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.product = create_products(self.store, 1)[0]
+        self.body = {"user_id": self.store.pk, "product_id": self.product.pk, "quantity": 2}
+
+    def add_to_cart(self, key, **body):
+        return self.client.post(
+            "/api/cart/", {**self.body, **body}, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_response(self):
+        response = self.add_to_cart("key-1")
+
+        with self.assertNumQueries(1):
+            replayed = self.add_to_cart("key-1")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed.json(), response.json())
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+        # A new key is a new request
+        self.assertEqual(self.add_to_cart("key-2").status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_key_reused_for_different_request(self):
+        self.add_to_cart("key-1")
+
+        self.assertEqual(self.add_to_cart("key-1", quantity=5).status_code, 422)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_failed_requests_are_not_stored(self):
+        self.assertEqual(self.add_to_cart("key-1", quantity=0).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.add_to_cart("key-1").status_code, 201)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.add_to_cart("").status_code, 400)
+        self.assertEqual(self.add_to_cart("k" * 256).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_without_key(self):
+        self.client.post("/api/cart/", self.body, content_type="application/json")
+        self.client.post("/api/cart/", self.body, content_type="application/json")
+
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_keys(self):
+        self.add_to_cart("key-1")
+
+        with override_settings(API_IDEMPOTENCY_TTL=0):
+            self.assertEqual(self.add_to_cart("key-1").status_code, 200)
+            self.assertEqual(CartItem.objects.get().quantity, 4)
+
+            out = io.StringIO()
+            call_command("purge_idempotency_keys", stdout=out)
+
+        self.assertIn("Deleted 1 expired", out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_scoped_to_the_client(self):
+        self.add_to_cart("key-1")
+
+        response = self.client.post(
+            "/api/cart/", self.body, content_type="application/json", HTTP_IDEMPOTENCY_KEY="key-1",
+            REMOTE_ADDR="10.0.0.2"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_cache_invalidated_after_commit(self):
+        key = product_cache.key(self.product.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f"/api/product/{self.product.pk}", {
+                "name": "Desk", "description": "desc", "price": "20", "quantity": 1
+            }, content_type="application/json")
+            # A concurrent reader caches the row before the update commits
+            product_cache.backend.set(key, ({"name": "Product 0"}, self.product.updated_at))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(product_cache.backend.get(key))
+
+    def test_product_create(self):
+        body = {"name": "Lamp", "description": "desc", "price": "12.500", "quantity": 3, "store_id": self.store.pk}
+
+        for _ in range(2):
+            response = self.client.post("/api/product/", body, content_type="application/json",
+                                        HTTP_IDEMPOTENCY_KEY="create-lamp")
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(Product.objects.filter(name="Lamp").count(), 1)
+
+
+class IdempotencyConcurrencyTest(TransactionTestCase):
+
+    def test_concurrent_retries_add_once(self):
+        store = create_store()
+        product = create_products(store, 1)[0]
+        body = {"user_id": store.pk, "product_id": product.pk, "quantity": 1}
+
+        def add(_):
+            try:
+                return self.client_class().post(
+                    "/api/cart/", body, content_type="application/json", HTTP_IDEMPOTENCY_KEY="retry"
+                ).json()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(add, range(16)))
+
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertTrue(all(response == responses[0] for response in responses))
+
+
+class StoreStatsTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        # Created without the API, stats are computed on first access
+        self.products = create_products(self.store, 2, price="12.500")
+
+    def get_stats(self, store_id=None):
+        return self.client.get(f"/api/store/{store_id or self.store.pk}/stats")
+
+    def assertStats(self, product_count, total_quantity, inventory_value):
+        data = self.get_stats().json()["data"]
+
+        self.assertEqual(
+            (data["product_count"], data["total_quantity"], data["inventory_value"]),
+            (product_count, total_quantity, inventory_value)
+        )
+        # Incremental stats equal stats computed from scratch
+        self.assertEqual(stats.repair(dry_run=True), [])
+
+    def test_stats(self):
+        response = self.get_stats()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["store_id"], self.store.pk)
+        self.assertStats(2, 20, "250.000")
+
+        with self.assertNumQueries(1):
+            self.get_stats()
+
+        self.assertEqual(self.get_stats(store_id=999).status_code, 404)
+
+    def test_product_writes(self):
+        self.get_stats()
+
+        self.client.post("/api/product/", {
+            "name": "Lamp", "description": "desc", "price": "0.125", "quantity": 8, "store_id": self.store.pk
+        }, content_type="application/json")
+        self.assertStats(3, 28, "251.000")
+
+        self.client.put(f"/api/product/{self.products[0].pk}", {
+            "name": "Desk", "description": "desc", "price": "20", "quantity": 1
+        }, content_type="application/json")
+        self.assertStats(3, 19, "146.000")
+
+        self.client.delete(f"/api/product/{self.products[1].pk}")
+        self.assertStats(2, 9, "21.000")
+
+        # Deleting again takes nothing out of the stats
+        self.assertEqual(self.client.delete(f"/api/product/{self.products[1].pk}").status_code, 404)
+        self.assertStats(2, 9, "21.000")
+
+    def test_update_converts_fields(self):
+        self.get_stats()
+        url = f"/api/product/{self.products[0].pk}"
+
+        response = self.client.put(url, {
+            "name": "Desk", "description": "desc", "price": "20", "quantity": "7"
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertStats(2, 17, "265.000")
+
+        response = self.client.put(url, {
+            "name": "Desk", "description": "desc", "price": "20", "quantity": "seven"
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertStats(2, 17, "265.000")
+
+    def test_bulk_writes(self):
+        self.get_stats()
+
+        self.client.post("/api/product/bulk", {
+            "create": [
+                {"name": "New", "description": "desc", "price": "1.5", "quantity": 2, "store_id": self.store.pk}
+            ],
+            "update": [{"id": self.products[0].pk, "price": "10"}],
+            "delete": [self.products[1].pk]
+        }, content_type="application/json")
+
+        self.assertStats(2, 12, "103.000")
+
+    def test_checkout(self):
+        self.get_stats()
+        CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=3)
+
+        self.client.post(f"/api/user/{self.store.pk}/checkout")
+
+        self.assertStats(2, 17, "212.500")
+
+    def test_repair_command(self):
+        self.get_stats()
+        # Bypasses the API, stored stats drift
+        create_products(self.store, 1, price="1")
+
+        out = io.StringIO()
+        call_command("repair_store_stats", "--dry-run", stdout=out)
+
+        self.assertIn(f"store {self.store.pk}: product_count 2 -> 3, total_quantity 20 -> 30", out.getvalue())
+        self.assertEqual(self.get_stats().json()["data"]["product_count"], 2)
+
+        call_command("repair_store_stats", stdout=io.StringIO())
+
+        self.assertStats(3, 30, "260.000")
+
+
+class ImportCatalogTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.existing_store = create_store()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_text(content)
+        return str(path)
+
+    def test_import(self):
+        users = self.write("users.csv", (
+            "id,name,username,email\n"
+            "a,Alice,alice,alice@mail.com\n"
+            "b,Bob,bob,bob@mail.com\n"
+            "a,Again,again,again@mail.com\n"
+            "c,,carol,carol@mail.com\n"
+            "d,Dan,dan,dan@mail.com\n"
+            "e,Dan again,dan,dan2@mail.com\n"
+            "f,Bob again,bobby,bob@mail.com\n"
+        ))
+        stores = self.write("stores.jsonl", (
+            '{"user_id": "a", "name": "Alice shop", "location": "Bandung"}\n'
+            '{"user_id": "x", "name": "Nobody", "location": "Bandung"}\n'
+            '\n'
+            f'{{"user_id": {self.existing_store.pk}, "name": "Taken", "location": "Bandung"}}\n'
+        ))
+        products = self.write("products.csv", (
+            "store_id,name,description,price,quantity\n"
+            "a,Lamp,desc,12.500,4\n"
+            "a,Desk,desc,100,1\n"
+            f"{self.existing_store.pk},Chair,desc,5,10\n"
+            "b,No store,desc,1,1\n"
+            "a,Bad price,desc,abc,1\n"
+        ))
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command(
+            "import_catalog", f"--users={users}", f"--stores={stores}", f"--products={products}",
+            "--batch-size=2", stdout=out, stderr=err
+        )
+
+        self.assertIn("Imported 3 users, 1 stores and 3 products", out.getvalue())
+        self.assertIn("skipped 8 invalid rows", out.getvalue())
+        self.assertEqual(err.getvalue().splitlines(), [
+            "users line 4: id: Duplicate id a",
+            "users line 5: name: This field may not be blank.",
+            "users line 7: username: User with username dan already exists",
+            "users line 8: email: User with email bob@mail.com already exists",
+            "stores line 2: user_id: User with id x not found",
+            f"stores line 4: user_id: User with id {self.existing_store.pk} already has a store",
+            "products line 5: store_id: Store with id b not found",
+            "products line 6: price: A valid number is required.",
+        ])
+
+        alice = User.objects.get(username="alice")
+        self.assertEqual(Store.objects.get(pk=alice.pk).name, "Alice shop")
+        self.assertEqual(
+            sorted(Product.objects.values_list("name", "store_id")),
+            [("Chair", self.existing_store.pk), ("Desk", alice.pk), ("Lamp", alice.pk)]
+        )
+        # Imported products count in the store stats
+        self.assertEqual(self.client.get(f"/api/store/{alice.pk}/stats").json()["data"]["inventory_value"], "150.000")
+        self.assertEqual(stats.repair(dry_run=True), [])
+
+    def test_invalid_json_and_format(self):
+        products = self.write("products.jsonl", (
+            f'{{"store_id": {self.existing_store.pk}, "name": "Lamp", "description": "d", "price": 1, "quantity": 1}}\n'
+            '{"store_id": \n'
+            '[1, 2]\n'
+        ))
+        err = io.StringIO()
+
+        call_command("import_catalog", f"--products={products}", stdout=io.StringIO(), stderr=err)
+
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(err.getvalue().splitlines(), [
+            "products line 2: Invalid JSON",
+            "products line 3: Row must be an object",
+        ])
+
+        with self.assertRaises(CommandError):
+            call_command("import_catalog", f"--products={self.write('products.xml', '')}")
+
+        with self.assertRaises(CommandError):
+            call_command("import_catalog")
+
+
+class ExportCatalogTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = create_store()
+        self.products = create_products(self.store, 3, price="12.500")
+        CartItem.objects.create(user=self.store.user, product=self.products[0], quantity=2)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = Path(self.directory.name)
+
+    def export(self, *args):
+        call_command("export_catalog", str(self.output), *args, stdout=io.StringIO())
+
+    def read_jsonl(self, name):
+        return [json.loads(line) for line in (self.output / name).read_text().splitlines()]
+
+    def test_jsonl(self):
+        self.export("--chunk-size=2")
+
+        self.assertEqual(
+            sorted(path.name for path in self.output.iterdir()),
+            ["cart_items.jsonl", "products.jsonl", "stores.jsonl", "users.jsonl"]
+        )
+        products = self.read_jsonl("products.jsonl")
+        self.assertEqual([product["id"] for product in products], [product.pk for product in self.products])
+        self.assertEqual(products[0]["price"], "12.500")
+        self.assertEqual(products[0]["store_id"], self.store.pk)
+        self.assertEqual(self.read_jsonl("cart_items.jsonl")[0]["quantity"], 2)
+
+    def test_csv_can_be_imported(self):
+        self.export("--format=csv", "--tables", "products")
+
+        call_command("import_catalog", f"--products={self.output / 'products.csv'}", stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(Product.objects.values_list("name", "price", "store_id")),
+            sorted(2 * [(product.name, Decimal("12.500"), self.store.pk) for product in self.products])
+        )
+
+    def test_watermark(self):
+        watermark = self.output / "watermark"
+
+        self.export("--watermark-file", str(watermark), "--overlap=0")
+        self.assertEqual(len(self.read_jsonl("products.jsonl")), 3)
+
+        self.client.put(f"/api/product/{self.products[1].pk}", {
+            "name": "Desk", "description": "desc", "price": "20", "quantity": 1
+        }, content_type="application/json")
+        self.export("--watermark-file", str(watermark), "--overlap=0")
+
+        self.assertEqual([product["name"] for product in self.read_jsonl("products.jsonl")], ["Desk"])
+        self.assertEqual(self.read_jsonl("users.jsonl"), [])
+        # No update time, exported whole
+        self.assertEqual(len(self.read_jsonl("cart_items.jsonl")), 1)
+
+        with self.assertRaises(CommandError):
+            self.export("--since", "yesterday")
+
+    def test_naive_since_is_utc(self):
+        Product.objects.filter(pk=self.products[0].pk).update(updated_at=datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+        self.export("--since", "2029-12-31T23:00:00")
+        self.assertEqual([product["id"] for product in self.read_jsonl("products.jsonl")], [self.products[0].pk])
+
+        self.export("--since", "2030-01-01T00:00:01")
+        self.assertEqual(self.read_jsonl("products.jsonl"), [])
+
+    def test_watermark_overlap(self):
+        watermark = self.output / "watermark"
+        before = datetime.now(timezone.utc)
+        self.export("--watermark-file", str(watermark))
+        after = datetime.now(timezone.utc)
+
+        # Moved back by the default overlap, rows of transactions open during the export are exported again
+        stored = datetime.fromisoformat(watermark.read_text())
+        self.assertTrue(before - timedelta(seconds=300) <= stored <= after - timedelta(seconds=300))
+        self.export("--watermark-file", str(watermark))
+        self.assertEqual(len(self.read_jsonl("products.jsonl")), 3)
+
+    @unittest.skipIf(catalog.pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        self.export("--format=parquet", "--chunk-size=2")
+
+        table = catalog.pyarrow.parquet.read_table(self.output / "products.parquet")
+
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column("price").to_pylist()[0], Decimal("12.500"))
+        self.assertEqual(catalog.pyarrow.parquet.ParquetFile(self.output / "products.parquet").num_row_groups, 2)
+
+    def test_parquet_without_pyarrow(self):
+        with mock.patch("shofy_api.management.commands.export_catalog.pyarrow", None):
+            with self.assertRaises(CommandError):
+                self.export("--format=parquet")
+
+
+class CompressionTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches["compressed"].clear()
+        self.store = create_store()
+        self.products = create_products(self.store, 30)
+
+    def test_negotiate(self):
+        encodings = ("zstd", "br", "gzip")
+
+        self.assertEqual(negotiate("gzip, deflate, br", encodings), "br")
+        self.assertEqual(negotiate("gzip;q=1.0, br;q=0.5", encodings), "gzip")
+        self.assertEqual(negotiate("*", encodings), "zstd")
+        self.assertEqual(negotiate("gzip;q=0, identity", encodings), None)
+        self.assertEqual(negotiate("", encodings), None)
+        self.assertEqual(negotiate("br", ("gzip",)), None)
+
+    def test_compress_above_threshold(self):
+        plain = self.client.get("/api/product/")
+        response = self.client.get("/api/product/", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertLess(len(response.content), len(plain.content) / 3)
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        # Under the threshold
+        small = self.client.get(f"/api/product/{self.products[0].pk}", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+
+        self.assertFalse(self.client.get("/api/product/", HTTP_ACCEPT_ENCODING="gzip;q=0").has_header("Content-Encoding"))
+
+    def test_streaming(self):
+        plain = b"".join(self.client.get("/api/product/?stream=1").streaming_content)
+        response = self.client.get("/api/product/?stream=1", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+    def test_versioned_responses_are_compressed_once(self):
+        path = f"/api/store/{self.store.pk}/products"
+
+        with mock.patch.object(GzipEncoder, "compress", autospec=True, side_effect=GzipEncoder.compress) as compress:
+            first = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip")
+            second = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(second.content, first.content)
+        self.assertTrue(first["ETag"].startswith('W/"'))
+
+        # Weak ETag of the compressed response still validates
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_skips_other_content_types_and_csrf_tokens(self):
+        body = b"<html>" + b"<p>product</p>" * 200 + b"</html>"
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+
+        html = CompressionMiddleware(lambda request: HttpResponse(body, content_type="text/html"))(request)
+        self.assertFalse(html.has_header("Content-Encoding"))
+        self.assertEqual(html.content, body)
+
+        def set_csrf_cookie(request):
+            response = HttpResponse(body.replace(b"html", b"json"), content_type="application/json")
+            response.set_cookie(settings.CSRF_COOKIE_NAME, "token")
+            return response
+
+        self.assertFalse(CompressionMiddleware(set_csrf_cookie)(request).has_header("Content-Encoding"))
+
+        def render_csrf_token(request):
+            get_token(request)
+            return HttpResponse(body.replace(b"html", b"json"), content_type="application/json")
+
+        self.assertFalse(CompressionMiddleware(render_csrf_token)(request).has_header("Content-Encoding"))
+
+    async def test_async_views(self):
+        response = await self.async_client.get("/api/async/product/", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["data"]), 30)
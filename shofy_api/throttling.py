@@ -0,0 +1,258 @@
+"""
+Token bucket rate limiting per client and route
+
+Every client (authenticated user, otherwise IP address) has one bucket per route. A bucket holds
+up to "burst" tokens and refills at "per second" tokens per second, each request takes a token
+and is rejected with 429 and a Retry-After header when the bucket is empty.
+
+Rates are configured in settings.API_THROTTLE_RATES by "METHOD /route", "/route" (routes as in
+urls.py, the same labels as the metrics) or "*" for every other route. Routes without a rate are
+not limited.
+
+Buckets are stored as their theoretical arrival time (GCRA), the time at which the bucket will be
+full again: one number per bucket, updated with one addition per request, which is what makes
+the shared cache backend possible with atomic incr.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import Resolver404, get_resolver
+from rest_framework import status
+
+from shofy_api.extensions import build_json_response
+
+
+def get_client(request, num_proxies=None):
+    """
+    Identify the client of request: "user:<pk>" if authenticated, else its IP address
+    :param num_proxies: proxies appending to X-Forwarded-For, default settings.API_THROTTLE_NUM_PROXIES
+    """
+
+    user = getattr(request, "user", None)
+
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+
+    if num_proxies is None:
+        num_proxies = getattr(settings, "API_THROTTLE_NUM_PROXIES", 0)
+
+    forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+
+    if num_proxies and forwarded_for:
+        # The address added by the outermost of our proxies, the ones before it can be forged
+        addresses = [address.strip() for address in forwarded_for.split(",")]
+        return addresses[-min(num_proxies, len(addresses))]
+
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class Rate:
+    __slots__ = ("interval", "burst")
+
+    def __init__(self, per_second, burst):
+        # Seconds to refill one token
+        self.interval = 1 / per_second
+        self.burst = burst
+
+
+class MemoryBackend:
+    """
+    Buckets of this process, least recently used ones are dropped past max_entries (a dropped
+    bucket comes back full)
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = Lock()
+
+    def take(self, key, rate):
+        """
+        Take a token from the bucket
+        :return: 0 if a token was taken, otherwise seconds until the bucket has one
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            arrival = max(self.buckets.get(key, now), now) + rate.interval
+            wait = arrival - now - rate.burst * rate.interval
+
+            if wait > 0:
+                return wait
+
+            self.buckets[key] = arrival
+            self.buckets.move_to_end(key)
+
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+
+        return 0
+
+
+class CacheBackend:
+    """
+    Buckets shared by every process through a Django cache (e.g. Redis or Memcached)
+
+    A bucket is an integer (microseconds) advanced with atomic incr, so concurrent requests of
+    one client in different processes can't take the same token. Moving the bucket of an idle
+    client to now is a plain set, requests racing on that may each take a token, but only when
+    the client was below its rate. A bucket expires once it would be full again plus a minute,
+    a client that is limited for longer than that gets a full bucket once per expiry.
+    """
+
+    blocking = True
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def take(self, key, rate):
+        cache = self.cache
+        now = int(time.time() * 1_000_000)
+        interval = max(1, round(rate.interval * 1_000_000))
+        tolerance = rate.burst * interval
+        timeout = math.ceil(tolerance / 1_000_000) + 60
+
+        try:
+            arrival = cache.incr(key, interval)
+        except ValueError:
+            # No bucket yet, a full one
+            cache.set(key, now + interval, timeout)
+            return 0
+
+        if arrival < now + interval:
+            # Bucket was full, count from now
+            cache.set(key, now + interval, timeout)
+            return 0
+
+        wait = arrival - now - tolerance
+
+        if wait > 0:
+            # Rejected requests don't take a token
+            try:
+                cache.decr(key, interval)
+            except ValueError:
+                pass
+
+            return wait / 1_000_000
+
+        return 0
+
+
+def get_backend():
+    if getattr(settings, "API_THROTTLE_BACKEND", "memory") == "cache":
+        return CacheBackend(getattr(settings, "API_THROTTLE_CACHE", "default"))
+
+    return MemoryBackend()
+
+
+class ThrottleMiddleware:
+    """
+    Reject requests over the rate limit of their client and route with 429 Too Many Requests.
+    Put it after AuthenticationMiddleware, so authenticated users are limited by user.
+    """
+
+    sync_capable = True
+    async_capable = True
+    max_routes = 10_000
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.rates = {
+            name: Rate(per_second, burst)
+            for name, (per_second, burst) in getattr(settings, "API_THROTTLE_RATES", {}).items()
+        }
+        self.backend = get_backend()
+        self.num_proxies = getattr(settings, "API_THROTTLE_NUM_PROXIES", 0)
+        self.resolver = get_resolver()
+        # path: route, resolving takes ~20us
+        self.routes = {}
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        response = self.check(request)
+
+        if response is not None:
+            return response
+
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.backend.blocking:
+            response = await sync_to_async(self.check)(request)
+        else:
+            response = self.check(request)
+
+        if response is not None:
+            return response
+
+        return await self.get_response(request)
+
+    def get_route(self, path):
+        route = self.routes.get(path)
+
+        if route is None:
+            try:
+                route = f"/{self.resolver.resolve(path).route}"
+            except Resolver404:
+                route = "unmatched"
+
+            # Paths with ids are unbounded, start over instead of growing
+            if len(self.routes) >= self.max_routes:
+                self.routes.clear()
+
+            self.routes[path] = route
+
+        return route
+
+    def check(self, request):
+        """
+        Take a token for request
+        :return: 429 response if the bucket is empty, otherwise None
+        """
+
+        if not self.rates:
+            return None
+
+        route = self.get_route(request.path_info)
+        method_route = f"{request.method} {route}"
+
+        if method_route in self.rates:
+            rate, scope = self.rates[method_route], f"{request.method}:{route}"
+        else:
+            rate, scope = self.rates.get(route) or self.rates.get("*"), route
+
+        if rate is None:
+            return None
+
+        wait = self.backend.take(f"throttle:{get_client(request, self.num_proxies)}:{scope}", rate)
+
+        if wait == 0:
+            return None
+
+        response = build_json_response(
+            data=None,
+            message="Too many requests",
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        response["Retry-After"] = str(math.ceil(wait))
+
+        return response
@@ -3,21 +3,42 @@ from shofy_api.views import (
     UserView,
     StoreView,
     ProductView,
-    CartItemView
+    CartItemView,
+    AsyncView
 )
 
 urlpatterns = [
     path("user/", UserView.UserApiView.as_view()),
     path("user/<int:user_id>", UserView.UserApiView.as_view()),
     path("user/<int:user_id>/cart", UserView.UserApiView.as_view()),
+    path("user/<int:user_id>/cart/summary", UserView.UserApiView.as_view()),
+    path("user/<int:user_id>/checkout", UserView.UserApiView.as_view()),
 
     path("store/", StoreView.StoreApiView.as_view()),
     path("store/<int:store_id>", StoreView.StoreApiView.as_view()),
     path("store/<int:store_id>/products", StoreView.StoreApiView.as_view()),
+    path("store/<int:store_id>/stats", StoreView.StoreApiView.as_view()),
 
     path("product/", ProductView.ProductApiView.as_view()),
+    path("product/search", ProductView.ProductApiView.as_view()),
+    path("product/bulk", ProductView.ProductApiView.as_view()),
     path("product/<int:product_id>", ProductView.ProductApiView.as_view()),
 
     path("cart/", CartItemView.CartItemApiView.as_view()),
     path("cart/<int:cart_item_id>", CartItemView.CartItemApiView.as_view()),
+
+    # Async read endpoints, for ASGI deployments
+    path("async/user/", AsyncView.UserAsyncView.as_view()),
+    path("async/user/<int:user_id>", AsyncView.UserAsyncView.as_view()),
+    path("async/user/<int:user_id>/cart", AsyncView.UserAsyncView.as_view()),
+
+    path("async/store/", AsyncView.StoreAsyncView.as_view()),
+    path("async/store/<int:store_id>", AsyncView.StoreAsyncView.as_view()),
+    path("async/store/<int:store_id>/products", AsyncView.StoreAsyncView.as_view()),
+
+    path("async/product/", AsyncView.ProductAsyncView.as_view()),
+    path("async/product/<int:product_id>", AsyncView.ProductAsyncView.as_view()),
+
+    path("async/cart/", AsyncView.CartItemAsyncView.as_view()),
+    path("async/cart/<int:cart_item_id>", AsyncView.CartItemAsyncView.as_view()),
 ]
@@ -0,0 +1,331 @@
+"""
+Async equivalents of the read endpoints, served under "/api/async/"
+
+Under ASGI these run on the event loop instead of holding a worker thread for the whole request.
+Responses are the same as the sync endpoints, including ETag / Last-Modified and 304 answers to
+conditional requests of detail endpoints. Django's async ORM still runs each query in a
+thread (sqlite has no async driver), but only for the duration of the query.
+"""
+
+from django.http import HttpRequest, HttpResponse
+from django.views import View
+from rest_framework import status
+
+from shofy_api.cache import product_cache, store_cache, user_cache
+from shofy_api.extensions import build_json_response, is_conditional, make_etag, not_modified
+from shofy_api.filters import InvalidFilter, filter_products, product_paginator
+from shofy_api.models import *
+from shofy_api.pagination import CursorPaginator, InvalidPage
+from shofy_api.row_serializers import (
+    InvalidFields,
+    cart_item_rows,
+    product_detail_rows,
+    product_rows,
+    store_detail_rows,
+    store_rows,
+    user_detail_rows,
+    user_rows,
+)
+
+
+async def detail_response(request, cache, pk, detail_rows, load, load_version, message):
+    """
+    Build detail response of a cached entity, narrowed to the requested fields
+    :param load: coroutine function loading (data, updated_at) of the entity with given detail rows
+    :param load_version: coroutine function loading only updated_at of the entity
+    """
+
+    try:
+        rows = detail_rows.for_request(request)
+    except InvalidFields as e:
+        return build_json_response(
+            data=None,
+            message=str(e),
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if is_conditional(request):
+        # Answer polling clients from the entity version, like the sync views
+        updated_at = await cache.aget_version(pk, load_version)
+        response = not_modified(request, make_etag(cache.name, pk, updated_at, *rows.selection), updated_at,
+                                response_class=HttpResponse)
+
+        if response is not None:
+            return response
+
+    if rows is detail_rows:
+        data, updated_at = await cache.aget_or_load(pk, lambda: load(detail_rows))
+    else:
+        data, updated_at = await cache.apeek_or_load(pk, lambda: load(rows))
+        data = rows.to_representation(data)
+
+    return build_json_response(
+        data=data,
+        message=message,
+        status=status.HTTP_200_OK,
+        etag=make_etag(cache.name, pk, updated_at, *rows.selection),
+        last_modified=updated_at
+    )
+
+
+async def paginated_response(request, queryset, row_serializer, message, paginator=None):
+    """
+    Paginate queryset and build list response, message(count) builds the response message
+    :param paginator: function of request returning the CursorPaginator, default orders by primary key
+    """
+
+    try:
+        row_serializer = row_serializer.for_request(request)
+
+        if paginator is None:
+            paginator = CursorPaginator()
+        else:
+            paginator = paginator(request)
+
+        rows, next_cursor = await paginator.apaginate(row_serializer.values(queryset, paginator.field), request)
+    except (InvalidPage, InvalidFields, InvalidFilter) as e:
+        return build_json_response(
+            data=None,
+            message=str(e),
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    data = row_serializer.serialize(rows)
+
+    return build_json_response(
+        data=data,
+        message=message(len(data)),
+        status=status.HTTP_200_OK,
+        next=next_cursor
+    )
+
+
+class ProductAsyncView(View):
+    http_method_names = ["get"]
+
+    async def load_product(self, product_id, rows):
+        row = await Product.objects.values(*rows.lookups, "updated_at").aget(pk=product_id)
+
+        return rows.to_representation(row), row["updated_at"]
+
+    async def get(self, request: HttpRequest, **kwargs):
+        if "product_id" in kwargs:
+            # Accessing "/async/product/{product_id}"
+            product_id = kwargs["product_id"]
+
+            try:
+                return await detail_response(
+                    request,
+                    product_cache,
+                    product_id,
+                    product_detail_rows,
+                    lambda rows: self.load_product(product_id, rows),
+                    lambda: Product.objects.values_list("updated_at", flat=True).aget(pk=product_id),
+                    "Product found"
+                )
+            except Product.DoesNotExist:
+                return build_json_response(
+                    data=None,
+                    message="Product not found",
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        # Accessing "/async/product", filtered like "/product"
+        try:
+            products = filter_products(Product.objects.all(), request)
+        except InvalidFilter as e:
+            return build_json_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return await paginated_response(
+            request,
+            products,
+            product_rows,
+            lambda count: f"Product count: {count}" if count else "No products",
+            product_paginator
+        )
+
+
+class StoreAsyncView(View):
+    http_method_names = ["get"]
+
+    async def load_store(self, user_id, rows):
+        row = await Store.objects.values(*rows.lookups, "updated_at").aget(pk=user_id)
+
+        return rows.to_representation(row), row["updated_at"]
+
+    async def get_by_user_id(self, request, user_id):
+        try:
+            return await detail_response(
+                request,
+                store_cache,
+                user_id,
+                store_detail_rows,
+                lambda rows: self.load_store(user_id, rows),
+                lambda: Store.objects.values_list("updated_at", flat=True).aget(pk=user_id),
+                "Store found"
+            )
+        except Store.DoesNotExist:
+            if not await User.objects.filter(pk=user_id).aexists():
+                return build_json_response(
+                    data=None,
+                    message=f"User with id {user_id} not found",
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            return build_json_response(
+                data=None,
+                message="Store not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+    async def get_products(self, request, store_id):
+        if not await Store.objects.filter(pk=store_id).aexists():
+            return build_json_response(
+                data=None,
+                message="Store not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            products = filter_products(Product.objects.filter(store_id=store_id), request)
+        except InvalidFilter as e:
+            return build_json_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return await paginated_response(
+            request,
+            products,
+            product_rows,
+            lambda count: "Product found",
+            product_paginator
+        )
+
+    async def get(self, request: HttpRequest, **kwargs):
+        if "store_id" in kwargs:
+            if "/products" in request.path:
+                # Accessing "/async/store/{store_id}/products"
+                return await self.get_products(request, kwargs["store_id"])
+
+            # Accessing "/async/store/{store_id}"
+            return await self.get_by_user_id(request, kwargs["store_id"])
+
+        # Accessing "/async/store"
+        return await paginated_response(
+            request,
+            Store.objects.all(),
+            store_rows,
+            lambda count: f"Store count: {count}" if count else "No stores"
+        )
+
+
+class UserAsyncView(View):
+    http_method_names = ["get"]
+
+    async def load_user(self, user_id, rows):
+        row = await User.objects.values(*rows.lookups, "updated_at").aget(pk=user_id)
+
+        return rows.to_representation(row), row["updated_at"]
+
+    async def get_by_id(self, request, user_id):
+        try:
+            return await detail_response(
+                request,
+                user_cache,
+                user_id,
+                user_detail_rows,
+                lambda rows: self.load_user(user_id, rows),
+                lambda: User.objects.values_list("updated_at", flat=True).aget(pk=user_id),
+                "User found"
+            )
+        except User.DoesNotExist:
+            return build_json_response(
+                data=None,
+                message="User not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+    async def get_cart(self, request, user_id):
+        try:
+            user = await User.objects.aget(pk=user_id)
+        except User.DoesNotExist:
+            return build_json_response(
+                data=None,
+                message="User does not exist",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return await paginated_response(
+            request,
+            user.cart.all(),
+            cart_item_rows,
+            lambda count: f"List of {user.username} cart items"
+        )
+
+    async def get(self, request: HttpRequest, **kwargs):
+        if "user_id" in kwargs:
+            if "/cart" in request.path:
+                # Accessing "/async/user/{user_id}/cart"
+                return await self.get_cart(request, kwargs["user_id"])
+
+            # Accessing "/async/user/{user_id}"
+            return await self.get_by_id(request, kwargs["user_id"])
+
+        # Accessing "/async/user"
+        users = User.objects.all()
+
+        for field in ("username", "email"):
+            if field in request.GET:
+                users = users.filter(**{field: request.GET[field]})
+
+        return await paginated_response(
+            request,
+            users,
+            user_rows,
+            lambda count: f"User count: {count}" if count else "No users"
+        )
+
+
+class CartItemAsyncView(View):
+    http_method_names = ["get"]
+
+    async def get(self, request: HttpRequest, **kwargs):
+        cart_items = CartItem.objects.all()
+
+        if "cart_item_id" in kwargs:
+            # Accessing "/async/cart/{cart_item_id}"
+            try:
+                rows = cart_item_rows.for_request(request)
+                cart_item = await rows.values(cart_items).aget(pk=kwargs["cart_item_id"])
+
+                return build_json_response(
+                    data=rows.to_representation(cart_item),
+                    message="Cart item found",
+                    status=status.HTTP_200_OK
+                )
+            except CartItem.DoesNotExist:
+                return build_json_response(
+                    data=None,
+                    message="Cart item not found",
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            except InvalidFields as e:
+                return build_json_response(
+                    data=None,
+                    message=str(e),
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # Accessing "/async/cart"
+        return await paginated_response(
+            request,
+            cart_items,
+            cart_item_rows,
+            lambda count: f"Cart item count: {count}" if count else "No cart items"
+        )
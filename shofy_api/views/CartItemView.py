@@ -1,13 +1,14 @@
-import json
-
 from django.http import HttpRequest
 from django.forms.models import model_to_dict
 from rest_framework import permissions, status
 from rest_framework.views import APIView
 
 from shofy_api.extensions import *
+from shofy_api.idempotency import idempotent
 from shofy_api.serializers import *
 from shofy_api.models import *
+from shofy_api.pagination import CursorPaginator, InvalidPage
+from shofy_api.row_serializers import InvalidFields, cart_item_rows
 
 
 class CartItemApiView(APIView):
@@ -19,16 +20,10 @@ class CartItemApiView(APIView):
         :return: if user and product exists return user and product instance, otherwise return None and response
         """
 
-        all_exists = False
-        response = None
-        product = None
-        user = None
-
         try:
             user = User.objects.get(pk=user_id)
-            all_exists = True
         except User.DoesNotExist:
-            response = build_response(
+            return None, build_response(
                 data=None,
                 message=f"User with id {user_id} not found",
                 status=status.HTTP_404_NOT_FOUND
@@ -36,31 +31,26 @@ class CartItemApiView(APIView):
 
         try:
             product = Product.objects.get(pk=product_id)
-            all_exists = True
         except Product.DoesNotExist:
             # Product does not exist, abort
-            response = build_response(
+            return None, build_response(
                 data=None,
                 message=f"Product with id {product_id} does not exist",
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        if all_exists:
-            return user, product
+        return user, product
 
-        return None, response
-
-    def get_by_id(self, cart_item_id):
+    def get_by_id(self, rows, cart_item_id):
         """
         get cart item by id
         """
 
         try:
-            cart_item = CartItem.objects.get(pk=cart_item_id)
-            serializer = CartItemSerializer(cart_item)
+            cart_item = rows.values(CartItem.objects.all()).get(pk=cart_item_id)
 
             return build_response(
-                data=serializer.data,
+                data=rows.to_representation(cart_item),
                 message="Cart item found",
                 status=status.HTTP_200_OK
             )
@@ -72,28 +62,62 @@ class CartItemApiView(APIView):
             )
 
     def get(self, request, **kwargs):
+        try:
+            rows = cart_item_rows.for_request(request)
+        except InvalidFields as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         if "cart_item_id" in kwargs:
             # Accessing "/cart/{cart_item_id}"
-            return self.get_by_id(kwargs["cart_item_id"])
+            return self.get_by_id(rows, kwargs["cart_item_id"])
+
+        if is_streaming(request):
+            # Accessing "/cart?stream=1", whole table without pagination
+            return build_streaming_response(
+                CartItem.objects.order_by("pk"),
+                rows,
+                lambda count: f"Cart item count: {count}" if count else "No cart items"
+            )
 
         # Accessing "/cart"
-        cart_items = CartItem.objects.all()
-        serializer = CartItemSerializer(cart_items, many=True)
+        try:
+            cart_items, next_cursor = CursorPaginator().paginate(rows.values(CartItem.objects.all()), request)
+        except InvalidPage as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if len(serializer.data) == 0:
+        data = rows.serialize(cart_items)
+
+        if len(data) == 0:
             message = "No cart items"
         else:
-            message = f"Cart item count: {len(serializer.data)}"
+            message = f"Cart item count: {len(data)}"
 
         return build_response(
-            data=serializer.data,
+            data=data,
             message=message,
-            status=status.HTTP_200_OK
+            status=status.HTTP_200_OK,
+            next=next_cursor
         )
 
+    @idempotent
     def post(self, request: HttpRequest):
-        body = json.loads(request.body)
+        body = request.data
+        quantity = body.get("quantity")
+
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return build_response(
+                data=None,
+                message="Quantity must be a positive integer",
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         r1, r2 = self.check_user_and_product_exists(body['user_id'], body['product_id'])
 
@@ -103,40 +127,20 @@ class CartItemApiView(APIView):
         user = r1
         product = r2
 
-        # Check item exists or not, if exists sum quantity, otherwise create the item
-        try:
-            cart_item = CartItem.objects.get(user=user, product=product)
-            cart_item.quantity += body['quantity']
-            cart_item.save()
-
-            return build_response(
-                data=CartItemSerializer(cart_item).data,
-                message="Cart item updated",
-                status=status.HTTP_200_OK
-            )
-        except CartItem.DoesNotExist:
-            # Create new cart item
-            pass
-
-        data = {
-            "user": user,
-            "product": product,
-            "quantity": body["quantity"],
-        }
-
-        user.cart.create(**data)
-
-        serializer = CartItemSerializer(data)
+        # Sum quantity if the item exists, otherwise create it, in a single upsert
+        cart_item, created = CartItem.objects.add_quantity(user.pk, product.pk, quantity)
+        cart_item.user = user
+        cart_item.product = product
 
         return build_response(
-            data=serializer.data,
-            message="Cart item created",
-            status=status.HTTP_201_CREATED
+            data=CartItemSerializer(cart_item).data,
+            message="Cart item created" if created else "Cart item updated",
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
 
     def put(self, request: HttpRequest, **kwargs):
         if "cart_item_id" in kwargs:
-            body = json.loads(request.body)
+            body = request.data
 
             data = {
                 "quantity": body["quantity"],
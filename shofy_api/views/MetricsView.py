@@ -0,0 +1,32 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.views import View
+
+from shofy_api.metrics import registry
+
+
+class MetricsView(View):
+    """
+    Request metrics of this process in Prometheus text format, only for the scrapers allowed by
+    settings.API_METRICS_ALLOWED_IPS / API_METRICS_TOKEN
+    """
+
+    http_method_names = ["get"]
+
+    def is_allowed(self, request):
+        if request.META.get("REMOTE_ADDR") in getattr(settings, "API_METRICS_ALLOWED_IPS", []):
+            return True
+
+        token = getattr(settings, "API_METRICS_TOKEN", None)
+        scheme, _, credentials = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+
+        return bool(token) and scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+    def get(self, request: HttpRequest):
+        # Accessing "/metrics"
+        if not self.is_allowed(request):
+            return HttpResponse("Forbidden", status=403, content_type="text/plain; charset=utf-8")
+
+        return HttpResponse(registry.render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
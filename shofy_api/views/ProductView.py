@@ -1,30 +1,72 @@
-import json
-
+from django.db import transaction
 from django.http import HttpRequest
 from django.forms.models import model_to_dict
 from rest_framework import permissions, status
 from rest_framework.views import APIView
 
+from shofy_api.bulk import bulk_write_products
+from shofy_api.cache import product_cache
 from shofy_api.extensions import *
+from shofy_api.idempotency import idempotent
+from shofy_api.filters import InvalidFilter, filter_products, product_paginator
 from shofy_api.serializers import *
 from shofy_api.models import *
+from shofy_api.pagination import InvalidPage
+from shofy_api.row_serializers import InvalidFields, product_detail_rows, product_rows
+from shofy_api.search import search_products
+from shofy_api.stats import StoreStatsChanges
 
 
 class ProductApiView(APIView):
     permission_classes = [permissions.AllowAny]
+    bulk_max_items = 10000
+
+    def load_product(self, product_id, rows=product_detail_rows):
+        """
+        Load serialized product and its version for the entity cache
+        :param rows: detail row serializer, a select() of it reads only the selected columns
+        """
+
+        row = Product.objects.values(*rows.lookups, "updated_at").get(pk=product_id)
+
+        return rows.to_representation(row), row["updated_at"]
 
-    def get_by_id(self, product_id):
+    def get_by_id(self, request, product_id):
         """
         get product by id
         """
 
         try:
-            product = Product.objects.get(pk=product_id)
+            rows = product_detail_rows.for_request(request)
+
+            if is_conditional(request):
+                # Answer polling clients from the product version, without loading the row
+                updated_at = product_cache.get_version(
+                    product_id,
+                    lambda: Product.objects.values_list("updated_at", flat=True).get(pk=product_id)
+                )
+                etag = make_etag("product", product_id, updated_at, *rows.selection)
+                response = not_modified(request, etag, updated_at)
+
+                if response is not None:
+                    return response
+
+            if rows is product_detail_rows:
+                data, updated_at = product_cache.get_or_load(product_id, lambda: self.load_product(product_id))
+            else:
+                # Project the cached product, or read only the requested columns
+                data, updated_at = product_cache.peek_or_load(
+                    product_id,
+                    lambda: self.load_product(product_id, rows)
+                )
+                data = rows.to_representation(data)
 
             return build_response(
-                data=model_to_dict(product),
+                data=data,
                 message="Product found",
-                status=status.HTTP_200_OK
+                status=status.HTTP_200_OK,
+                etag=make_etag("product", product_id, updated_at, *rows.selection),
+                last_modified=updated_at
             )
         except Product.DoesNotExist:
             return build_response(
@@ -32,33 +74,158 @@ class ProductApiView(APIView):
                 message="Product not found",
                 status=status.HTTP_404_NOT_FOUND
             )
+        except InvalidFields as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def search(self, request):
+        """
+        Full-text search products by name and description, best match first
+        """
+
+        try:
+            rows = product_rows.for_request(request)
+            products, next_cursor = search_products(request.query_params.get("q", ""), request, rows.lookups)
+        except (InvalidPage, InvalidFields) as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Search returns model instances, their __dict__ has the same keys as .values() rows
+        data = rows.serialize(vars(product) for product in products)
+
+        if len(data) == 0:
+            message = "No products"
+        else:
+            message = f"Product count: {len(data)}"
+
+        return build_response(
+            data=data,
+            message=message,
+            status=status.HTTP_200_OK,
+            next=next_cursor
+        )
 
     def get(self, request, **kwargs):
 
         if "product_id" in kwargs:
             # Accessing "/product/{product_id}"
-            return self.get_by_id(kwargs["product_id"])
+            return self.get_by_id(request, kwargs["product_id"])
+
+        if request.path.endswith("/search"):
+            # Accessing "/product/search?q={query}"
+            return self.search(request)
+
+        try:
+            rows = product_rows.for_request(request)
+            # "?store=&min_price=&max_price=&in_stock=&name_prefix=&ordering=", see filters.py
+            products = filter_products(Product.objects.all(), request)
+            paginator = product_paginator(request)
+
+            if is_streaming(request):
+                # Accessing "/product?stream=1", all matching products without pagination
+                return build_streaming_response(
+                    paginator.order_queryset(products),
+                    rows,
+                    lambda count: f"Product count: {count}" if count else "No products"
+                )
+
+            # Accessing "/product"
+            products, next_cursor = paginator.paginate(rows.values(products, paginator.field), request)
+        except (InvalidPage, InvalidFields, InvalidFilter) as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # Accessing "/product"
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
+        data = rows.serialize(products)
 
-        if len(serializer.data) == 0:
+        if len(data) == 0:
             message = "No products"
         else:
-            message = f"Product count: {len(serializer.data)}"
+            message = f"Product count: {len(data)}"
 
         return build_response(
-            data=serializer.data,
+            data=data,
             message=message,
+            status=status.HTTP_200_OK,
+            next=next_cursor
+        )
+
+    def bulk(self, request: HttpRequest):
+        """
+        Create, update and delete many products in one transaction
+
+        Body: {"create": [product], "update": [{"id": id, ...fields}], "delete": [id]}
+        Nothing is written if any item is invalid, errors are reported per item.
+        """
+
+        body = request.data
+
+        if not isinstance(body, dict):
+            return build_response(
+                data=None,
+                message="Body must be an object",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        operations = {key: body.get(key) or [] for key in ("create", "update", "delete")}
+
+        if not all(isinstance(items, list) for items in operations.values()):
+            return build_response(
+                data=None,
+                message="\"create\", \"update\" and \"delete\" must be arrays",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        item_count = sum(len(items) for items in operations.values())
+
+        if item_count > self.bulk_max_items:
+            return build_response(
+                data=None,
+                message=f"Too many items, max {self.bulk_max_items} per request",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = bulk_write_products(**operations)
+
+        if result.errors:
+            return build_response(
+                data=result.errors,
+                message="Failed to write products",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        product_cache.invalidate(*result.updated, *result.deleted)
+
+        return build_response(
+            data={
+                "created": ProductSerializer(result.created, many=True).data,
+                "updated": result.updated,
+                "deleted": result.deleted
+            },
+            message=f"Products created: {len(result.created)}, "
+                    f"updated: {len(result.updated)}, "
+                    f"deleted: {len(result.deleted)}",
             status=status.HTTP_200_OK
         )
 
+    @idempotent
     def post(self, request: HttpRequest):
-        body = json.loads(request.body)
+        if request.path.endswith("/bulk"):
+            # Accessing "/product/bulk"
+            return self.bulk(request)
+
+        body = request.data
 
         try:
-            store = Store.objects.get(pk=body['store_id']).products
+            Store.objects.get(pk=body['store_id'])
         except Store.DoesNotExist:
             return build_response(
                 data=None,
@@ -77,8 +244,12 @@ class ProductApiView(APIView):
         serializer = ProductSerializer(data=data)
 
         if serializer.is_valid():
-            product = serializer.save()
-            store.add(product)
+            with transaction.atomic():
+                product = serializer.save()
+
+                changes = StoreStatsChanges()
+                changes.add(product.store_id, product.quantity, product.price)
+                changes.save()
 
             return build_response(
                 data=model_to_dict(product),
@@ -94,16 +265,33 @@ class ProductApiView(APIView):
 
     def put(self, request: HttpRequest, **kwargs):
         if "product_id" in kwargs:
-            body = json.loads(request.body)
-            data = {
-                "name": body["name"],
-                "description": body["description"],
-                "price": body["price"],
-                "quantity": body["quantity"]
-            }
+            serializer = ProductWriteSerializer(data=request.data)
+
+            if not serializer.is_valid():
+                return build_response(
+                    data=merge_serializer_errors(serializer.errors),
+                    message="Failed to update product",
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            data = {field: request.data[field] for field in serializer.validated_data}
 
             try:
-                product = Product.objects.get(pk=kwargs["product_id"])
+                # The stats change is worked out from the row as it is in this transaction, a
+                # concurrent update can't change it in between (IMMEDIATE on SQLite, row lock elsewhere)
+                with transaction.atomic():
+                    product = Product.objects.select_for_update().get(pk=kwargs["product_id"])
+
+                    changes = StoreStatsChanges()
+                    changes.remove(product.store_id, product.quantity, product.price)
+
+                    for field, value in serializer.validated_data.items():
+                        setattr(product, field, value)
+
+                    product.save(update_fields=[*serializer.validated_data, "updated_at"])
+
+                    changes.add(product.store_id, product.quantity, product.price)
+                    changes.save()
             except Product.DoesNotExist:
                 return build_response(
                     data=None,
@@ -111,8 +299,7 @@ class ProductApiView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            product.__dict__.update(**data)
-            product.save()
+            product_cache.invalidate(product.pk)
 
             return build_response(
                 data=data,
@@ -129,10 +316,19 @@ class ProductApiView(APIView):
     def delete(self, request: HttpRequest, **kwargs):
         if "product_id" in kwargs:
             try:
-                product = Product.objects.get(pk=kwargs["product_id"])
-                serializer = ProductSerializer(data=model_to_dict(product))
+                with transaction.atomic():
+                    product = Product.objects.select_for_update().get(pk=kwargs["product_id"])
+                    serializer = ProductSerializer(data=model_to_dict(product))
+
+                    _, deleted = product.delete()
+
+                    # Only the request that deleted the row takes it out of the stats
+                    if deleted.get(Product._meta.label):
+                        changes = StoreStatsChanges()
+                        changes.remove(product.store_id, product.quantity, product.price)
+                        changes.save()
 
-                product.delete()
+                product_cache.invalidate(kwargs["product_id"])
 
                 if serializer.is_valid():
                     return build_response(
@@ -1,58 +1,120 @@
-import json
-
+from django.db.models import Count, Max
 from django.http import HttpRequest
 from django.forms.models import model_to_dict
 from rest_framework import permissions, status
 from rest_framework.views import APIView
 
+from shofy_api.cache import product_cache, store_cache
 from shofy_api.extensions import *
+from shofy_api.idempotency import idempotent
+from shofy_api.filters import InvalidFilter, filter_products, product_paginator
 from shofy_api.serializers import *
 from shofy_api.models import *
+from shofy_api.pagination import CursorPaginator, InvalidPage
+from shofy_api.row_serializers import InvalidFields, product_rows, store_detail_rows, store_rows
+from shofy_api.stats import get_store_stats
 
 
 class StoreApiView(APIView):
     permission_classes = [permissions.AllowAny]
 
-    def get_by_user_id(self, user_id):
+    def load_store(self, user_id, rows=store_detail_rows):
+        """
+        Load serialized store and its version for the entity cache
+        :param rows: detail row serializer, a select() of it reads only the selected columns
+        """
+
+        # Store primary key is the user id
+        row = Store.objects.values(*rows.lookups, "updated_at").get(pk=user_id)
+
+        return rows.to_representation(row), row["updated_at"]
+
+    def get_by_user_id(self, request, user_id):
         """
         get store by user id, if user not have store, return "store not found" 404
         """
 
         try:
-            try:
-                user = User.objects.get(pk=user_id)
-            except User.DoesNotExist:
-                return build_response(
-                    data=None,
-                    message=f"User with id {user_id} not found",
-                    status=status.HTTP_404_NOT_FOUND
+            rows = store_detail_rows.for_request(request)
+
+            if is_conditional(request):
+                updated_at = store_cache.get_version(
+                    user_id,
+                    lambda: Store.objects.values_list("updated_at", flat=True).get(pk=user_id)
                 )
+                etag = make_etag("store", user_id, updated_at, *rows.selection)
+                response = not_modified(request, etag, updated_at)
+
+                if response is not None:
+                    return response
+
+            if rows is store_detail_rows:
+                data, updated_at = store_cache.get_or_load(user_id, lambda: self.load_store(user_id))
+            else:
+                data, updated_at = store_cache.peek_or_load(user_id, lambda: self.load_store(user_id, rows))
+                data = rows.to_representation(data)
 
             return build_response(
-                data=model_to_dict(user.store),
+                data=data,
                 message="Store found",
-                status=status.HTTP_200_OK
+                status=status.HTTP_200_OK,
+                etag=make_etag("store", user_id, updated_at, *rows.selection),
+                last_modified=updated_at
+            )
+        except InvalidFields as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
             )
         except Store.DoesNotExist:
+            if not User.objects.filter(pk=user_id).exists():
+                return build_response(
+                    data=None,
+                    message=f"User with id {user_id} not found",
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
             return build_response(
                 data=None,
                 message="Store not found",
                 status=status.HTTP_404_NOT_FOUND
             )
 
-    def get_products(self, store_id):
+    def get_products(self, request, store_id):
         """
         Get all products with given store id
         """
 
         try:
+            rows = product_rows.for_request(request)
             store = Store.objects.get(pk=store_id)
-            serializer = ProductSerializer(store.products.all(), many=True)
+
+            # Any create, update or delete of the store products changes count or latest updated_at
+            version = store.products.aggregate(count=Count("pk"), updated_at=Max("updated_at"))
+            etag = make_etag(
+                "store-products",
+                store_id,
+                version["count"],
+                version["updated_at"],
+                request.query_params.urlencode()
+            )
+            response = not_modified(request, etag, version["updated_at"])
+
+            if response is not None:
+                return response
+
+            products = filter_products(store.products.all(), request)
+            paginator = product_paginator(request)
+            products, next_cursor = paginator.paginate(rows.values(products, paginator.field), request)
 
             return build_response(
-                data=serializer.data,
+                data=rows.serialize(products),
                 message="Product found",
-                status=status.HTTP_200_OK
+                status=status.HTTP_200_OK,
+                etag=etag,
+                last_modified=version["updated_at"],
+                next=next_cursor
             )
         except Store.DoesNotExist:
             return build_response(
@@ -60,33 +122,81 @@ class StoreApiView(APIView):
                 message="Store not found",
                 status=status.HTTP_404_NOT_FOUND
             )
+        except (InvalidPage, InvalidFields, InvalidFilter) as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def get_stats(self, store_id):
+        """
+        Get product count, units in stock and inventory value of store
+        """
+
+        try:
+            return build_response(
+                data=get_store_stats(store_id),
+                message="Store stats found",
+                status=status.HTTP_200_OK
+            )
+        except StoreStats.DoesNotExist:
+            return build_response(
+                data=None,
+                message="Store not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
 
     def get(self, request: HttpRequest, **kwargs):
         if "store_id" in kwargs:
+            if request.path.endswith("/stats"):
+                # Accessing "/store/{store_id}/stats"
+                return self.get_stats(kwargs["store_id"])
+
             if "/products" in request.path:
                 # Accessing "/store/{store_id}/products"
-                return self.get_products(kwargs["store_id"])
+                return self.get_products(request, kwargs["store_id"])
 
             # Accessing "/store/{store_id}"
-            return self.get_by_user_id(kwargs["store_id"])
+            return self.get_by_user_id(request, kwargs["store_id"])
 
-        # Accessing "/store"
-        stores = Store.objects.all()
-        serializer = StoreSerializer(stores, many=True)
+        try:
+            rows = store_rows.for_request(request)
+
+            if is_streaming(request):
+                # Accessing "/store?stream=1", whole table without pagination
+                return build_streaming_response(
+                    Store.objects.order_by("pk"),
+                    rows,
+                    lambda count: f"Store count: {count}" if count else "No stores"
+                )
 
-        if len(serializer.data) == 0:
+            # Accessing "/store"
+            stores, next_cursor = CursorPaginator().paginate(rows.values(Store.objects.all()), request)
+        except (InvalidPage, InvalidFields) as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = rows.serialize(stores)
+
+        if len(data) == 0:
             message = "No stores"
         else:
-            message = f"Store count: {len(serializer.data)}"
+            message = f"Store count: {len(data)}"
 
         return build_response(
-            data=serializer.data,
+            data=data,
             message=message,
-            status=status.HTTP_200_OK
+            status=status.HTTP_200_OK,
+            next=next_cursor
         )
 
+    @idempotent
     def post(self, request: HttpRequest):
-        body = json.loads(request.body)
+        body = request.data
         data = {
             "name": body["name"],
             "location": body["location"],
@@ -139,7 +249,7 @@ class StoreApiView(APIView):
 
     def put(self, request: HttpRequest, **kwargs):
         if "store_id" in kwargs:
-            body = json.loads(request.body)
+            body = request.data
             data = {
                 "user": kwargs["store_id"],
                 "name": body["name"],
@@ -157,6 +267,7 @@ class StoreApiView(APIView):
 
             store.__dict__.update(**data)
             store.save()
+            store_cache.invalidate(store.pk)
 
             return build_response(
                 data=data,
@@ -176,7 +287,12 @@ class StoreApiView(APIView):
                 store = Store.objects.get(pk=kwargs["store_id"])
                 serializer = StoreSerializer(data=model_to_dict(store))
 
+                # Deleting the store cascades to its products
+                product_ids = list(store.products.values_list("pk", flat=True))
+
                 store.delete()
+                store_cache.invalidate(kwargs["store_id"])
+                product_cache.invalidate(*product_ids)
 
                 if serializer.is_valid():
                     return build_response(
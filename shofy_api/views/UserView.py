@@ -1,34 +1,60 @@
-import json
-
+from django.db import IntegrityError, transaction
 from django.http import HttpRequest
 from django.forms.models import model_to_dict
 from rest_framework import permissions, status
 from rest_framework.views import APIView
 
+from shofy_api.cache import product_cache, store_cache, user_cache
+from shofy_api.checkout import checkout
 from shofy_api.extensions import *
+from shofy_api.idempotency import idempotent
 from shofy_api.serializers import *
 from shofy_api.models import *
+from shofy_api.pagination import CursorPaginator, InvalidPage
+from shofy_api.row_serializers import InvalidFields, cart_item_rows, user_detail_rows, user_rows
 
 
 class UserApiView(APIView):
     permission_classes = [permissions.AllowAny]
 
-    def get_by_id(self, user_id):
+    def load_user(self, user_id, rows=user_detail_rows):
+        """
+        Load serialized user and its version for the entity cache
+        :param rows: detail row serializer, a select() of it reads only the selected columns
+        :return: serialized user and updated_at
+        """
+
+        row = User.objects.values(*rows.lookups, "updated_at").get(pk=user_id)
+
+        return rows.to_representation(row), row["updated_at"]
+
+    def get_by_id(self, request, user_id):
         try:
-            user = User.objects.get(pk=user_id)
-            serializer = UserSerializer(data=model_to_dict(user))
+            rows = user_detail_rows.for_request(request)
 
-            if serializer.is_valid():
-                return build_response(
-                    data=serializer.data,
-                    message="User found",
-                    status=status.HTTP_200_OK
+            if is_conditional(request):
+                updated_at = user_cache.get_version(
+                    user_id,
+                    lambda: User.objects.values_list("updated_at", flat=True).get(pk=user_id)
                 )
+                etag = make_etag("user", user_id, updated_at, *rows.selection)
+                response = not_modified(request, etag, updated_at)
+
+                if response is not None:
+                    return response
+
+            if rows is user_detail_rows:
+                data, updated_at = user_cache.get_or_load(user_id, lambda: self.load_user(user_id))
+            else:
+                data, updated_at = user_cache.peek_or_load(user_id, lambda: self.load_user(user_id, rows))
+                data = rows.to_representation(data)
 
             return build_response(
-                data=merge_serializer_errors(serializer.errors),
-                message="Invalid user",
-                status=status.HTTP_400_BAD_REQUEST
+                data=data,
+                message="User found",
+                status=status.HTTP_200_OK,
+                etag=make_etag("user", user_id, updated_at, *rows.selection),
+                last_modified=updated_at
             )
         except User.DoesNotExist:
             return build_response(
@@ -36,10 +62,38 @@ class UserApiView(APIView):
                 message="User not found",
                 status=status.HTTP_404_NOT_FOUND
             )
+        except InvalidFields as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def get_cart_summary(self, user_id):
+        """
+        Cart item count, total quantity and total price of user, overall and per store
+        """
+
+        if not User.objects.filter(pk=user_id).exists():
+            return build_response(
+                data=None,
+                message="User does not exist",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return build_response(
+            data=CartItem.objects.summary(user_id),
+            message="Cart summary",
+            status=status.HTTP_200_OK
+        )
 
     def get(self, request: HttpRequest, **kwargs):
 
         if "user_id" in kwargs:
+            if request.path.endswith("/cart/summary"):
+                # Accessing "/user/{user_id}/cart/summary"
+                return self.get_cart_summary(kwargs["user_id"])
+
             if "/cart" in request.path:
                 # Accessing "/user/{user_id}/cart"
                 try:
@@ -51,34 +105,117 @@ class UserApiView(APIView):
                         status=status.HTTP_404_NOT_FOUND
                     )
 
-                serializer = CartItemSerializer(user.cart.all(), many=True)
+                try:
+                    rows = cart_item_rows.for_request(request)
+                    cart_items, next_cursor = CursorPaginator().paginate(rows.values(user.cart.all()), request)
+                except (InvalidPage, InvalidFields) as e:
+                    return build_response(
+                        data=None,
+                        message=str(e),
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
                 return build_response(
-                    data=serializer.data,
+                    data=rows.serialize(cart_items),
                     message=f"List of {user.username} cart items",
-                    status=status.HTTP_200_OK
+                    status=status.HTTP_200_OK,
+                    next=next_cursor
                 )
 
             # Accessing "/user/{user_id}"
-            return self.get_by_id(kwargs["user_id"])
+            return self.get_by_id(request, kwargs["user_id"])
 
-        # Accessing "/user"
+        try:
+            rows = user_rows.for_request(request)
+        except InvalidFields as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if is_streaming(request):
+            # Accessing "/user?stream=1", whole table without pagination
+            return build_streaming_response(
+                User.objects.order_by("pk"),
+                rows,
+                lambda count: f"User count: {count}" if count else "No users"
+            )
+
+        # Accessing "/user", optionally filtered by exact "?username=" / "?email="
         users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
 
-        if len(serializer.data) == 0:
+        for field in ("username", "email"):
+            if field in request.GET:
+                users = users.filter(**{field: request.GET[field]})
+
+        try:
+            users, next_cursor = CursorPaginator().paginate(rows.values(users), request)
+        except InvalidPage as e:
+            return build_response(
+                data=None,
+                message=str(e),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = rows.serialize(users)
+
+        if len(data) == 0:
             message = "No users"
         else:
-            message = f"User count: {len(serializer.data)}"
+            message = f"User count: {len(data)}"
 
         return build_response(
-            data=serializer.data,
+            data=data,
             message=message,
+            status=status.HTTP_200_OK,
+            next=next_cursor
+        )
+
+    def checkout(self, user_id):
+        """
+        Buy every item in the cart of user: take the stock and empty the cart, all or nothing.
+        If a product does not have enough stock, nothing is bought and the short items are returned.
+        """
+
+        if not User.objects.filter(pk=user_id).exists():
+            return build_response(
+                data=None,
+                message="User does not exist",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        result = checkout(user_id)
+
+        if result.shortages:
+            return build_response(
+                data=result.shortages,
+                message="Insufficient stock",
+                status=status.HTTP_409_CONFLICT
+            )
+
+        if not result.items:
+            return build_response(
+                data=None,
+                message="Cart is empty",
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        product_cache.invalidate(*[item["product_id"] for item in result.items])
+
+        return build_response(
+            data=result.summary(),
+            message="Checkout complete",
             status=status.HTTP_200_OK
         )
 
-    def post(self, request: HttpRequest):
-        body = json.loads(request.body)
+    @idempotent
+    def post(self, request: HttpRequest, **kwargs):
+        if "user_id" in kwargs and request.path.endswith("/checkout"):
+            # Accessing "/user/{user_id}/checkout"
+            return self.checkout(kwargs["user_id"])
+
+        body = request.data
         data = {
             "name": body["name"],
             "username": body["username"],
@@ -88,7 +225,17 @@ class UserApiView(APIView):
         serializer = UserSerializer(data=data)
 
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except IntegrityError:
+                # Username or email taken by a concurrent request after validation
+                return build_response(
+                    data=None,
+                    message="Username or email already exists",
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             return build_response(
                 data=serializer.data,
                 message="User created",
@@ -103,7 +250,7 @@ class UserApiView(APIView):
 
     def put(self, request: HttpRequest, **kwargs):
         if "user_id" in kwargs:
-            body = json.loads(request.body)
+            body = request.data
             data = {
                 "id": kwargs["user_id"],
                 "name": body["name"],
@@ -111,13 +258,25 @@ class UserApiView(APIView):
                 "email": body["email"]
             }
 
-            user_response = self.get_by_id(kwargs["user_id"])
+            # Not through get_by_id, its conditional headers (If-None-Match) would skip the update
+            user = User.objects.filter(pk=kwargs["user_id"]).first()
 
-            if user_response.status_code == 200:
-                serializer = UserSerializer(data=data, partial=True)
+            if user is not None:
+                # With the instance, the unique username / email validators skip the user itself
+                serializer = UserSerializer(user, data=data, partial=True)
 
                 if serializer.is_valid():
-                    User.objects.filter(pk=kwargs["user_id"]).update(**data)
+                    try:
+                        with transaction.atomic():
+                            serializer.save()
+                    except IntegrityError:
+                        return build_response(
+                            data=None,
+                            message="Username or email already exists",
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+
+                    user_cache.invalidate(kwargs["user_id"])
 
                     return build_response(
                         data=serializer.data,
@@ -131,7 +290,11 @@ class UserApiView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            return user_response
+            return build_response(
+                data=None,
+                message="User not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
 
         return build_response(
             data=None,
@@ -145,7 +308,13 @@ class UserApiView(APIView):
                 user = User.objects.get(pk=kwargs["user_id"])
                 serializer = UserSerializer(data=model_to_dict(user))
 
+                # Deleting the user cascades to the store and its products
+                product_ids = list(Product.objects.filter(store_id=user.pk).values_list("pk", flat=True))
+
                 user.delete()
+                user_cache.invalidate(kwargs["user_id"])
+                store_cache.invalidate(kwargs["user_id"])
+                product_cache.invalidate(*product_ids)
 
                 if serializer.is_valid():
                     return build_response(
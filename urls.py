@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from shofy_api.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('shofy_api.urls'))
+    path('api/', include('shofy_api.urls')),
+    path('metrics', MetricsView.MetricsView.as_view())
 ]